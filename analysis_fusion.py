@@ -0,0 +1,82 @@
+from collections import Counter
+
+# Placeholders the VLM uses when it cannot read a field
+MISSING_VALUES = ('', 'n/a', 'null', 'none', 'not visible', 'unknown')
+
+# Votes per source: a pyzbar decode has passed its checksum already, a VLM
+# barcode reading only counts fully when its check digit works out
+PYZBAR_WEIGHT = 2.0
+VLM_WEIGHT = 1.0
+VLM_BAD_CHECKSUM_WEIGHT = 0.5
+
+
+def normalize_text(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def vote(candidates):
+    """Pick the best supported value from ``(value, weight)`` pairs.
+
+    Values are grouped case- and whitespace-insensitively; ties go to the
+    group seen first. Returns ``(value, confidence)`` where confidence is the
+    winner's share of the total weight, or ``(None, 0.0)`` if nothing usable
+    was offered.
+    """
+    groups = {}
+    for value, weight in candidates:
+        if value is None or normalize_text(value) in MISSING_VALUES:
+            continue
+        group = groups.setdefault(normalize_text(value), [str(value).strip(), 0.0])
+        group[1] += weight
+    if not groups:
+        return None, 0.0
+    total = sum(weight for _, weight in groups.values())
+    value, weight = max(groups.values(), key=lambda group: group[1])
+    return value, round(weight / total, 2)
+
+
+def fuse_analysis(hits, answers):
+    """Merge per-frame pyzbar hits and VLM answers for one product.
+
+    ``hits`` holds one barcode decoder result (or None) per frame; ``answers``
+    holds the VLM answers, one per frame for a fan-out or a single combined
+    one. Missing answers (None) are skipped.
+    """
+    # barcode_pipeline loads OpenCV, so it is only imported once there is something to fuse
+    from barcode_pipeline import gtin_checksum_ok
+    answers = [answer for answer in answers if answer]
+
+    barcode_votes = [(hit['barcode'], PYZBAR_WEIGHT) for hit in hits if hit]
+    for answer in answers:
+        reading = answer.get('barcode')
+        if reading is not None:
+            weight = VLM_WEIGHT if gtin_checksum_ok(str(reading)) else VLM_BAD_CHECKSUM_WEIGHT
+            barcode_votes.append((reading, weight))
+    barcode, barcode_confidence = vote(barcode_votes)
+
+    decoded = [hit for hit in hits if hit and barcode is not None and hit['barcode'] == barcode]
+    name, name_confidence = vote((answer.get('name'), VLM_WEIGHT) for answer in answers)
+    brand, brand_confidence = vote((answer.get('brand'), VLM_WEIGHT) for answer in answers)
+
+    counts = Counter()
+    for answer in answers:
+        try:
+            counts[int(answer.get('object_count', 1))] += 1
+        except (TypeError, ValueError):
+            continue
+    # Most frequent count; on a tie the larger one, since some angles hide items
+    object_count = max(counts, key=lambda count: (counts[count], count)) if counts else 1
+
+    return {
+        'name': name or '',
+        'brand': brand or '',
+        'barcode': barcode or 'N/A',
+        'barcode_source': ('pyzbar' if decoded else 'vlm') if barcode else None,
+        'barcode_stage': decoded[0]['stage'] if decoded else None,
+        'object_count': object_count,
+        'confidence': {
+            'name': name_confidence,
+            'brand': brand_confidence,
+            'barcode': barcode_confidence,
+        },
+    }
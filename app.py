@@ -1,39 +1,192 @@
 import os
-import cv2
-import numpy as np
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, Response, redirect, url_for, flash
+import click
+from flask.cli import FlaskGroup
+from flask import Flask, Request, current_app, g, render_template, request, jsonify, send_from_directory, send_file, Response, redirect, url_for, flash, stream_with_context
 from dotenv import load_dotenv
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
 
 load_dotenv()  # Load environment variables from .env file
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from pyzbar.pyzbar import decode
-import pandas as pd
+import csv
+import zlib
+import tempfile
 import json
 import base64
-from io import BytesIO
-from PIL import Image
+from io import BytesIO, StringIO
 from config import Config
 from datetime import datetime
-import dashscope
-from dashscope.api_entities.dashscope_response import Role
-from http import HTTPStatus
+from sqlalchemy import DDL, select, insert, update, delete, or_, and_, event, column, literal_column, table
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+import importlib
 import re
-from openai import OpenAI
+import sqlite3
+import time
+from functools import cache
+from itertools import islice
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from image_cache import AnalysisCache, image_digest, dhash
+from jobs import JobManager, JobCancelled, QueueFull
+from image_store import ImageStore
+from vlm_client import CLIENT_MODULES, VLMClient, VLMUnavailable
+from vlm_transport import make_transport
+from analysis_fusion import fuse_analysis
+from change_feed import DELETE, RELOAD, RESET, UPSERT, ChangeNotifier, format_event
+from metrics import Metrics, server_timing
+from profiler import SlowRequestProfiler
+from product_search import (
+    MIN_TERM_LENGTH, SEARCH_DDL, SEARCH_KEY_TABLE, SEARCH_TABLE, looks_like_barcode, match_expression, search_terms
+)
+
+class UploadRequest(Request):
+    """Keeps multipart uploads in memory up to UPLOAD_SPOOL_MAX_MEMORY.
+
+    Werkzeug spools anything over 500 KB to a temp file, which put a disk
+    write in front of every camera frame sent to the analysis routes.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_SPOOL_MAX_MEMORY'], mode='rb+')
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.request_class = UploadRequest
 
-# Configure the DashScope client
-dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
-dashscope.base_http_api_url = "https://dashscope-intl.aliyuncs.com/api/v1"
-if not dashscope.api_key:
+# Heavy libraries are imported by the code paths that use them, so a worker
+# that only lists products never loads OpenCV or the VLM SDKs.
+# preload_dependencies() imports them up front for the pre-forking launcher
+# (gunicorn.conf.py), and bench/import_budget.py checks `import app` stays clear of them.
+LAZY_IMPORTS = ('cv2', 'numpy', 'PIL.Image', 'pyzbar.pyzbar', 'pandas', 'openpyxl', 'xlsxwriter') + CLIENT_MODULES
+
+dashscope_api_key = os.getenv("DASHSCOPE_API_KEY")
+if not dashscope_api_key:
     print("Warning: DASHSCOPE_API_KEY is not set. Please update your .env file.")
 
+analysis_cache = None
+if app.config.get('ANALYSIS_CACHE_ENABLED'):
+    analysis_cache = AnalysisCache(
+        app.config['ANALYSIS_CACHE_PATH'],
+        max_entries=app.config['ANALYSIS_CACHE_MAX_ENTRIES'],
+        max_db_entries=app.config['ANALYSIS_CACHE_MAX_DB_ENTRIES'],
+        ttl=app.config['ANALYSIS_CACHE_TTL'],
+        hamming_threshold=app.config['ANALYSIS_CACHE_HAMMING_THRESHOLD']
+    )
+
+job_manager = JobManager(
+    max_workers=app.config['ANALYSIS_MAX_WORKERS'],
+    max_pending=app.config['ANALYSIS_MAX_PENDING_JOBS'],
+    retention=app.config['ANALYSIS_JOB_RETENTION']
+)
+
+image_store = ImageStore(
+    app.config['IMAGE_STORE_FOLDER'],
+    image_format=app.config['IMAGE_STORE_FORMAT'],
+    quality=app.config['IMAGE_STORE_QUALITY'],
+    thumbnail_sizes=app.config['IMAGE_THUMBNAIL_SIZES']
+)
+
+@cache
+def barcode_decoder():
+    # Built on first use, since barcode_pipeline loads OpenCV and pyzbar
+    from barcode_pipeline import BarcodeDecoder
+    return BarcodeDecoder(
+        stages=app.config['BARCODE_STAGES'],
+        budgets_ms=app.config['BARCODE_STAGE_BUDGETS_MS'],
+        max_edge=app.config['BARCODE_MAX_EDGE']
+    )
+
+vlm_transport = make_transport(
+    app.config['VLM_TRANSPORT'],
+    app.config['VLM_RECORDING_PATH'],
+    simulate_latency=app.config['VLM_REPLAY_LATENCY'],
+    latency_scale=app.config['VLM_REPLAY_LATENCY_SCALE'],
+    on_miss=app.config['VLM_REPLAY_ON_MISS']
+)
+
+# One pooled client for every VLM call, so connections and TLS sessions are reused
+vlm_client = VLMClient(
+    api_key=dashscope_api_key,
+    base_url=app.config['VLM_BASE_URL'],
+    dashscope_url=app.config['DASHSCOPE_BASE_URL'],
+    model=app.config['VLM_MODEL'],
+    connect_timeout=app.config['VLM_CONNECT_TIMEOUT'],
+    read_timeout=app.config['VLM_READ_TIMEOUT'],
+    max_concurrency=app.config['VLM_MAX_CONCURRENCY'],
+    queue_timeout=app.config['VLM_QUEUE_TIMEOUT'],
+    max_retries=app.config['VLM_MAX_RETRIES'],
+    backoff_base=app.config['VLM_BACKOFF_BASE'],
+    backoff_max=app.config['VLM_BACKOFF_MAX'],
+    breaker_threshold=app.config['VLM_BREAKER_THRESHOLD'],
+    breaker_reset=app.config['VLM_BREAKER_RESET'],
+    transport=vlm_transport,
+    async_max_concurrency=app.config['VLM_ASYNC_MAX_CONCURRENCY']
+)
+
+@cache
+def vlm_preprocessor():
+    from vlm_image import VLMImagePreprocessor
+    return VLMImagePreprocessor(
+        max_edge=app.config['VLM_IMAGE_MAX_EDGE'],
+        image_format=app.config['VLM_IMAGE_FORMAT'],
+        quality=app.config['VLM_IMAGE_QUALITY'],
+        crop=app.config['VLM_IMAGE_CROP']
+    )
+
+def preload_dependencies():
+    """Import everything in LAZY_IMPORTS and build the image pipelines now.
+
+    Run once in the gunicorn master (gunicorn.conf.py), so forked workers
+    share these pages instead of each paying for them on its first scan.
+    """
+    for name in LAZY_IMPORTS:
+        importlib.import_module(name)
+    barcode_decoder()
+    vlm_preprocessor()
+
+metrics = Metrics(namespace='catalog')
+metrics.describe('stage_duration_seconds', 'Time spent in each processing stage.')
+metrics.describe('http_requests_total', 'Requests handled, by endpoint and status.')
+metrics.describe('http_request_duration_seconds', 'Time to produce a response, excluding streamed bodies.')
+metrics.describe('analysis_cache_requests_total', 'Analysis cache lookups by result.')
+metrics.describe('vlm_image_bytes_total', 'Image bytes received vs. sent to the VLM after preprocessing.')
+metrics.describe('vlm_fallbacks_total', 'Analyses answered barcode-only because the VLM was unavailable.')
+metrics.describe('barcode_decodes_total', 'Barcode decoding attempts by the ladder stage that succeeded.')
+
+slow_request_profiler = None
+if app.config['PROFILE_SLOW_REQUESTS_MS']:
+    slow_request_profiler = SlowRequestProfiler(
+        app.config['PROFILE_DIR'],
+        threshold_ms=app.config['PROFILE_SLOW_REQUESTS_MS'],
+        interval=app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000.0
+    )
+
+# Runs pyzbar alongside the VLM request in /analyze
+stage_executor = ThreadPoolExecutor(
+    max_workers=app.config['ANALYZE_STAGE_WORKERS'],
+    thread_name_prefix='analyze-stage'
+)
+
+# Validates and stores bulk-ingest images; decoding and WebP encoding release the GIL
+ingest_executor = ThreadPoolExecutor(
+    max_workers=app.config['BULK_INGEST_WORKERS'],
+    thread_name_prefix='bulk-ingest'
+)
+
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+
+def running_flask_cli():
+    """Whether the app is being loaded by the ``flask`` command, e.g. for ``flask db upgrade``."""
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and isinstance(ctx.find_root().command, FlaskGroup)
+
+# Flask-Migrate pulls in Alembic, which only the `flask db` commands need
+if running_flask_cli():
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -57,12 +210,15 @@ class Product(db.Model):
     id = db.Column(db.String(50), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     brand = db.Column(db.String(100), nullable=True)
-    barcode = db.Column(db.String(50), nullable=False)
+    barcode = db.Column(db.String(50), nullable=False, index=True)
     price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     images_json = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
+    # Listings, exports and since/until filters walk products in (timestamp, id) order
+    __table_args__ = (db.Index('ix_product_timestamp_id', 'timestamp', 'id'),)
+
     @property
     def images(self):
         return json.loads(self.images_json)
@@ -80,16 +236,303 @@ class Product(db.Model):
             'price': self.price,
             'quantity': self.quantity,
             'images': self.images,
+            'thumbnail': thumbnail_for(self.images),
             'timestamp': self.timestamp.isoformat()
         }
 
+# The FTS5 search index comes with the product table on SQLite (see product_search.py)
+for statement in SEARCH_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+def thumbnail_for(image_paths):
+    """List-view thumbnail for a product's first image (legacy uploads have none)."""
+    if not image_paths:
+        return None
+    if image_store.is_reference(image_paths[0]):
+        return image_store.thumbnail_reference(image_paths[0])
+    return image_paths[0]
+
+class ImageBlob(db.Model):
+    # How many product image lists hold each stored blob; see hold_images
+    reference = db.Column(db.String(100), primary_key=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+
+class CatalogState(db.Model):
+    # Single row whose version is bumped by every product write
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductChange(db.Model):
+    # What the write that produced each catalogue version touched, for /events
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    kind = db.Column(db.String(10), nullable=False)
+    product_ids_json = db.Column(db.Text, nullable=True)
+
+def bump_catalog_version(kind, product_ids=()):
+    """Increment the catalogue version and log the change inside the caller's transaction.
+
+    ``kind`` is 'upsert', 'delete' or 'reset' (see change_feed.py). Returns
+    the new version; the row lock taken by the increment keeps versions in
+    commit order.
+    """
+    result = db.session.execute(
+        update(CatalogState).where(CatalogState.id == 1).values(version=CatalogState.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(CatalogState(id=1, version=1))
+    version = get_catalog_version()
+
+    product_ids = list(product_ids)
+    if len(product_ids) > app.config['CHANGE_FEED_MAX_IDS']:
+        kind, product_ids = RELOAD, []
+    db.session.add(ProductChange(version=version, kind=kind,
+                                 product_ids_json=json.dumps(product_ids) if product_ids else None))
+    db.session.execute(
+        delete(ProductChange).where(ProductChange.version <= version - app.config['CHANGE_FEED_RETENTION'])
+    )
+    # Picked up by announce_catalog_change once the transaction commits
+    db.session.info['catalog_changed'] = True
+    return version
+
+def get_catalog_version():
+    return db.session.execute(select(CatalogState.version).where(CatalogState.id == 1)).scalar() or 0
+
+class BatchSequence(db.Model):
+    # Single row holding the product ID prefix and the next index to hand out
+    id = db.Column(db.Integer, primary_key=True)
+    prefix = db.Column(db.String(20), nullable=False, default='A')
+    next_index = db.Column(db.Integer, nullable=False, default=1)
+
+# Only read to seed batch_sequence on installs that predate it
 BATCH_CONFIG_FILE = 'batch_config.json'
 
-def read_image_from_data_url(data_url):
-    header, encoded = data_url.split(',', 1)
-    image_data = base64.b64decode(encoded)
-    image = Image.open(BytesIO(image_data))
-    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+class AnalysisError(Exception):
+    pass
+
+def decode_data_url(data_url):
+    with metrics.stage('b64decode'):
+        header, encoded = data_url.split(',', 1)
+        return base64.b64decode(encoded)
+
+def sniff_mimetype(image_data):
+    if image_data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if image_data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP':
+        return 'image/webp'
+    if image_data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+def to_data_url(image_data):
+    return f"data:{sniff_mimetype(image_data)};base64,{base64.b64encode(image_data).decode('ascii')}"
+
+def image_from_bytes(image_data):
+    import cv2
+    import numpy as np
+    with metrics.stage('image_decode'):
+        # np.frombuffer wraps the bytes without copying them
+        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            # Formats OpenCV can't read (e.g. GIF)
+            from PIL import Image
+            image = Image.open(BytesIO(image_data)).convert('RGB')
+            image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        return image
+
+def request_fields():
+    """Non-file fields of a JSON or multipart request."""
+    if request.mimetype == 'multipart/form-data':
+        return request.form
+    return request.get_json(silent=True) or {}
+
+def request_image():
+    """Bytes of the single image in the request, or None.
+
+    Accepts a multipart ``image`` file (spooled to disk by Werkzeug when
+    large), a raw ``image/*`` body, or the legacy JSON ``image_data`` data URL.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return upload.read() if upload else None
+    if request.mimetype.startswith('image/'):
+        return request.get_data(cache=False) or None
+    data = request.get_json(silent=True) or {}
+    if 'image_data' not in data:
+        return None
+    try:
+        return decode_data_url(data['image_data'])
+    except Exception as e:
+        app.logger.error(f"Could not decode image data: {e}")
+        return None
+
+def request_images():
+    """Bytes of every ``images`` entry in a multipart or legacy JSON request."""
+    if request.mimetype == 'multipart/form-data':
+        return [upload.read() for upload in request.files.getlist('images')]
+    images = []
+    for i, image_data_url in enumerate((request.get_json(silent=True) or {}).get('images', [])):
+        try:
+            images.append(decode_data_url(image_data_url))
+        except Exception as e:
+            app.logger.error(f"Could not decode image {i}: {e}")
+    return images
+
+def request_kept_images():
+    """Existing image references listed in ``keep_images``, or None if the field is absent."""
+    if request.mimetype == 'multipart/form-data':
+        return request.form.getlist('keep_images') if 'keep_images' in request.form else None
+    return (request.get_json(silent=True) or {}).get('keep_images')
+
+def cached_analysis(namespace, image_data, image, analyze):
+    """Run ``analyze()`` through the analysis cache, tagging the result with hit/miss."""
+    if analysis_cache is None:
+        return dict(analyze(), cache='disabled')
+    key, cached = cache_lookup(namespace, image_data, image)
+    if cached is not None:
+        return cached
+    result = analyze()
+    cache_store(namespace, key, result)
+    return dict(result, cache='miss')
+
+# A similar-image hit may be a different item in the same packaging, so
+# the barcode read off that exact frame is not reused from it
+FRAME_SPECIFIC_FIELDS = ('barcode',)
+
+def cache_lookup(namespace, image_data, image):
+    """Returns ``(key, tagged_result)``; the result is None on a miss.
+
+    Similar hits come back without FRAME_SPECIFIC_FIELDS; callers read the
+    barcode with pyzbar instead.
+    """
+    with metrics.stage('cache_lookup'):
+        key = (image_digest(image_data), dhash(image))
+        cached = analysis_cache.lookup(namespace, *key)
+    if cached is None:
+        metrics.inc('analysis_cache_requests_total', namespace=namespace, result='miss', match='none')
+        return key, None
+    result, match = cached
+    app.logger.info(f"Analysis cache {match} hit for {namespace}")
+    metrics.inc('analysis_cache_requests_total', namespace=namespace, result='hit', match=match)
+    if match == 'similar':
+        result = {name: value for name, value in result.items() if name not in FRAME_SPECIFIC_FIELDS}
+    return key, dict(result, cache='hit', cache_match=match)
+
+def cache_store(namespace, key, result):
+    with metrics.stage('cache_store'):
+        analysis_cache.store(namespace, *key, result)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.metrics_token = metrics.begin_request()
+    if slow_request_profiler is not None:
+        slow_request_profiler.begin()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    duration = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    response.headers['Server-Timing'] = server_timing(metrics.request_stages(), duration)
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe('http_request_duration_seconds', duration, endpoint=endpoint)
+    if slow_request_profiler is not None:
+        profile = slow_request_profiler.end(endpoint, duration * 1000)
+        if profile:
+            app.logger.warning(f"Slow request {request.method} {request.path} took {duration * 1000:.0f} ms, profile: {profile}")
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    if 'metrics_token' in g:
+        metrics.end_request(g.pop('metrics_token'))
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection as the pool opens it."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_stage('db_query', time.perf_counter() - conn.info['query_started'].pop())
+
+@event.listens_for(Session, 'before_commit')
+def start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+@event.listens_for(Session, 'after_commit')
+def record_commit_time(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        metrics.record_stage('db_commit', time.perf_counter() - started)
+
+def read_catalog_version():
+    """The committed catalogue version, read outside any request's session."""
+    try:
+        with app.app_context(), db.engine.connect() as conn:
+            return conn.execute(select(CatalogState.version).where(CatalogState.id == 1)).scalar() or 0
+    except Exception as e:
+        app.logger.error(f"Could not read catalogue version: {e}")
+        raise
+
+change_notifier = ChangeNotifier(read_catalog_version, poll_interval=app.config['CHANGE_FEED_POLL_INTERVAL'])
+
+@event.listens_for(Session, 'after_commit')
+def announce_catalog_change(session):
+    if session.info.pop('catalog_changed', False):
+        change_notifier.notify()
+
+@event.listens_for(Session, 'after_rollback')
+def forget_catalog_change(session):
+    session.info.pop('catalog_changed', None)
+
+def collect_component_metrics():
+    breaker_states = {'closed': 0, 'half_open': 1, 'open': 2}
+    families = [
+        ('vlm_calls_total', 'counter', [({}, vlm_client.stats['calls'])]),
+        ('vlm_retries_total', 'counter', [({}, vlm_client.stats['retries'])]),
+        ('vlm_failures_total', 'counter', [({}, vlm_client.stats['failures'])]),
+        ('vlm_rejected_total', 'counter', [({}, vlm_client.stats['rejected'])]),
+        ('vlm_circuit_state', 'gauge', [({}, breaker_states[vlm_client.breaker.state])]),
+        ('analysis_jobs', 'gauge', [({'state': state}, count) for state, count in job_manager.counts().items()]),
+    ]
+    replay_stats = getattr(vlm_transport, 'stats', None)
+    if replay_stats is not None:
+        families.append(('vlm_replay_requests_total', 'counter',
+                         [({'result': result}, count) for result, count in replay_stats.items()]))
+    return families
+
+metrics.register_collector(collect_component_metrics)
+metrics.describe('vlm_calls_total', 'VLM attempts sent upstream, including retries.')
+metrics.describe('vlm_retries_total', 'VLM attempts retried after a transient failure.')
+metrics.describe('vlm_failures_total', 'VLM calls that failed after all retries.')
+metrics.describe('vlm_rejected_total', 'VLM calls refused by the circuit breaker or concurrency limit.')
+metrics.describe('vlm_circuit_state', 'VLM circuit breaker: 0 closed, 1 half-open, 2 open.')
+metrics.describe('vlm_replay_requests_total', 'VLM requests answered from (hits) or missing in (misses) the replay recording.')
+metrics.describe('analysis_jobs', 'Retained background analysis jobs by state.')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': 'Upload too large'}), 413
 
 @app.route('/')
 @login_required
@@ -119,100 +562,140 @@ def logout():
 
 
 
+def product_name_content(payload):
+    # Sent inline as a data URL: nothing touches the disk and DashScope
+    # skips the OSS upload it does for file:// URLs
+    return [
+        {'image': to_data_url(payload)},
+        {'text': 'Extract the full product name from the image, including the brand and any specific variations. For example, if the product is "St. Ives Soothing Body Lotion Oatmeal & Shea Butter," return that exact text. Do not add any extra words or labels.'}
+    ]
+
 @app.route('/extract_product_name', methods=['POST'])
 @login_required
 def extract_product_name():
-    data = request.get_json()
-    if 'image_data' not in data:
+    image_data = request_image()
+    if not image_data:
         return jsonify({'error': 'No image data'}), 400
 
     try:
-        header, encoded = data['image_data'].split(',', 1)
-        image_data = base64.b64decode(encoded)
-        
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-
-        temp_image_path = os.path.join(upload_folder, 'temp_product_name_image.png')
-        with open(temp_image_path, 'wb') as f:
-            f.write(image_data)
-
-        abs_temp_image_path = os.path.abspath(temp_image_path)
-        local_file_url = f'file://{abs_temp_image_path}'
-
-        messages = [
-            {
-                'role': Role.USER,
-                'content': [
-                    {'image': image_data_url},
-                    {'text': 'Extract the full product name from the image, including the brand and any specific variations. For example, if the product is "St. Ives Soothing Body Lotion Oatmeal & Shea Butter," return that exact text. Do not add any extra words or labels.'}
-                ]
-            }
-        ]
-        response = dashscope.MultiModalConversation.call(
-            model='qwen-vl-max',
-            messages=messages
-        )
-
-        if response.status_code == HTTPStatus.OK:
-            product_name = response.output.choices[0].message.content[0]['text']
-            return jsonify({'product_name': product_name})
-        else:
-            app.logger.error(f"Error from DashScope API: {response.code} - {response.message}")
-            return jsonify({'error': 'Failed to extract product name'}), 500
-
+        payload = prepare_vlm_image(image_data, image_from_bytes(image_data))
+        with metrics.stage('vlm'):
+            product_name = vlm_client.multimodal(product_name_content(payload))
+        return jsonify({'product_name': product_name})
+
+    except VLMUnavailable as e:
+        app.logger.error(f"VLM unavailable for product name extraction: {e}")
+        return jsonify({'error': 'AI analysis is temporarily unavailable'}), 503
     except Exception as e:
         app.logger.error(f"Error during product name extraction: {e}")
         return jsonify({'error': 'Failed to extract product name'}), 500
-    
+
 
 @app.route('/detect_barcode', methods=['POST'])
 @login_required
 def detect_barcode_route():
-    data = request.get_json()
-    if 'image_data' not in data:
+    image_data = request_image()
+    if not image_data:
         return jsonify({'error': 'No image data'}), 400
     try:
-        image = read_image_from_data_url(data['image_data'])
-        barcodes = decode(image)
-        if barcodes:
-            return jsonify({'barcode': barcodes[0].data.decode('utf-8')})
-        return jsonify({'barcode': 'N/A'})
+        image = image_from_bytes(image_data)
+        hit = detect_barcode(image)
+        if hit:
+            return jsonify({'barcode': hit['barcode'], 'barcode_stage': hit['stage']})
+        return jsonify({'barcode': 'N/A', 'barcode_stage': None})
     except Exception as e:
         app.logger.error(f"Error during barcode detection: {e}")
         return jsonify({'error': 'Failed to process image for barcode detection'}), 500
 
 def save_images(product_id, images_data):
     image_paths = []
-    if images_data:
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-
-        for i, image_data_url in enumerate(images_data):
-            try:
-                header, encoded = image_data_url.split(',', 1)
-                image_data = base64.b64decode(encoded)
-                image = Image.open(BytesIO(image_data))
-                filename = f"{product_id}_{i}.png"
-                filepath = os.path.join(upload_folder, filename)
-                image.save(filepath)
-                relative_path = os.path.join('uploads', filename).replace('\\', '/')
-                image_paths.append(relative_path)
-            except Exception as e:
-                app.logger.error(f"Could not process image {i} for product {product_id}: {e}")
+    for i, image_data in enumerate(images_data or []):
+        try:
+            with metrics.stage('image_save'):
+                image_paths.append(image_store.put(image_data))
+        except Exception as e:
+            app.logger.error(f"Could not process image {i} for product {product_id}: {e}")
     return image_paths
 
+def change_refcount(reference, delta):
+    """Add ``delta`` to a blob's count, creating its row if needed; locks the row either way."""
+    changed = db.session.execute(
+        update(ImageBlob)
+        .where(ImageBlob.reference == reference)
+        .values(refcount=ImageBlob.refcount + delta)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if changed:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(ImageBlob).values(reference=reference, refcount=max(delta, 0)))
+    except IntegrityError:
+        # Another writer created the row first
+        change_refcount(reference, delta)
+
+def hold_images(added=(), removed=()):
+    """Count stored blobs in and out of product image lists, in the product write's transaction.
+
+    ``added`` and ``removed`` are image paths gained and lost by the lists
+    being written. Returns the added blobs that release_images deleted after
+    image_store.put returned them; the caller must not commit those.
+    """
+    deltas = Counter(path for path in added if image_store.is_reference(path))
+    deltas.subtract(path for path in removed if image_store.is_reference(path))
+    # A fixed order keeps concurrent writers from locking rows in opposite orders
+    for reference in sorted(deltas):
+        if deltas[reference]:
+            change_refcount(reference, deltas[reference])
+    # Checked with the rows locked, so a concurrent release either saw the new count or already removed the file
+    return {reference for reference, delta in deltas.items() if delta > 0 and not image_store.exists(reference)}
+
+def release_images(image_paths):
+    """Delete stored blobs no product holds any more, and legacy upload files. Call after commit."""
+    references = sorted({path for path in image_paths if image_store.is_reference(path)})
+    for path in image_paths:
+        if not image_store.is_reference(path):
+            full_path = os.path.join(app.root_path, path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+    if not references:
+        return
+    try:
+        for reference in references:
+            # Blobs stored for a write that never committed have no row yet
+            change_refcount(reference, 0)
+        unused = db.session.execute(
+            select(ImageBlob.reference).where(ImageBlob.reference.in_(references), ImageBlob.refcount <= 0)
+        ).scalars().all()
+        if unused:
+            db.session.execute(delete(ImageBlob).where(ImageBlob.reference.in_(unused)))
+            # Removed before the commit, while hold_images in other writers waits on these rows
+            for reference in unused:
+                image_store.delete(reference)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Could not release images: {e}")
+
 @app.route('/add_product', methods=['POST'])
 @login_required
 def add_product():
-    data = request.get_json()
+    data = request_fields()
+    image_paths = []
     try:
-        batch_config = get_batch_config()
-        product_id = f"{batch_config['prefix']}{batch_config['index']}"
-
-        image_paths = save_images(product_id, data.get('images', []))
+        # Store images before allocating the ID so the write transaction stays short
+        image_paths = save_images('(new)', request_images())
+
+        product_id = data.get('product_id')
+        if product_id:
+            # Normally from a block handed out by /reserve_ids; any other ID
+            # moves the sequence past it so it is never handed out again
+            if db.session.get(Product, product_id):
+                release_images(image_paths)
+                return jsonify({'success': False, 'error': 'Product ID already in use'}), 409
+            advance_batch_sequence([product_id])
+        else:
+            product_id = allocate_product_ids()[0]
 
         new_product = Product(
             id=product_id,
@@ -225,53 +708,269 @@ def add_product():
             timestamp=datetime.now()
         )
         db.session.add(new_product)
+        if hold_images(image_paths):
+            db.session.rollback()
+            release_images(image_paths)
+            return jsonify({'success': False, 'error': 'An image was deleted while saving; upload it again'}), 409
 
-        batch_config['index'] += 1
-        save_batch_config(batch_config)
-
+        bump_catalog_version(UPSERT, [product_id])
         db.session.commit()
         return jsonify({'success': True, 'product_id': product_id})
+    except IntegrityError:
+        # Another request took the same explicit ID first
+        db.session.rollback()
+        release_images(image_paths)
+        return jsonify({'success': False, 'error': 'Product ID already in use'}), 409
     except Exception as e:
         db.session.rollback()
+        release_images(image_paths)
         app.logger.error(f"Error adding product: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/update_product/<product_id>', methods=['POST'])
 @login_required
 def update_product(product_id):
-    data = request.get_json()
+    """Update a product's fields and images.
+
+    Images the product already has are kept by listing their references in
+    ``keep_images``; only new photos are uploaded as ``images``. Requests
+    without ``keep_images`` replace the whole set, as older clients expect.
+    """
+    data = request_fields()
+    old_paths, new_paths = [], []
     try:
         product = Product.query.get(product_id)
         if not product:
             return jsonify({'success': False, 'error': 'Product not found'}), 404
 
+        old_paths = product.images
+        kept_paths = request_kept_images() or []
+        unknown = [path for path in kept_paths if path not in old_paths]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown image reference: {unknown[0]}"}), 400
+
+        # Blobs are content-addressed, so re-uploading a stored photo is a lookup, not a re-encode
+        new_paths = save_images(product_id, request_images())
+        image_paths = list(dict.fromkeys(kept_paths + new_paths))
+
         product.name = data['name']
         product.brand = data.get('brand', product.brand)
         product.barcode = data['barcode']
         product.price = float(data['price'])
         product.quantity = int(data['quantity'])
-
-        # Delete old images
-        for old_path in product.images:
-            full_old_path = os.path.join(app.root_path, old_path)
-            if os.path.exists(full_old_path):
-                os.remove(full_old_path)
-
-        image_paths = save_images(product_id, data.get('images', []))
-        product.images = image_paths
-
+        if image_paths != old_paths:
+            product.images = image_paths
+            if hold_images(image_paths, old_paths):
+                db.session.rollback()
+                release_images([path for path in new_paths if path not in old_paths])
+                return jsonify({'success': False, 'error': 'An image was deleted while saving; upload it again'}), 409
+
+        bump_catalog_version(UPSERT, [product_id])
         db.session.commit()
-        return jsonify({'success': True})
+        # Blobs may be shared with other products, so only drop unreferenced ones
+        release_images([path for path in old_paths if path not in image_paths])
+        return jsonify({'success': True, 'images': image_paths})
     except Exception as e:
         db.session.rollback()
+        release_images([path for path in new_paths if path not in old_paths])
         app.logger.error(f"Error updating product: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+PRODUCT_FIELDS = ('id', 'name', 'brand', 'barcode', 'price', 'quantity', 'images', 'timestamp')
+PRODUCT_COLUMNS = {
+    'id': Product.id,
+    'name': Product.name,
+    'brand': Product.brand,
+    'barcode': Product.barcode,
+    'price': Product.price,
+    'quantity': Product.quantity,
+    'images': Product.images_json,
+    'timestamp': Product.timestamp,
+}
+DEFAULT_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 20
+EXPORT_CHUNK_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(timestamp, product_id):
+    raw = json.dumps([timestamp.isoformat(), product_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, product_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), product_id
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_timestamp_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} timestamp')
+
+def parse_fields_arg(args):
+    fields = args.get('fields')
+    if not fields:
+        return PRODUCT_FIELDS
+    fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in PRODUCT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def parse_offset_arg(args):
+    try:
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('Invalid offset')
+    if offset < 0:
+        raise ValueError('Invalid offset')
+    return offset
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def parse_limit_arg(args, default):
+    try:
+        limit = min(int(args.get('limit', default)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return limit
+
+def product_filters(args):
+    """SQL conditions for the brand/barcode/name/since/until listing filters."""
+    conditions = []
+    if args.get('brand'):
+        conditions.append(Product.brand == args['brand'])
+    if args.get('barcode'):
+        conditions.append(Product.barcode == args['barcode'])
+    if args.get('name'):
+        conditions.append(Product.name.like(escape_like(args['name']) + '%', escape='\\'))
+    since = parse_timestamp_arg(args, 'since')
+    if since:
+        conditions.append(Product.timestamp >= since)
+    until = parse_timestamp_arg(args, 'until')
+    if until:
+        conditions.append(Product.timestamp < until)
+    return conditions
+
+def serialize_product_row(row, fields):
+    item = {}
+    for field in fields:
+        value = getattr(row, field)
+        if field == 'images':
+            value = json.loads(value)
+            item['thumbnail'] = thumbnail_for(value)
+        elif field == 'timestamp':
+            value = value.isoformat()
+        item[field] = value
+    return item
+
+def product_listing_query(args):
+    """Filtered, cursor-positioned listing query ordered by (timestamp, id).
+
+    Returns ``(query, fields)``.
+    """
+    fields = parse_fields_arg(args)
+    descending = args.get('order', 'asc') == 'desc'
+    columns = [PRODUCT_COLUMNS[field].label(field) for field in fields]
+    # The cursor always needs the sort key, even if the caller didn't ask for it
+    for field in ('timestamp', 'id'):
+        if field not in fields:
+            columns.append(PRODUCT_COLUMNS[field].label(field))
+
+    query = select(*columns).where(*product_filters(args))
+    cursor = args.get('cursor')
+    if cursor:
+        timestamp, product_id = decode_cursor(cursor)
+        if descending:
+            query = query.where(or_(Product.timestamp < timestamp,
+                                    and_(Product.timestamp == timestamp, Product.id < product_id)))
+        else:
+            query = query.where(or_(Product.timestamp > timestamp,
+                                    and_(Product.timestamp == timestamp, Product.id > product_id)))
+    if descending:
+        query = query.order_by(Product.timestamp.desc(), Product.id.desc())
+    else:
+        query = query.order_by(Product.timestamp, Product.id)
+    return query, fields
+
+def list_products(args, paginate=True):
+    """Keyset-paginated product listing.
+
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query, fields = product_listing_query(args)
+    limit = None
+    if paginate:
+        limit = parse_limit_arg(args, DEFAULT_PAGE_SIZE)
+        # One extra row tells us whether another page exists
+        query = query.limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [serialize_product_row(row, fields) for row in rows], next_cursor
+
+def iter_products(args, batch_size=EXPORT_CHUNK_SIZE):
+    """Yield serialized products from a batched server-side cursor."""
+    query, fields = product_listing_query(args)
+    query = query.execution_options(stream_results=True, yield_per=batch_size)
+    for partition in db.session.execute(query).partitions():
+        for row in partition:
+            yield serialize_product_row(row, fields)
+
+def catalog_etag():
+    return f'catalog-{get_catalog_version()}'
+
+def not_modified(etag):
+    """A 304 response if the client already holds ``etag``, else None."""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/products', methods=['GET'])
+@login_required
+def api_products():
+    etag = catalog_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    try:
+        items, next_cursor = list_products(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_etag(jsonify({'items': items, 'next_cursor': next_cursor}), etag)
+
 @app.route('/get_products', methods=['GET'])
 @login_required
 def get_products():
-    products = Product.query.all()
-    return jsonify([p.to_dict() for p in products])
+    etag = catalog_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    try:
+        items, _ = list_products(request.args, paginate=False)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return with_etag(jsonify(items), etag)
 
 @app.route('/get_product/<product_id>', methods=['GET'])
 @login_required
@@ -281,13 +980,150 @@ def get_product(product_id):
         return jsonify(product.to_dict())
     return jsonify({'error': 'Product not found'}), 404
 
+search_index = table(SEARCH_TABLE, column('rowid'), column('rank'))
+search_keys = table(SEARCH_KEY_TABLE, column('id'), column('product_id'))
+
+def substring_condition(term):
+    pattern = '%' + escape_like(term) + '%'
+    return or_(Product.name.like(pattern, escape='\\'), Product.brand.like(pattern, escape='\\'),
+               Product.barcode.like(pattern, escape='\\'))
+
+def product_search_query(text, fields, fuzzy=False):
+    """Ranked search over name, brand and barcode, or None if a fuzzy search has nothing to match.
+
+    On SQLite, terms of three or more characters go through the trigram
+    index; shorter ones (and every term on other databases) fall back to a
+    substring scan.
+    """
+    columns = [PRODUCT_COLUMNS[field].label(field) for field in fields]
+    terms = search_terms(text)
+    expression = match_expression(terms, fuzzy) if db.engine.dialect.name == 'sqlite' else None
+    if expression is None:
+        if fuzzy:
+            return None
+        return select(*columns).where(*[substring_condition(term) for term in terms]).order_by(Product.name, Product.id)
+
+    query = (
+        select(*columns)
+        .select_from(search_index)
+        .join(search_keys, search_keys.c.id == search_index.c.rowid)
+        .join(Product, Product.id == search_keys.c.product_id)
+        .where(literal_column(SEARCH_TABLE).op('MATCH')(expression))
+    )
+    if not fuzzy:
+        short_terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+        query = query.where(*[substring_condition(term) for term in short_terms])
+    return query.order_by(search_index.c.rank, Product.id)
+
+def run_search(text, fields, limit, offset, fuzzy):
+    query = product_search_query(text, fields, fuzzy)
+    if query is None:
+        return [], None
+    rows = db.session.execute(query.limit(limit + 1).offset(offset)).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    return [serialize_product_row(row, fields) for row in rows[:limit]], next_offset
+
+@app.route('/search', methods=['GET'])
+@login_required
+def search_products():
+    """Ranked, paginated product search.
+
+    ``q`` is matched against name, brand and barcode. A query that looks
+    like a barcode is first looked up exactly. With ``fuzzy=auto`` (the
+    default) a first page with no substring matches is retried as a fuzzy
+    search; the response says which mode answered, and later pages should
+    pass ``fuzzy=1`` if it was fuzzy.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'Missing search query'}), 400
+    fuzzy = request.args.get('fuzzy', 'auto')
+    try:
+        fields = parse_fields_arg(request.args)
+        limit = parse_limit_arg(request.args, SEARCH_PAGE_SIZE)
+        offset = parse_offset_arg(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if offset == 0 and looks_like_barcode(text):
+        columns = [PRODUCT_COLUMNS[field].label(field) for field in fields]
+        rows = db.session.execute(
+            select(*columns).where(Product.barcode == text).order_by(Product.id).limit(MAX_PAGE_SIZE)
+        ).all()
+        if rows:
+            return jsonify({'mode': 'barcode', 'items': [serialize_product_row(row, fields) for row in rows],
+                            'next_offset': None})
+
+    with metrics.stage('search'):
+        mode = 'fuzzy' if fuzzy == '1' else 'match'
+        items, next_offset = run_search(text, fields, limit, offset, mode == 'fuzzy')
+        if not items and offset == 0 and fuzzy == 'auto':
+            mode = 'fuzzy'
+            items, next_offset = run_search(text, fields, limit, offset, True)
+    return jsonify({'mode': mode, 'items': items, 'next_offset': next_offset})
+
+@app.route('/get_products_by_barcode/<barcode>', methods=['GET'])
+@login_required
+def get_products_by_barcode(barcode):
+    # Barcodes are not unique (repacks, multipacks), so this returns a list
+    products = Product.query.filter_by(barcode=barcode).order_by(Product.id).all()
+    return jsonify([product.to_dict() for product in products])
+
+def iter_json_array(items):
+    # Same layout as json.dumps(items, indent=4), one element at a time
+    first = True
+    yield '['
+    for item in items:
+        element = json.dumps(item, indent=4).replace('\n', '\n    ')
+        yield ('\n    ' if first else ',\n    ') + element
+        first = False
+    yield ']' if first else '\n]'
+
+def iter_ndjson(items):
+    for item in items:
+        yield json.dumps(item) + '\n'
+
+def iter_gzip(chunks, flush_every=64 * 1024):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending += len(data)
+        out = compressor.compress(data)
+        if pending >= flush_every:
+            # Push a block out so the client sees progress on long streams
+            out += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if out:
+            yield out
+    yield compressor.flush()
+
 @app.route('/products.json')
 @login_required
 def get_products_json():
-    products = Product.query.all()
-    products_dict = [p.to_dict() for p in products]
-    json_string = json.dumps(products_dict, indent=4)
-    return Response(json_string, mimetype='application/json')
+    output_format = request.args.get('format', 'json')
+    if output_format not in ('json', 'ndjson'):
+        return jsonify({'error': 'Invalid format'}), 400
+    use_gzip = request.args.get('gzip', '1') != '0' and 'gzip' in request.accept_encodings
+
+    etag = f"{catalog_etag()}-{output_format}{'-gzip' if use_gzip else ''}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    try:
+        # Validate arguments up front; errors inside the stream can't change the status
+        product_listing_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    items = iter_products(request.args)
+    chunks = iter_ndjson(items) if output_format == 'ndjson' else iter_json_array(items)
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'application/json'
+    response = Response(stream_with_context(iter_gzip(chunks) if use_gzip else chunks), mimetype=mimetype)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return with_etag(response, etag)
 
 @app.route('/delete_product/<string:product_id>', methods=['DELETE'])
 @login_required
@@ -295,8 +1131,12 @@ def delete_product(product_id):
     try:
         product = Product.query.get(product_id)
         if product:
+            image_paths = product.images
             db.session.delete(product)
+            hold_images(removed=image_paths)
+            bump_catalog_version(DELETE, [product_id])
             db.session.commit()
+            release_images(image_paths)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Product not found'}), 404
     except Exception as e:
@@ -304,99 +1144,572 @@ def delete_product(product_id):
         app.logger.error(f"Error deleting product: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def get_batch_config():
+def read_legacy_batch_config():
     try:
         with open(BATCH_CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {'prefix': 'A', 'index': 1}
+            config = json.load(f)
+        return config.get('prefix', 'A'), int(config.get('index', 1))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError, TypeError):
+        return 'A', 1
+
+def get_batch_sequence():
+    sequence = db.session.get(BatchSequence, 1)
+    if sequence is None:
+        prefix, index = read_legacy_batch_config()
+        try:
+            with db.session.begin_nested():
+                db.session.add(BatchSequence(id=1, prefix=prefix, next_index=index))
+        except IntegrityError:
+            # Another worker seeded it first
+            pass
+        sequence = db.session.get(BatchSequence, 1)
+    return sequence
+
+def allocate_product_ids(count=1):
+    """Hand out ``count`` consecutive product IDs inside the current transaction.
+
+    The UPDATE takes the row (or, on SQLite, the database) write lock, so
+    concurrent allocations serialize on it and never see the same index;
+    the IDs are released again if the transaction rolls back.
+    """
+    get_batch_sequence()
+    db.session.execute(
+        update(BatchSequence)
+        .where(BatchSequence.id == 1)
+        .values(next_index=BatchSequence.next_index + count)
+        .execution_options(synchronize_session=False)
+    )
+    prefix, next_index = db.session.execute(
+        select(BatchSequence.prefix, BatchSequence.next_index).where(BatchSequence.id == 1)
+    ).one()
+    return [f'{prefix}{index}' for index in range(next_index - count, next_index)]
+
+def advance_batch_sequence(product_ids):
+    """Move the sequence past explicitly inserted IDs that use the current prefix.
+
+    A conditional UPDATE, so it takes the same write lock as
+    allocate_product_ids and cannot lose a concurrent allocation.
+    """
+    prefix = get_batch_sequence().prefix
+    pattern = re.compile(re.escape(prefix) + r'(\d+)')
+    indexes = [int(match.group(1)) for match in map(pattern.fullmatch, product_ids) if match]
+    if indexes:
+        db.session.execute(
+            update(BatchSequence)
+            .where(BatchSequence.id == 1, BatchSequence.prefix == prefix, BatchSequence.next_index <= max(indexes))
+            .values(next_index=max(indexes) + 1)
+            .execution_options(synchronize_session=False)
+        )
 
-def save_batch_config(config):
-    with open(BATCH_CONFIG_FILE, 'w') as f:
-        json.dump(config, f)
+def set_batch_sequence(prefix, index):
+    sequence = get_batch_sequence()
+    sequence.prefix = prefix
+    sequence.next_index = index
 
 @app.route('/get_batch', methods=['GET'])
 @login_required
 def get_batch():
-    return jsonify(get_batch_config())
+    sequence = get_batch_sequence()
+    db.session.commit()
+    return jsonify({'prefix': sequence.prefix, 'index': sequence.next_index})
 
 @app.route('/set_batch', methods=['POST'])
 @login_required
 def set_batch():
     data = request.get_json()
     try:
-        config = {
-            'prefix': data.get('prefix', 'A'),
-            'index': int(data.get('index', 1))
-        }
-        save_batch_config(config)
+        set_batch_sequence(data.get('prefix', 'A'), int(data.get('index', 1)))
+        db.session.commit()
         return jsonify({'success': True})
     except (ValueError, TypeError) as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': 'Invalid data format'}), 400
 
+@app.route('/reserve_ids', methods=['POST'])
+@login_required
+def reserve_ids():
+    data = request.get_json(silent=True) or {}
+    try:
+        count = int(data.get('count', 1))
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid count'}), 400
+    if not 1 <= count <= app.config['MAX_RESERVED_IDS']:
+        return jsonify({'success': False, 'error': 'Invalid count'}), 400
+    try:
+        ids = allocate_product_ids(count)
+        db.session.commit()
+        return jsonify({'success': True, 'ids': ids})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error reserving product IDs: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def iter_bulk_items():
+    """Raw products from an NDJSON body (read line by line) or a JSON array."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line in request.stream:
+            if line.strip():
+                yield line
+        return
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('products')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of products or an NDJSON body')
+    yield from data
+
+def bulk_field(item, field, parse, message):
+    """``parse(item[field])``, failing with a ``field: message`` error instead of Python's text."""
+    try:
+        return parse(item[field])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError(f'{field}: {message}')
+
+def whole_number(value):
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(value)
+    return int(number)
+
+def prepare_bulk_item(item):
+    """Validate one bulk product and store its images. Runs on ingest_executor.
+
+    Returns ``(row, error)``; ``row`` holds Product column values, minus the
+    ID when the product should get one from the sequence. Errors name the
+    field at fault, like the rejected rows of a catalogue import. If storing
+    an image fails, ``row`` still comes back with the images stored before
+    it, for the caller to release.
+    """
+    try:
+        if isinstance(item, (str, bytes)):
+            item = json.loads(item)
+        if not isinstance(item, dict):
+            raise ValueError('Expected a JSON object')
+        for field in ('name', 'barcode', 'price', 'quantity'):
+            if item.get(field) in (None, ''):
+                raise ValueError(f'Missing {field}')
+        row = {
+            'id': str(item['product_id']) if item.get('product_id') else None,
+            'name': str(item['name']),
+            'brand': item.get('brand'),
+            'barcode': str(item['barcode']),
+            'price': bulk_field(item, 'price', float, 'not a number'),
+            'quantity': bulk_field(item, 'quantity', whole_number, 'not a whole number'),
+            'timestamp': bulk_field(item, 'timestamp', datetime.fromisoformat, 'not an ISO 8601 date')
+                         if item.get('timestamp') else datetime.now(),
+        }
+        images = item.get('images') or []
+        if not isinstance(images, list):
+            raise ValueError('images: not a list')
+        # Decode the data URLs up front, so malformed base64 is rejected before anything is stored
+        images_data = []
+        for i, image_data_url in enumerate(images):
+            try:
+                images_data.append(decode_data_url(image_data_url))
+            except (ValueError, AttributeError):
+                raise ValueError(f'images: image {i + 1} is not a base64 data URL')
+    except json.JSONDecodeError:
+        return None, 'Invalid JSON'
+    except ValueError as e:
+        return None, str(e)
+    stored = []
+    try:
+        with metrics.stage('image_save'):
+            for image_data in images_data:
+                stored.append(image_store.put(image_data))
+    except Exception as e:
+        app.logger.error(f"Could not store bulk image {len(stored) + 1}: {e}")
+        return dict(row, images_json=json.dumps(stored)), f'images: image {len(stored) + 1} could not be processed'
+    row['images_json'] = json.dumps(stored)
+    return row, None
+
+def insert_bulk_rows(rows):
+    """Insert bulk rows in the current transaction and return their IDs.
+
+    Rows without an ID get one from the sequence, after it has been moved
+    past the explicit IDs, so the two never collide.
+    """
+    advance_batch_sequence([row['id'] for row in rows if row['id']])
+    missing = sum(1 for row in rows if not row['id'])
+    new_ids = iter(allocate_product_ids(missing) if missing else [])
+    rows = [row if row['id'] else dict(row, id=next(new_ids)) for row in rows]
+    if hold_images([path for row in rows for path in json.loads(row['images_json'])]):
+        raise ValueError('An image was deleted while saving; upload it again')
+    db.session.execute(insert(Product), rows)
+    return [row['id'] for row in rows]
+
+def insert_bulk_row_alone(row):
+    """insert_bulk_rows for one row, in a savepoint; None if its ID has been taken."""
+    try:
+        with db.session.begin_nested():
+            return insert_bulk_rows([row])[0]
+    except IntegrityError:
+        return None
+
+def ingest_batch(items, offset):
+    """Insert one batch of bulk products in a single transaction; return per-item results."""
+    prepared = list(ingest_executor.map(metrics.bind(prepare_bulk_item), items))
+    results = [None] * len(prepared)
+    # Released only after the commit, since accepted rows may share these blobs
+    unused_images = []
+    rows = []
+    for i, (row, error) in enumerate(prepared):
+        if error:
+            results[i] = {'index': offset + i, 'success': False, 'error': error}
+            if row:
+                unused_images.extend(json.loads(row['images_json']))
+        else:
+            rows.append((i, row))
+
+    explicit_ids = [row['id'] for _, row in rows if row['id']]
+    taken = set()
+    if explicit_ids:
+        taken = set(db.session.execute(select(Product.id).where(Product.id.in_(explicit_ids))).scalars())
+    accepted = []
+    for i, row in rows:
+        if row['id'] in taken:
+            results[i] = {'index': offset + i, 'success': False, 'error': 'Product ID already in use'}
+            unused_images.extend(json.loads(row['images_json']))
+            continue
+        if row['id']:
+            taken.add(row['id'])
+        accepted.append((i, row))
+
+    if accepted:
+        try:
+            try:
+                product_ids = insert_bulk_rows([row for _, row in accepted])
+            except IntegrityError:
+                # Another writer took one of the explicit IDs meanwhile; go one
+                # row at a time so only the items that clash fail
+                db.session.rollback()
+                product_ids = [insert_bulk_row_alone(row) for _, row in accepted]
+            inserted_ids = [product_id for product_id in product_ids if product_id]
+            if inserted_ids:
+                bump_catalog_version(UPSERT, inserted_ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error ingesting products {offset}-{offset + len(items) - 1}: {e}")
+            for i, row in accepted:
+                results[i] = {'index': offset + i, 'success': False, 'error': str(e)}
+                unused_images.extend(json.loads(row['images_json']))
+        else:
+            for (i, row), product_id in zip(accepted, product_ids):
+                if product_id:
+                    results[i] = {'index': offset + i, 'success': True, 'product_id': product_id}
+                else:
+                    results[i] = {'index': offset + i, 'success': False, 'error': 'Product ID already in use'}
+                    unused_images.extend(json.loads(row['images_json']))
+    release_images(unused_images)
+    return results
+
+@app.route('/bulk_add_products', methods=['POST'])
+@login_required
+def bulk_add_products():
+    """Add many products from a JSON array or NDJSON stream.
+
+    Each item takes the /add_product fields plus optional ``product_id`` (from
+    /reserve_ids), ``timestamp`` and ``images`` (data URLs). Items are inserted
+    in batches of BULK_INGEST_BATCH_SIZE, one transaction per batch.
+    """
+    batch_size = app.config['BULK_INGEST_BATCH_SIZE']
+    results = []
+    try:
+        items = iter_bulk_items()
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            results.extend(ingest_batch(batch, len(results)))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    inserted = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'inserted': inserted,
+        'failed': len(results) - inserted,
+        'results': results
+    })
+
+FULL_ANALYSIS_PROMPT = 'Respond ONLY with a valid JSON object in this format: {"name": "full product name without brand", "brand": "brand name", "barcode": "number or null if not found"}. Do not include any explanations, code blocks, or additional text. Ensure the response is pure JSON.'
+
+AI_ANALYSIS_PROMPT = 'You are an assistant that identifies product details and counts similar objects from an image. \n\n Step 1: Look at the product image and read any visible text and numbers. \n Step 2: Identify the PRODUCT NAME — the main title or description of the item. \n Step 3: Identify the BRAND NAME — the manufacturer or company name, often from a logo. \n Step 4: Identify the BARCODE NUMBER — the numeric code found on the barcode (if visible). \n Step 5: Count the number of similar objects/products visible in the image (e.g., if multiple identical items are shown, count them). \n Step 6: Output only in the following JSON format: \n\n { \n   "product_name": "<product name here>", \n   "brand_name": "<brand name here>", \n   "barcode_number": "<barcode number here or \'not visible\'>", \n   "object_count": <integer count of similar objects> \n } \n\n Do not include extra text or explanations.'
+
+# Same as AI_ANALYSIS_PROMPT minus the barcode step, used once pyzbar has already read the code
+AI_ANALYSIS_PROMPT_NO_BARCODE = 'You are an assistant that identifies product details and counts similar objects from an image. \n\n Step 1: Look at the product image and read any visible text. \n Step 2: Identify the PRODUCT NAME — the main title or description of the item. \n Step 3: Identify the BRAND NAME — the manufacturer or company name, often from a logo. \n Step 4: Count the number of similar objects/products visible in the image (e.g., if multiple identical items are shown, count them). \n Step 5: Output only in the following JSON format: \n\n { \n   "product_name": "<product name here>", \n   "brand_name": "<brand name here>", \n   "object_count": <integer count of similar objects> \n } \n\n Do not include extra text or explanations.'
+
+# Same answer format as AI_ANALYSIS_PROMPT, for several photos in one request
+MULTI_ANALYSIS_PROMPT = 'You are an assistant that identifies product details and counts similar objects. The images above are photos of the SAME product taken from different angles. \n\n Step 1: Look at every image and read any visible text and numbers; the name, brand and barcode may each be visible on a different side. \n Step 2: Identify the PRODUCT NAME — the main title or description of the item. \n Step 3: Identify the BRAND NAME — the manufacturer or company name, often from a logo. \n Step 4: Identify the BARCODE NUMBER — the numeric code found on the barcode (if visible in any image). \n Step 5: Count the number of similar objects/products visible in the image that shows the most of them. \n Step 6: Output only in the following JSON format: \n\n { \n   "product_name": "<product name here>", \n   "brand_name": "<brand name here>", \n   "barcode_number": "<barcode number here or \'not visible\'>", \n   "object_count": <integer count of similar objects> \n } \n\n Do not include extra text or explanations.'
+
+def parse_ai_json(ai_result):
+    # Extract JSON from response
+    match = re.search(r'\{.*\}', ai_result, re.DOTALL)
+    if match:
+        ai_result_clean = match.group(0)
+    else:
+        ai_result_clean = ai_result
+    try:
+        return json.loads(ai_result_clean)
+    except json.JSONDecodeError as e:
+        app.logger.error(f"JSON decode error: {str(e)}")
+        raise AnalysisError('Invalid AI response format')
+
+def detect_barcode(image):
+    """Run the barcode decoding ladder; returns the hit dict or None."""
+    with metrics.stage('pyzbar'):
+        hit = barcode_decoder().decode(image)
+    metrics.inc('barcode_decodes_total', stage=hit['stage'] if hit else 'none')
+    return hit
+
+def prepare_vlm_image(image_data, image, trace=None):
+    """Downscale/re-encode an image for the VLM, recording the bytes saved and time taken."""
+    started = time.perf_counter()
+    output, info = vlm_preprocessor().process(image_data, image)
+    info['preprocess_ms'] = elapsed_ms(started)
+    metrics.record_stage('vlm_preprocess', info['preprocess_ms'] / 1000.0)
+    metrics.inc('vlm_image_bytes_total', info['original_bytes'], kind='original')
+    metrics.inc('vlm_image_bytes_total', info['sent_bytes'], kind='sent')
+    app.logger.info(
+        f"VLM image {info['original_size'][0]}x{info['original_size'][1]} {info['original_bytes']} bytes -> "
+        f"{info['sent_size'][0]}x{info['sent_size'][1]} {info['sent_bytes']} bytes in {info['preprocess_ms']} ms"
+    )
+    if trace is not None:
+        trace['vlm_image'] = info
+    return output
+
+def run_full_analysis(image_data, image):
+    payload = prepare_vlm_image(image_data, image)
+    # AI prompt for name and brand
+    with metrics.stage('vlm'):
+        ai_result = vlm_client.multimodal(full_analysis_content(payload))
+    app.logger.info(f"AI raw response: {ai_result}")
+    return full_answer(parse_ai_json(ai_result))
+
+def full_analysis_content(payload):
+    return [
+        {'image': to_data_url(payload)},
+        {'text': FULL_ANALYSIS_PROMPT}
+    ]
+
+def full_answer(details):
+    ai_barcode = details.get('barcode')
+    return {
+        'name': details.get('name', ''),
+        'brand': details.get('brand', ''),
+        'barcode': ai_barcode if ai_barcode and ai_barcode != 'null' else None
+    }
+
+def run_ai_analysis(image_data, include_barcode=True, image=None, trace=None):
+    if image is None:
+        image = image_from_bytes(image_data)
+    payload = prepare_vlm_image(image_data, image, trace)
+    with metrics.stage('vlm'):
+        ai_result = vlm_client.chat(ai_analysis_content(payload, include_barcode), top_p=0.8, temperature=1)
+    app.logger.info(f"AI raw response: {ai_result}")
+    return ai_answer(parse_ai_json(ai_result))
+
+def ai_analysis_content(payload, include_barcode=True):
+    return [
+        {"type": "image_url", "image_url": {"url": to_data_url(payload)}},
+        {"type": "text", "text": AI_ANALYSIS_PROMPT if include_barcode else AI_ANALYSIS_PROMPT_NO_BARCODE}
+    ]
+
+def ai_answer(details):
+    return {
+        'name': details.get('product_name', ''),
+        'brand': details.get('brand_name', ''),
+        'barcode': details.get('barcode_number', 'not visible'),
+        'object_count': details.get('object_count', 1)  # Default to 1 if not provided
+    }
+
+def run_multi_ai_analysis(images_data, images):
+    """One VLM request carrying every photo of the product."""
+    payloads = [prepare_vlm_image(image_data, image) for image_data, image in zip(images_data, images)]
+    with metrics.stage('vlm'):
+        ai_result = vlm_client.chat(multi_analysis_content(payloads), top_p=0.8, temperature=1)
+    app.logger.info(f"AI raw response: {ai_result}")
+    return ai_answer(parse_ai_json(ai_result))
+
+def multi_analysis_content(payloads):
+    content = [{"type": "image_url", "image_url": {"url": to_data_url(payload)}} for payload in payloads]
+    content.append({"type": "text", "text": MULTI_ANALYSIS_PROMPT})
+    return content
+
+def barcode_only_result(error):
+    """Stand-in for the VLM answer while it is unavailable; callers fill in the barcode."""
+    app.logger.warning(f"VLM unavailable, falling back to barcode-only result: {error}")
+    metrics.inc('vlm_fallbacks_total')
+    return {'name': '', 'brand': '', 'object_count': 1, 'degraded': True}
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def run_combined_analysis(image_data):
+    """Decode once, then run pyzbar and the VLM concurrently and merge their answers."""
+    timings = {}
+    started = time.perf_counter()
+    image = image_from_bytes(image_data)
+    timings['decode_ms'] = elapsed_ms(started)
+
+    def timed_barcode():
+        barcode_started = time.perf_counter()
+        hit = detect_barcode(image)
+        timings['barcode_ms'] = elapsed_ms(barcode_started)
+        return hit
+
+    barcode_future = stage_executor.submit(metrics.bind(timed_barcode))
+    # Give pyzbar a short head start: if it reads the code by then, the VLM
+    # prompt can drop its barcode step
+    try:
+        hit = barcode_future.result(timeout=app.config['ANALYZE_BARCODE_HEAD_START'])
+    except FutureTimeoutError:
+        hit = None
+    include_barcode = not hit
+
+    vlm_started = time.perf_counter()
+    namespace = 'analyze_ai' if include_barcode else 'analyze_ai_no_barcode'
+    trace = {}
+    try:
+        result = cached_analysis(namespace, image_data, image,
+                                 lambda: run_ai_analysis(image_data, include_barcode=include_barcode,
+                                                         image=image, trace=trace))
+    except VLMUnavailable as e:
+        result = barcode_only_result(e)
+    timings['vlm_ms'] = elapsed_ms(vlm_started)
+    if 'vlm_image' in trace:
+        timings['preprocess_ms'] = trace['vlm_image']['preprocess_ms']
+        result['vlm_image'] = trace['vlm_image']
+
+    apply_barcode(result, barcode_future.result())
+    timings['total_ms'] = elapsed_ms(started)
+    result['timings'] = timings
+    return result
+
+def apply_barcode(result, hit):
+    """Prefer the pyzbar reading over the VLM's in a combined analysis result."""
+    ai_barcode = result.pop('barcode', None)
+    result['barcode_stage'] = hit['stage'] if hit else None
+    if hit:
+        result['barcode'] = hit['barcode']
+        result['barcode_source'] = 'pyzbar'
+    elif ai_barcode and ai_barcode not in ('not visible', 'null'):
+        result['barcode'] = ai_barcode
+        result['barcode_source'] = 'vlm'
+    else:
+        result['barcode'] = 'N/A'
+        result['barcode_source'] = None
+
+def run_multi_analysis(images_data):
+    """Analyze several photos of one product in one round trip and fuse the answers.
+
+    pyzbar runs on every frame in parallel. The VLM sees the first
+    ANALYZE_MAX_VLM_IMAGES frames, either in one multi-image request or, in
+    'fanout' mode, as parallel single-image requests that go through the
+    analysis cache.
+    """
+    timings = {}
+    started = time.perf_counter()
+    images = list(stage_executor.map(metrics.bind(image_from_bytes), images_data))
+    timings['decode_ms'] = elapsed_ms(started)
+
+    barcode_futures = [stage_executor.submit(metrics.bind(detect_barcode), image) for image in images]
+
+    vlm_started = time.perf_counter()
+    vlm_count = app.config['ANALYZE_MAX_VLM_IMAGES']
+    degraded = False
+    if app.config['ANALYZE_MULTI_MODE'] == 'fanout':
+        def analyze_frame(frame):
+            image_data, image = frame
+            try:
+                return cached_analysis('analyze_ai', image_data, image,
+                                       lambda: run_ai_analysis(image_data, image=image))
+            except VLMUnavailable as e:
+                app.logger.warning(f"VLM unavailable for one frame: {e}")
+                return None
+        answers = list(stage_executor.map(metrics.bind(analyze_frame), list(zip(images_data, images))[:vlm_count]))
+        degraded = not any(answers)
+    else:
+        try:
+            answers = [run_multi_ai_analysis(images_data[:vlm_count], images[:vlm_count])]
+        except VLMUnavailable as e:
+            app.logger.warning(f"VLM unavailable, falling back to barcode-only result: {e}")
+            metrics.inc('vlm_fallbacks_total')
+            answers = []
+            degraded = True
+    timings['vlm_ms'] = elapsed_ms(vlm_started)
+
+    result = fused_result([future.result() for future in barcode_futures], answers, degraded)
+    timings['total_ms'] = elapsed_ms(started)
+    result['timings'] = timings
+    return result
+
+def fused_result(hits, answers, degraded):
+    result = fuse_analysis(hits, answers)
+    result['frames'] = [
+        {'barcode': hit['barcode'] if hit else None, 'barcode_stage': hit['stage'] if hit else None}
+        for hit in hits
+    ]
+    if degraded:
+        result['degraded'] = True
+    return result
+
+@app.route('/analyze', methods=['POST'])
+@login_required
+def analyze():
+    image_data = request_image()
+    if not image_data:
+        return jsonify({'error': 'No image data'}), 400
+
+    try:
+        return jsonify(run_combined_analysis(image_data))
+    except AnalysisError as e:
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Error during combined analysis: {e}")
+        return jsonify({'error': 'Failed to analyze'}), 500
+
+@app.route('/analyze_multi', methods=['POST'])
+@login_required
+def analyze_multi():
+    images_data = request_images()
+    if not images_data:
+        return jsonify({'error': 'No image data'}), 400
+    if len(images_data) > app.config['ANALYZE_MAX_IMAGES']:
+        return jsonify({'error': f"At most {app.config['ANALYZE_MAX_IMAGES']} images per product"}), 400
+
+    try:
+        return jsonify(run_multi_analysis(images_data))
+    except AnalysisError as e:
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        app.logger.error(f"Error during multi-image analysis: {e}")
+        return jsonify({'error': 'Failed to analyze'}), 500
+
 @app.route('/analyze_full', methods=['POST'])
 @login_required
 def analyze_full():
-    data = request.get_json()
-    if 'image_data' not in data:
+    image_data = request_image()
+    if not image_data:
         return jsonify({'error': 'No image data'}), 400
 
     try:
-        image = read_image_from_data_url(data['image_data'])
+        image = image_from_bytes(image_data)
 
         # First, try to detect barcode using pyzbar
-        barcodes = decode(image)
-        barcode = barcodes[0].data.decode('utf-8') if barcodes else None
-
-        # Save image for AI analysis
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        temp_image_path = os.path.join(upload_folder, 'temp_analysis_image.png')
-        cv2.imwrite(temp_image_path, image)
-
-        abs_temp_image_path = os.path.abspath(temp_image_path)
-        local_file_url = f'file://{abs_temp_image_path}'
-
-        # AI prompt for name and brand
-        messages = [
-            {
-                'role': Role.USER,
-                'content': [
-                    {'image': local_file_url},
-                    {'text': 'Respond ONLY with a valid JSON object in this format: {"name": "full product name without brand", "brand": "brand name", "barcode": "number or null if not found"}. Do not include any explanations, code blocks, or additional text. Ensure the response is pure JSON.'}
-                ]
-            }
-        ]
-        response = dashscope.MultiModalConversation.call(
-            model='qwen-vl-max',
-            messages=messages
-        )
-
-        if response.status_code == HTTPStatus.OK:
-            ai_result = response.output.choices[0].message.content[0]['text']
-            app.logger.info(f"AI raw response: {ai_result}")
-            try:
-                # Extract JSON from response
-                match = re.search(r'\{.*\}', ai_result, re.DOTALL)
-                if match:
-                    ai_result_clean = match.group(0)
-                else:
-                    ai_result_clean = ai_result
-                details = json.loads(ai_result_clean)
-                name = details.get('name', '')
-                brand = details.get('brand', '')
-                ai_barcode = details.get('barcode')
-                # Use AI barcode if pyzbar failed
-                if not barcode and ai_barcode and ai_barcode != 'null':
-                    barcode = ai_barcode
-            except json.JSONDecodeError as e:
-                app.logger.error(f"JSON decode error: {str(e)}")
-                return jsonify({'error': 'Invalid AI response format'}), 500
-
-            return jsonify({'name': name, 'brand': brand, 'barcode': barcode or 'N/A'})
-        
+        hit = detect_barcode(image)
 
+        try:
+            result = cached_analysis('analyze_full', image_data, image, lambda: run_full_analysis(image_data, image))
+        except VLMUnavailable as e:
+            result = barcode_only_result(e)
+        # Use AI barcode if pyzbar failed
+        result['barcode'] = (hit and hit['barcode']) or result.get('barcode') or 'N/A'
+        result['barcode_stage'] = hit['stage'] if hit else None
+        return jsonify(result)
+    except AnalysisError as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         app.logger.error(f"Error during full analysis: {e}")
         return jsonify({'error': 'Failed to analyze'}), 500
@@ -405,87 +1718,445 @@ def analyze_full():
 @app.route('/analyze_ai', methods=['POST'])
 @login_required
 def analyze_ai():
-    data = request.get_json()
-    if 'image_data' not in data:
+    image_data = request_image()
+    if not image_data:
         return jsonify({'error': 'No image data'}), 400
 
     try:
-        image_data_url = data['image_data']
-
-        client = OpenAI(
-            api_key=os.getenv("DASHSCOPE_API_KEY"),
-            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-        )
-        completion = client.chat.completions.create(
-            model="qwen-vl-max",
-            messages=[
-                {"role": "user",
-                 "content": [
-                    {"type": "image_url", "image_url": {"url": image_data_url}},
-                    {"type": "text", "text": 'You are an assistant that identifies product details and counts similar objects from an image. \n\n Step 1: Look at the product image and read any visible text and numbers. \n Step 2: Identify the PRODUCT NAME — the main title or description of the item. \n Step 3: Identify the BRAND NAME — the manufacturer or company name, often from a logo. \n Step 4: Identify the BARCODE NUMBER — the numeric code found on the barcode (if visible). \n Step 5: Count the number of similar objects/products visible in the image (e.g., if multiple identical items are shown, count them). \n Step 6: Output only in the following JSON format: \n\n { \n   "product_name": "<product name here>", \n   "brand_name": "<brand name here>", \n   "barcode_number": "<barcode number here or \'not visible\'>", \n   "object_count": <integer count of similar objects> \n } \n\n Do not include extra text or explanations.'}
-                 ]}
-            ],
-            top_p=0.8,
-            temperature=1
-        )
-        ai_result = completion.choices[0].message.content
-        app.logger.info(f"AI raw response: {ai_result}")
+        image = image_from_bytes(image_data)
         try:
-            match = re.search(r'\{.*\}', ai_result, re.DOTALL)
-            if match:
-                ai_result_clean = match.group(0)
-            else:
-                ai_result_clean = ai_result
-            details = json.loads(ai_result_clean)
-            product_name = details.get('product_name', '')
-            brand_name = details.get('brand_name', '')
-            barcode_number = details.get('barcode_number', 'not visible')
-            object_count = details.get('object_count', 1)  # Default to 1 if not provided
-            return jsonify({'name': product_name, 'brand': brand_name, 'barcode': barcode_number, 'object_count': object_count})
-        except json.JSONDecodeError as e:
-            app.logger.error(f"JSON decode error: {str(e)}")
-            return jsonify({'error': 'Invalid AI response format'}), 500
-
+            result = cached_analysis('analyze_ai', image_data, image, lambda: run_ai_analysis(image_data, image=image))
+        except VLMUnavailable as e:
+            result = barcode_only_result(e)
+        if 'barcode' not in result:
+            # Degraded answers and similar-image cache hits have no barcode of their own
+            hit = detect_barcode(image)
+            result['barcode'] = hit['barcode'] if hit else 'not visible'
+        return jsonify(result)
+    except AnalysisError as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         app.logger.error(f"Error during AI analysis: {e}")
         return jsonify({'error': 'Failed to analyze'}), 500
 
+def run_analysis_job(job, mode, image_data):
+    try:
+        job.set_stage('decode')
+        image = image_from_bytes(image_data)
+
+        job.set_stage('barcode')
+        hit = detect_barcode(image)
+
+        job.set_stage('vlm')
+        try:
+            if mode == 'full':
+                result = cached_analysis('analyze_full', image_data, image, lambda: run_full_analysis(image_data, image))
+            else:
+                result = cached_analysis('analyze_ai', image_data, image, lambda: run_ai_analysis(image_data, image=image))
+        except VLMUnavailable as e:
+            result = barcode_only_result(e)
+        if mode == 'full':
+            result['barcode'] = (hit and hit['barcode']) or result.get('barcode') or 'N/A'
+        elif hit:
+            result['barcode'] = hit['barcode']
+        else:
+            result.setdefault('barcode', 'not visible')
+        result['barcode_stage'] = hit['stage'] if hit else None
+        return result
+    except (JobCancelled, AnalysisError):
+        raise
+    except Exception as e:
+        app.logger.error(f"Error during analysis job {job.id}: {e}")
+        raise AnalysisError('Failed to analyze')
+
+def get_own_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job.owner != current_user.get_id():
+        return None
+    return job
+
+@app.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    image_data = request_image()
+    if not image_data:
+        return jsonify({'error': 'No image data'}), 400
+    mode = request_fields().get('mode', request.args.get('mode', 'ai'))
+    if mode not in ('ai', 'full'):
+        return jsonify({'error': 'Invalid mode'}), 400
+
+    try:
+        job = job_manager.submit(
+            f'analyze_{mode}',
+            lambda job: run_analysis_job(job, mode, image_data),
+            owner=current_user.get_id()
+        )
+    except QueueFull:
+        return jsonify({'error': 'Too many analysis jobs in progress'}), 503
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    job_manager.cancel(job_id)
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # Each open stream holds a worker thread, so it is closed after
+    # SYNC_STREAM_SECONDS; the client reconnects and gets the current state
+    closes_at = time.monotonic() + app.config['SYNC_STREAM_SECONDS']
+
+    def stream():
+        yield 'retry: 1000\n\n'
+        seq = None
+        while True:
+            if job.seq != seq:
+                seq = job.seq
+                yield f"event: {job.state}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.finished:
+                    return
+            remaining = closes_at - time.monotonic()
+            if remaining <= 0:
+                return
+            job_manager.wait(job, seq, timeout=remaining)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+CHANGE_FEED_BATCH = 200
+
+def change_events(conn, changes):
+    """SSE messages for ProductChange rows; upserts carry the products as they are now."""
+    upserted = [product_id for change in changes if change.kind == UPSERT
+                for product_id in json.loads(change.product_ids_json or '[]')]
+    products = {}
+    if upserted:
+        query = select(*[PRODUCT_COLUMNS[field].label(field) for field in PRODUCT_FIELDS]) \
+            .where(Product.id.in_(set(upserted)))
+        for row in conn.execute(query):
+            products[row.id] = serialize_product_row(row, PRODUCT_FIELDS)
+
+    messages = []
+    for change in changes:
+        data = {'version': change.version}
+        product_ids = json.loads(change.product_ids_json or '[]')
+        if change.kind == UPSERT:
+            # Products deleted since have their own delete event further on
+            data['products'] = [products[product_id] for product_id in product_ids if product_id in products]
+        elif change.kind == DELETE:
+            data['ids'] = product_ids
+        messages.append(format_event(change.kind, data, change.version))
+    return messages
+
+def open_change_feed(since):
+    """Opening messages of an /events stream and the version they bring the client to.
+
+    A new client (``since`` None) gets 'ready' with the current version and
+    loads the listing; a resuming one gets the changes it missed, or
+    'reload' if they are no longer kept.
+    """
+    with app.app_context(), db.engine.connect() as conn:
+        current = conn.execute(select(CatalogState.version).where(CatalogState.id == 1)).scalar() or 0
+        if since is None:
+            return [format_event('ready', {'version': current}, current)], current
+        oldest = conn.execute(select(db.func.min(ProductChange.version))).scalar()
+        if since > current or (since < current and (oldest is None or oldest > since + 1)):
+            return [format_event(RELOAD, {'version': current}, current)], current
+    return read_change_feed(since)
+
+def read_change_feed(last):
+    """Messages for changes after version ``last``, and the version they reach."""
+    with app.app_context(), db.engine.connect() as conn:
+        changes = conn.execute(
+            select(ProductChange).where(ProductChange.version > last)
+            .order_by(ProductChange.version).limit(CHANGE_FEED_BATCH)
+        ).all()
+        if not changes:
+            return [], last
+        return change_events(conn, changes), changes[-1].version
+
+def parse_event_id(value):
+    """The version an /events client has seen (Last-Event-ID on reconnect, else ?since=), or None."""
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Invalid event ID')
+
+@app.route('/events')
+@login_required
+def catalog_events():
+    """Server-Sent Events feed of product changes (see change_feed.py)."""
+    try:
+        since = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Each open stream holds a worker thread, so it is closed after
+    # SYNC_STREAM_SECONDS and the browser resumes from its Last-Event-ID.
+    # Serve through asgi.py to keep streams open without the thread.
+    closes_at = time.monotonic() + min(app.config['SYNC_STREAM_SECONDS'], app.config['CHANGE_FEED_MAX_STREAM_SECONDS'])
+
+    def stream():
+        yield 'retry: 2000\n\n'
+        messages, last = open_change_feed(since)
+        yield from messages
+        with change_notifier.watching():
+            while time.monotonic() < closes_at:
+                version = change_notifier.wait(last, closes_at - time.monotonic())
+                messages, last = read_change_feed(last)
+                if not messages and version is not None and version > last:
+                    last = version  # versions with no logged change; do not spin on them
+                if messages:
+                    yield ''.join(messages)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+EXPORT_COLUMNS = (
+    ('ID', Product.id),
+    ('Name', Product.name),
+    ('Brand', Product.brand),
+    ('Barcode', Product.barcode),
+    ('Price', Product.price),
+    ('Quantity', Product.quantity),
+    ('Timestamp', Product.timestamp),
+)
+
+def has_products():
+    return db.session.execute(select(Product.id).limit(1)).first() is not None
+
+def iter_export_chunks():
+    """Yield lists of export rows, fetched EXPORT_CHUNK_SIZE at a time from a server-side cursor."""
+    query = (
+        select(*[column for _, column in EXPORT_COLUMNS])
+        .order_by(Product.timestamp, Product.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for partition in db.session.execute(query).partitions():
+        yield [
+            row[:-1] + (row[-1].strftime('%Y-%m-%d %H:%M:%S'),)
+            for row in partition
+        ]
+
 @app.route('/export_csv', methods=['GET'])
 @login_required
 def export_csv():
-    products = Product.query.all()
-    if not products:
+    if not has_products():
         return "No data to export", 404
 
-    data_for_df = []
-    for p in products:
-        data_for_df.append({
-            'ID': p.id,
-            'Name': p.name,
-            'Brand': p.brand,
-            'Barcode': p.barcode,
-            'Price': p.price,
-            'Quantity': p.quantity,
-            'Timestamp': p.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        # utf-8-sig so Excel picks up the encoding
+        buffer.write('\ufeff')
+        writer.writerow([header for header, _ in EXPORT_COLUMNS])
+        for chunk in iter_export_chunks():
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=products.csv'}
+    )
 
-    df = pd.DataFrame(data_for_df)
-    output = BytesIO()
-    df.to_csv(output, index=False, encoding='utf-8-sig')
-    output.seek(0)
-    
-    return send_file(
-        output, 
-        mimetype='text/csv', 
-        as_attachment=True, 
-        download_name='products.csv'
+@app.route('/export_xlsx', methods=['GET'])
+@login_required
+def export_xlsx():
+    if not has_products():
+        return "No data to export", 404
+
+    # XLSX is a zip archive, so it can only be sent once complete; constant
+    # memory mode flushes each row to disk as it is written
+    import xlsxwriter
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet('Products')
+        header_format = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, [header for header, _ in EXPORT_COLUMNS], header_format)
+        row_index = 1
+        for chunk in iter_export_chunks():
+            for row in chunk:
+                worksheet.write_row(row_index, 0, row)
+                row_index += 1
+        workbook.close()
+    except Exception as e:
+        os.remove(path)
+        app.logger.error(f"Error exporting XLSX: {e}")
+        return "Failed to export", 500
+
+    response = send_file(
+        path,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name='products.xlsx'
     )
+    response.call_on_close(lambda: os.remove(path))
+    return response
+
+def upsert_catalog_chunk(frame, key):
+    """Write one cleaned import chunk as an executemany UPDATE plus INSERT.
+
+    Returns ``(inserted_ids, updated_ids, rejected)`` where ``rejected``
+    lists ``(row, error)`` for new products the file lacks columns for. Runs
+    in the caller's transaction.
+    """
+    import pandas as pd
+    key_column = PRODUCT_COLUMNS[key]
+    existing = {}
+    for product_id, value in db.session.execute(
+        select(Product.id, key_column).where(key_column.in_(frame[key].dropna().tolist()))
+    ):
+        existing.setdefault(value, []).append(product_id)
+
+    # The capture timestamp and the matched key are never overwritten
+    update_fields = [field for field in ('name', 'brand', 'barcode', 'price', 'quantity')
+                     if field in frame and field != key]
+    matched = frame[frame[key].isin(existing.keys())]
+    updates = [
+        dict({field: record[field] for field in update_fields}, id=product_id)
+        for record in matched.to_dict('records')
+        for product_id in existing[record[key]]
+    ]
+    if updates and update_fields:
+        db.session.execute(update(Product), updates)
+
+    updated_ids = [row['id'] for row in updates]
+
+    new = frame[~frame[key].isin(existing.keys())]
+    if new.empty:
+        return [], updated_ids, []
+    missing = [field for field in ('name', 'barcode', 'price', 'quantity') if field not in new]
+    if missing:
+        error = f"New product, file has no {', '.join(missing)} column"
+        return [], updated_ids, [(row, error) for row in new['row']]
+
+    now = datetime.now()
+    if key == 'id':
+        # Re-imported exports carry IDs the sequence would otherwise hand out
+        # again, so move past them before allocating for rows left blank
+        explicit = new['id'].dropna().tolist()
+        advance_batch_sequence(explicit)
+        blank = len(new) - len(explicit)
+        allocated = iter(allocate_product_ids(blank) if blank else [])
+        ids = [next(allocated) if pd.isna(product_id) else product_id for product_id in new['id']]
+    else:
+        ids = allocate_product_ids(len(new))
+    inserts = []
+    for product_id, record in zip(ids, new.to_dict('records')):
+        timestamp = record.get('timestamp')
+        inserts.append({
+            'id': product_id,
+            'name': record['name'],
+            'brand': record.get('brand'),
+            'barcode': record['barcode'],
+            'price': record['price'],
+            'quantity': record['quantity'],
+            'images_json': '[]',
+            'timestamp': now if timestamp is None or pd.isna(timestamp) else timestamp.to_pydatetime(),
+        })
+    db.session.execute(insert(Product), inserts)
+    return ids, updated_ids, []
+
+def import_catalog(source, filename, key=None, chunk_size=None):
+    """Upsert products from a CSV/XLSX file, one transaction per chunk.
+
+    ``key`` is 'id' or 'barcode'; by default 'id' when the file has an ID
+    column (our own exports) and 'barcode' otherwise (supplier lists). Rows
+    with a blank ID are added as new products.
+    """
+    from catalog_reader import read_catalog_chunks, clean_catalog_chunk
+    chunk_size = chunk_size or app.config['IMPORT_CHUNK_SIZE']
+    max_reported = app.config['IMPORT_MAX_REPORTED_ERRORS']
+    summary = {'inserted': 0, 'updated': 0, 'rejected': 0, 'rejected_rows': []}
+
+    def add_rejected(rows):
+        summary['rejected'] += len(rows)
+        room = max_reported - len(summary['rejected_rows'])
+        summary['rejected_rows'].extend({'row': row, 'error': error} for row, error in rows[:room])
+
+    for chunk in read_catalog_chunks(source, filename, chunk_size):
+        if key is None:
+            key = 'id' if 'id' in chunk else 'barcode'
+        clean, rejected = clean_catalog_chunk(chunk, key)
+        add_rejected(list(zip(rejected['row'].tolist(), rejected['error'].tolist())))
+        if clean.empty:
+            continue
+        try:
+            inserted, updated, unmatched = upsert_catalog_chunk(clean, key)
+            if inserted or updated:
+                bump_catalog_version(UPSERT, inserted + updated)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error importing rows {clean['row'].iloc[0]}-{clean['row'].iloc[-1]}: {e}")
+            add_rejected([(row, str(e)) for row in clean['row'].tolist()])
+            continue
+        summary['inserted'] += len(inserted)
+        summary['updated'] += len(updated)
+        add_rejected(unmatched)
+    summary['key'] = key
+    return summary
+
+@app.route('/import_catalog', methods=['POST'])
+@login_required
+def import_catalog_route():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+    key = request.form.get('key') or None
+    if key not in (None, 'id', 'barcode'):
+        return jsonify({'success': False, 'error': 'key must be id or barcode'}), 400
+    try:
+        summary = import_catalog(upload.stream, upload.filename, key=key)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error importing catalogue: {e}")
+        return jsonify({'success': False, 'error': 'Failed to import file'}), 500
+    return jsonify(dict(summary, success=True))
 
 @app.route('/uploads/<path:filename>')
 @login_required
 def serve_upload(filename):
     return send_from_directory(app.config.get('UPLOAD_FOLDER', 'uploads'), filename)
 
+@app.route('/media/<path:filename>')
+@login_required
+def serve_media(filename):
+    path = image_store.resolve_url_path(filename)
+    if not path or not os.path.exists(path):
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(path, conditional=True)
+    # Content-addressed: a given URL never changes
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
 @app.route('/reset_data', methods=['POST'])
 @login_required
 def reset_data():
@@ -504,13 +2175,17 @@ def reset_data():
             app.logger.info("Finished clearing upload folder.")
         else:
             app.logger.info("Upload folder does not exist. Skipping file clearing.")
+        app.logger.info("Clearing image store...")
+        image_store.clear()
 
         # Reset the database
         app.logger.info("Resetting database...")
         db.session.query(Product).delete(synchronize_session=False)
+        db.session.query(ImageBlob).delete(synchronize_session=False)
         app.logger.info("Products deleted. Resetting batch config...")
-        save_batch_config({'prefix': 'A', 'index': 1})
+        set_batch_sequence('A', 1)
         app.logger.info("Batch config reset. Committing changes...")
+        bump_catalog_version(RESET)
         db.session.commit()
         app.logger.info("--- Data reset process completed successfully ---")
         return jsonify({'success': True})
@@ -0,0 +1,470 @@
+"""ASGI entry point for high-concurrency serving.
+
+The scanning routes (/detect_barcode, /analyze, /analyze_ai, /analyze_full,
+/analyze_multi, /extract_product_name) run as async handlers: VLM calls go
+through the asyncio side of VLMClient,
+while image decoding, pyzbar, preprocessing and cache lookups run on the
+stage executor, so a request waiting on the model holds no thread. The
+/events change feed is async too, so open streams hold no thread either.
+Every other route (login, products, export, jobs, ...) is the Flask app,
+mounted behind it and sharing its session cookie.
+
+    uvicorn asgi:api --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import time
+from urllib.parse import quote
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from itsdangerous import BadSignature
+from starlette.concurrency import run_in_threadpool
+
+import app as catalog
+from app import (
+    AnalysisError, ai_analysis_content, ai_answer, app, apply_barcode, barcode_only_result, cache_lookup,
+    cache_store, change_notifier, decode_data_url, detect_barcode, elapsed_ms, full_analysis_content, full_answer,
+    fused_result, image_from_bytes, metrics, multi_analysis_content, open_change_feed, parse_ai_json,
+    parse_event_id, prepare_vlm_image, product_name_content, read_change_feed, stage_executor, vlm_client
+)
+from metrics import server_timing
+from vlm_client import VLMUnavailable
+
+ASYNC_ENDPOINTS = {
+    '/detect_barcode': 'detect_barcode_route',
+    '/analyze': 'analyze',
+    '/analyze_ai': 'analyze_ai',
+    '/analyze_full': 'analyze_full',
+    '/analyze_multi': 'analyze_multi',
+    '/extract_product_name': 'extract_product_name',
+}
+
+api = FastAPI(title='Product catalogue', docs_url=None, redoc_url=None, openapi_url=None)
+
+
+@api.on_event('shutdown')
+async def close_vlm_client():
+    await vlm_client.aclose()
+
+
+@api.middleware('http')
+async def request_metrics(request, call_next):
+    # Same Server-Timing header and http_* metrics the Flask hooks give the other routes
+    endpoint = ASYNC_ENDPOINTS.get(request.url.path)
+    if endpoint is None:
+        return await call_next(request)
+    started = time.perf_counter()
+    token = metrics.begin_request()
+    try:
+        response = await call_next(request)
+        duration = time.perf_counter() - started
+        response.headers['Server-Timing'] = server_timing(metrics.request_stages(), duration)
+        metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', duration, endpoint=endpoint)
+        return response
+    finally:
+        metrics.end_request(token)
+
+
+def offload(fn, *args):
+    """Run CPU-bound work on the stage executor, counting its stages toward this request."""
+    return asyncio.get_running_loop().run_in_executor(stage_executor, metrics.bind(fn), *args)
+
+
+def load_user(user_id):
+    with app.app_context():
+        return catalog.load_user(user_id)
+
+
+async def logged_in(request):
+    """Whether the Flask-Login session cookie on ``request`` belongs to an existing user."""
+    cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if not cookie or serializer is None:
+        return False
+    try:
+        session = serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return False
+    user_id = session.get('_user_id')
+    return user_id is not None and await run_in_threadpool(load_user, user_id) is not None
+
+
+def login_redirect(request):
+    return RedirectResponse(f"/login?next={quote(request.url.path)}", status_code=302)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@api.exception_handler(UploadTooLarge)
+async def upload_too_large(request, exc):
+    # Same answer as the Flask app's RequestEntityTooLarge handler
+    return JSONResponse({'error': 'Upload too large'}, status_code=413)
+
+
+async def read_body(request):
+    """Read the whole body, refusing more than MAX_CONTENT_LENGTH bytes like the Flask routes.
+
+    Checked against Content-Length up front and against the bytes actually
+    received, for chunked uploads. The body is cached on the request, so
+    ``form()`` and ``json()`` parse it afterwards without reading again.
+    """
+    limit = app.config['MAX_CONTENT_LENGTH']
+    declared = request.headers.get('content-length', '')
+    if limit is not None and declared.isdigit() and int(declared) > limit:
+        raise UploadTooLarge()
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise UploadTooLarge()
+        chunks.append(chunk)
+    # Where Request.body() keeps it
+    request._body = b''.join(chunks)
+    return request._body
+
+
+async def request_image(request):
+    """Bytes of the single image: multipart ``image``, raw ``image/*`` body or JSON ``image_data``."""
+    body = await read_body(request)
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        upload = (await request.form()).get('image')
+        return await upload.read() if upload else None
+    if content_type.startswith('image/'):
+        return body or None
+    try:
+        data = await request.json()
+        return decode_data_url(data['image_data'])
+    except Exception as e:
+        app.logger.error(f"Could not decode image data: {e}")
+        return None
+
+
+async def request_images(request):
+    await read_body(request)
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        return [await upload.read() for upload in (await request.form()).getlist('images')]
+    try:
+        images_data = (await request.json()).get('images', [])
+    except Exception:
+        return []
+    images = []
+    for i, image_data_url in enumerate(images_data):
+        try:
+            images.append(decode_data_url(image_data_url))
+        except Exception as e:
+            app.logger.error(f"Could not decode image {i}: {e}")
+    return images
+
+
+def prepare_analysis(namespace, image_data, image=None, trace=None):
+    """Decode (unless ``image`` is given), look up the cache and preprocess in one executor hop.
+
+    Returns ``(key, cached_result, payload)``. Only the small re-encoded
+    payload is kept while the VLM call is awaited, not the decoded frame,
+    which keeps memory flat with hundreds of requests in flight.
+    """
+    if image is None:
+        image = image_from_bytes(image_data)
+    key = cached = None
+    if catalog.analysis_cache is not None:
+        key, cached = cache_lookup(namespace, image_data, image)
+    payload = prepare_vlm_image(image_data, image, trace) if cached is None else None
+    return key, cached, payload
+
+
+async def ask_vlm(content):
+    with metrics.stage('vlm'):
+        ai_result = await vlm_client.achat(content, top_p=0.8, temperature=1)
+    app.logger.info(f"AI raw response: {ai_result}")
+    return ai_answer(parse_ai_json(ai_result))
+
+
+async def ask_vlm_full(payload):
+    with metrics.stage('vlm'):
+        ai_result = await vlm_client.amultimodal(full_analysis_content(payload))
+    app.logger.info(f"AI raw response: {ai_result}")
+    return full_answer(parse_ai_json(ai_result))
+
+
+async def answer_prepared(namespace, prepared, include_barcode=True):
+    """The VLM answer for a prepared frame, through the analysis cache like app.cached_analysis."""
+    return await cached_answer(namespace, prepared,
+                               lambda payload: ask_vlm(ai_analysis_content(payload, include_barcode)))
+
+
+async def cached_answer(namespace, prepared, ask):
+    """``await ask(payload)`` unless ``prepared`` was a cache hit, storing a fresh answer."""
+    key, cached, payload = prepared
+    if cached is not None:
+        return cached
+    result = await ask(payload)
+    if key is None:
+        return dict(result, cache='disabled')
+    await offload(cache_store, namespace, key, result)
+    return dict(result, cache='miss')
+
+
+def read_barcode(image_data):
+    return detect_barcode(image_from_bytes(image_data))
+
+
+async def run_combined_analysis(image_data):
+    timings = {}
+    started = time.perf_counter()
+    image = await offload(image_from_bytes, image_data)
+    timings['decode_ms'] = elapsed_ms(started)
+
+    def timed_barcode(frame):
+        barcode_started = time.perf_counter()
+        hit = detect_barcode(frame)
+        timings['barcode_ms'] = elapsed_ms(barcode_started)
+        return hit
+
+    barcode_task = offload(timed_barcode, image)
+    try:
+        hit = await asyncio.wait_for(asyncio.shield(barcode_task), app.config['ANALYZE_BARCODE_HEAD_START'])
+    except asyncio.TimeoutError:
+        hit = None
+    include_barcode = not hit
+
+    vlm_started = time.perf_counter()
+    namespace = 'analyze_ai' if include_barcode else 'analyze_ai_no_barcode'
+    trace = {}
+    prepared = await offload(prepare_analysis, namespace, image_data, image, trace)
+    del image
+    try:
+        result = await answer_prepared(namespace, prepared, include_barcode)
+    except VLMUnavailable as e:
+        result = barcode_only_result(e)
+    timings['vlm_ms'] = elapsed_ms(vlm_started)
+    if 'vlm_image' in trace:
+        timings['preprocess_ms'] = trace['vlm_image']['preprocess_ms']
+        result['vlm_image'] = trace['vlm_image']
+
+    apply_barcode(result, await barcode_task)
+    timings['total_ms'] = elapsed_ms(started)
+    result['timings'] = timings
+    return result
+
+
+async def run_multi_analysis(images_data):
+    timings = {}
+    started = time.perf_counter()
+    images = await asyncio.gather(*[offload(image_from_bytes, image_data) for image_data in images_data])
+    timings['decode_ms'] = elapsed_ms(started)
+
+    barcode_tasks = [offload(detect_barcode, image) for image in images]
+
+    vlm_started = time.perf_counter()
+    vlm_count = app.config['ANALYZE_MAX_VLM_IMAGES']
+    frames = list(zip(images_data, images))[:vlm_count]
+    degraded = False
+    if app.config['ANALYZE_MULTI_MODE'] == 'fanout':
+        prepared = await asyncio.gather(*[
+            offload(prepare_analysis, 'analyze_ai', image_data, image) for image_data, image in frames
+        ])
+        del images, frames
+
+        async def analyze_frame(frame):
+            try:
+                return await answer_prepared('analyze_ai', frame)
+            except VLMUnavailable as e:
+                app.logger.warning(f"VLM unavailable for one frame: {e}")
+                return None
+        answers = await asyncio.gather(*[analyze_frame(frame) for frame in prepared])
+        degraded = not any(answers)
+    else:
+        payloads = await asyncio.gather(*[offload(prepare_vlm_image, image_data, image) for image_data, image in frames])
+        del images, frames
+        try:
+            answers = [await ask_vlm(multi_analysis_content(payloads))]
+        except VLMUnavailable as e:
+            app.logger.warning(f"VLM unavailable, falling back to barcode-only result: {e}")
+            metrics.inc('vlm_fallbacks_total')
+            answers = []
+            degraded = True
+    timings['vlm_ms'] = elapsed_ms(vlm_started)
+
+    result = fused_result(await asyncio.gather(*barcode_tasks), answers, degraded)
+    timings['total_ms'] = elapsed_ms(started)
+    result['timings'] = timings
+    return result
+
+
+@api.post('/detect_barcode')
+async def detect_barcode_route(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    image_data = await request_image(request)
+    if not image_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    try:
+        image = await offload(image_from_bytes, image_data)
+        hit = await offload(detect_barcode, image)
+        if hit:
+            return {'barcode': hit['barcode'], 'barcode_stage': hit['stage']}
+        return {'barcode': 'N/A', 'barcode_stage': None}
+    except Exception as e:
+        app.logger.error(f"Error during barcode detection: {e}")
+        return JSONResponse({'error': 'Failed to process image for barcode detection'}, status_code=500)
+
+
+@api.post('/analyze')
+async def analyze(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    image_data = await request_image(request)
+    if not image_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    try:
+        return await run_combined_analysis(image_data)
+    except AnalysisError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except Exception as e:
+        app.logger.error(f"Error during combined analysis: {e}")
+        return JSONResponse({'error': 'Failed to analyze'}, status_code=500)
+
+
+@api.post('/analyze_multi')
+async def analyze_multi(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    images_data = await request_images(request)
+    if not images_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    if len(images_data) > app.config['ANALYZE_MAX_IMAGES']:
+        return JSONResponse({'error': f"At most {app.config['ANALYZE_MAX_IMAGES']} images per product"},
+                            status_code=400)
+    try:
+        return await run_multi_analysis(images_data)
+    except AnalysisError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except Exception as e:
+        app.logger.error(f"Error during multi-image analysis: {e}")
+        return JSONResponse({'error': 'Failed to analyze'}, status_code=500)
+
+
+@api.post('/analyze_ai')
+async def analyze_ai(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    image_data = await request_image(request)
+    if not image_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    try:
+        try:
+            prepared = await offload(prepare_analysis, 'analyze_ai', image_data)
+            result = await answer_prepared('analyze_ai', prepared)
+        except VLMUnavailable as e:
+            result = barcode_only_result(e)
+        if 'barcode' not in result:
+            hit = await offload(read_barcode, image_data)
+            result['barcode'] = hit['barcode'] if hit else 'not visible'
+        return result
+    except AnalysisError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except Exception as e:
+        app.logger.error(f"Error during AI analysis: {e}")
+        return JSONResponse({'error': 'Failed to analyze'}, status_code=500)
+
+
+@api.post('/analyze_full')
+async def analyze_full(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    image_data = await request_image(request)
+    if not image_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    try:
+        image = await offload(image_from_bytes, image_data)
+        barcode_task = offload(detect_barcode, image)
+        try:
+            prepared = await offload(prepare_analysis, 'analyze_full', image_data, image)
+            del image
+            result = await cached_answer('analyze_full', prepared, ask_vlm_full)
+        except VLMUnavailable as e:
+            result = barcode_only_result(e)
+        hit = await barcode_task
+        # Use AI barcode if pyzbar failed
+        result['barcode'] = (hit and hit['barcode']) or result.get('barcode') or 'N/A'
+        result['barcode_stage'] = hit['stage'] if hit else None
+        return result
+    except AnalysisError as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    except Exception as e:
+        app.logger.error(f"Error during full analysis: {e}")
+        return JSONResponse({'error': 'Failed to analyze'}, status_code=500)
+
+
+def prepare_frame(image_data):
+    return prepare_vlm_image(image_data, image_from_bytes(image_data))
+
+
+@api.post('/extract_product_name')
+async def extract_product_name(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    image_data = await request_image(request)
+    if not image_data:
+        return JSONResponse({'error': 'No image data'}, status_code=400)
+    try:
+        payload = await offload(prepare_frame, image_data)
+        with metrics.stage('vlm'):
+            product_name = await vlm_client.amultimodal(product_name_content(payload))
+        return {'product_name': product_name}
+    except VLMUnavailable as e:
+        app.logger.error(f"VLM unavailable for product name extraction: {e}")
+        return JSONResponse({'error': 'AI analysis is temporarily unavailable'}, status_code=503)
+    except Exception as e:
+        app.logger.error(f"Error during product name extraction: {e}")
+        return JSONResponse({'error': 'Failed to extract product name'}, status_code=500)
+
+
+async def wait_for_change(after, timeout, tick=0.25):
+    """change_notifier.wait for coroutines: checks the version every ``tick`` seconds instead of blocking."""
+    deadline = time.monotonic() + timeout
+    while True:
+        version = change_notifier.version
+        remaining = deadline - time.monotonic()
+        if (version is not None and version > after) or remaining <= 0:
+            return version
+        await asyncio.sleep(min(tick, remaining))
+
+
+@api.get('/events')
+async def catalog_events(request: Request):
+    if not await logged_in(request):
+        return login_redirect(request)
+    try:
+        since = parse_event_id(request.headers.get('last-event-id') or request.query_params.get('since'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    keepalive = app.config['CHANGE_FEED_KEEPALIVE']
+    closes_at = time.monotonic() + app.config['CHANGE_FEED_MAX_STREAM_SECONDS']
+
+    async def stream():
+        yield 'retry: 2000\n\n'
+        messages, last = await run_in_threadpool(open_change_feed, since)
+        for message in messages:
+            yield message
+        with change_notifier.watching():
+            while time.monotonic() < closes_at:
+                version = await wait_for_change(last, min(keepalive, closes_at - time.monotonic()))
+                messages, last = await run_in_threadpool(read_change_feed, last)
+                if not messages and version is not None and version > last:
+                    last = version
+                yield ''.join(messages) if messages else ': keep-alive\n\n'
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Everything else is served by the Flask app, on the threadpool
+api.mount('/', WSGIMiddleware(app))
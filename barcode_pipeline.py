@@ -0,0 +1,167 @@
+import time
+
+import cv2
+from pyzbar.pyzbar import decode
+
+DEFAULT_STAGES = ('downscaled', 'enhanced', 'rotated', 'roi')
+
+# Milliseconds each stage may keep trying new variants before the ladder moves on
+DEFAULT_BUDGETS_MS = {
+    'downscaled': 150,
+    'enhanced': 200,
+    'rotated': 300,
+    'roi': 400,
+}
+
+ROTATION_ANGLES = (15, -15, 30, -30, 45, -45, 60, -60, 75, -75)
+GTIN_SYMBOLOGIES = ('EAN13', 'EAN8', 'UPCA')
+
+
+def gtin_checksum_ok(digits):
+    if not digits.isdigit() or len(digits) not in (8, 12, 13, 14):
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits[:-1])):
+        total += int(digit) * (3 if i % 2 == 0 else 1)
+    return (10 - total % 10) % 10 == int(digits[-1])
+
+
+def is_confident(symbol):
+    try:
+        value = symbol.data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    if not value.strip():
+        return False
+    if symbol.type in GTIN_SYMBOLOGIES and not gtin_checksum_ok(value):
+        return False
+    return getattr(symbol, 'quality', 1) > 0
+
+
+def downscale(gray, max_edge):
+    height, width = gray.shape[:2]
+    scale = max_edge / float(max(height, width))
+    if scale >= 1:
+        return gray
+    return cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def rotate(gray, angle):
+    height, width = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(height * sin + width * cos)
+    new_height = int(height * cos + width * sin)
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+    return cv2.warpAffine(gray, matrix, (new_width, new_height), borderValue=255)
+
+
+def barcode_regions(gray, max_regions=4, work_edge=800):
+    """Candidate barcode boxes (x, y, w, h, angle) in ``gray`` coordinates, largest first.
+
+    Dense bar patterns are the strongest gradient areas on a label, so the
+    blurred gradient magnitude is thresholded and closed into blobs. ``angle``
+    is the rotation that brings the blob's long side horizontal.
+    """
+    small = downscale(gray, work_edge)
+    scale = gray.shape[1] / float(small.shape[1])
+    grad_x = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=-1)
+    grad_y = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=-1)
+    gradient = cv2.convertScaleAbs(cv2.magnitude(grad_x, grad_y), alpha=0.25)
+    blurred = cv2.blur(gradient, (9, 9))
+    # Otsu alone collapses on sensor noise, so never go below a level well
+    # above the background gradient
+    otsu, _ = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mean, std = cv2.meanStdDev(blurred)
+    level = max(otsu, min(float(mean[0][0] + 2.5 * std[0][0]), 0.5 * float(blurred.max())))
+    _, thresh = cv2.threshold(blurred, level, 255, cv2.THRESH_BINARY)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    closed = cv2.dilate(cv2.erode(closed, None, iterations=3), None, iterations=3)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:max_regions]
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < 400 or w * h > 0.6 * small.shape[0] * small.shape[1]:
+            continue
+        (_, _), (rect_w, rect_h), angle = cv2.minAreaRect(contour)
+        if rect_w < rect_h:
+            angle -= 90
+        # Pad so the quiet zone around the bars is kept
+        pad_x, pad_y = int(w * 0.15) + 4, int(h * 0.15) + 4
+        x0 = max(int((x - pad_x) * scale), 0)
+        y0 = max(int((y - pad_y) * scale), 0)
+        x1 = min(int((x + w + pad_x) * scale), gray.shape[1])
+        y1 = min(int((y + h + pad_y) * scale), gray.shape[0])
+        regions.append((x0, y0, x1 - x0, y1 - y0, angle))
+    return regions
+
+
+class BarcodeDecoder:
+    """Ordered decoding ladder that stops at the first confident pyzbar hit.
+
+    Cheap strategies run first; later ones trade time for recall. Each stage
+    keeps trying variants until it hits or its time budget is used up.
+    """
+
+    def __init__(self, stages=DEFAULT_STAGES, budgets_ms=None, max_edge=1024):
+        self.stages = tuple(stages)
+        self.budgets_ms = dict(DEFAULT_BUDGETS_MS)
+        if budgets_ms:
+            self.budgets_ms.update(budgets_ms)
+        self.max_edge = max_edge
+
+    def decode(self, image):
+        """Return ``{'barcode', 'type', 'stage', 'elapsed_ms'}`` or None."""
+        started = time.perf_counter()
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small = downscale(gray, self.max_edge)
+        for stage in self.stages:
+            deadline = time.perf_counter() + self.budgets_ms.get(stage, 0) / 1000.0
+            variants = getattr(self, f'_{stage}_variants')(gray, small)
+            for variant in variants:
+                symbol = self._first_confident(variant)
+                if symbol is not None:
+                    return {
+                        'barcode': symbol.data.decode('utf-8'),
+                        'type': symbol.type,
+                        'stage': stage,
+                        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+                    }
+                if time.perf_counter() > deadline:
+                    break
+        return None
+
+    def _first_confident(self, image):
+        for symbol in decode(image):
+            if is_confident(symbol):
+                return symbol
+        return None
+
+    def _downscaled_variants(self, gray, small):
+        yield small
+
+    def _enhanced_variants(self, gray, small):
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        equalized = clahe.apply(small)
+        yield equalized
+        yield cv2.adaptiveThreshold(equalized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                    cv2.THRESH_BINARY, 31, 10)
+        # Mild unsharp mask for motion/focus blur
+        blurred = cv2.GaussianBlur(small, (0, 0), 3)
+        yield cv2.addWeighted(small, 1.8, blurred, -0.8, 0)
+
+    def _rotated_variants(self, gray, small):
+        for angle in ROTATION_ANGLES:
+            yield rotate(small, angle)
+
+    def _roi_variants(self, gray, small):
+        for x, y, w, h, angle in barcode_regions(gray):
+            crop = gray[y:y + h, x:x + w]
+            yield crop
+            if abs(angle) > 2:
+                yield rotate(crop, angle)
+                yield rotate(crop, -angle)
@@ -0,0 +1,90 @@
+"""Check that `import app` stays cheap.
+
+Imports the app in fresh interpreters and fails if the best of ``--runs``
+takes longer than ``--budget-ms``, leaves the process over ``--budget-mb``
+of RSS, or loads any of app.LAZY_IMPORTS. The slowest direct imports of
+app.py are listed from ``python -X importtime`` to show what to defer next.
+
+    python -m bench.import_budget
+    python -m bench.import_budget --budget-ms 800 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'ms': round(elapsed * 1000, 1),
+    'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    'eager': sorted(name for name in app.LAZY_IMPORTS if name in sys.modules),
+}))
+"""
+
+
+def probe():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    # The app may print warnings of its own before the result
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    """``(cumulative_ms, module)`` for the ``top`` slowest modules app.py imports directly."""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    entries = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        entries.append((len(name) - len(name.lstrip()), int(cumulative), name.strip()))
+    # Children are listed before their parent, one indent level deeper
+    app_index = max(i for i, (_, _, name) in enumerate(entries) if name == 'app')
+    depth = entries[app_index][0]
+    children = []
+    for level, cumulative, name in reversed(entries[:app_index]):
+        if level <= depth:
+            break
+        if level == depth + 2:
+            children.append((round(cumulative / 1000.0, 1), name))
+    return sorted(children, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if importing the app gets slow or heavy.')
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--budget-mb', type=float, default=96)
+    parser.add_argument('--runs', type=int, default=3, help='best of this many fresh interpreters')
+    parser.add_argument('--top', type=int, default=10, help='slowest direct imports to list')
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    best = min(results, key=lambda result: result['ms'])
+    print(f"import app: {best['ms']} ms (best of {args.runs}), {best['rss_mb']} MB RSS")
+    print('Slowest direct imports:')
+    for ms, name in slowest_imports(args.top):
+        print(f'  {ms:>8} ms  {name}')
+
+    failures = []
+    if best['ms'] > args.budget_ms:
+        failures.append(f"import took {best['ms']} ms, budget {args.budget_ms} ms")
+    if best['rss_mb'] > args.budget_mb:
+        failures.append(f"RSS after import {best['rss_mb']} MB, budget {args.budget_mb} MB")
+    if best['eager']:
+        failures.append(f"imported at startup but meant to be lazy: {', '.join(best['eager'])}")
+    for failure in failures:
+        print('FAIL:', failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""Offline load test for the main routes against the local VLM stub.
+
+Starts bench/stub_vlm.py in-process and the app (bench/serve.py) as a
+subprocess on a scratch database, then drives each scenario at each
+concurrency level and reports throughput, p50/p95/p99 latency, errors and
+the server's RSS.
+
+    python -m bench.run --requests 200 --concurrency 1,8 --latency-ms 800
+    python -m bench.run --save-baseline          # record bench/baseline.json
+    python -m bench.run                          # compare against it
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from bench import stub_vlm
+from bench.synthetic import sample_set
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+SCENARIOS = ('detect_barcode', 'analyze_ai', 'add_product', 'get_products', 'export_csv')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Current resident set size of ``pid`` (Linux only), else None."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        return None
+    return None
+
+
+class Server:
+    def __init__(self, stub_url, cache):
+        self.workdir = tempfile.mkdtemp(prefix='bench-')
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        env = dict(
+            os.environ,
+            DATABASE_URL='sqlite:///' + os.path.join(self.workdir, 'bench.db'),
+            ANALYSIS_CACHE_ENABLED='1' if cache else '0',
+            ANALYSIS_CACHE_PATH=os.path.join(self.workdir, 'analysis_cache.db'),
+            IMAGE_STORE_FOLDER=os.path.join(self.workdir, 'media'),
+            DASHSCOPE_API_KEY='bench',
+            VLM_BASE_URL=f'{stub_url}/compatible-mode/v1',
+            DASHSCOPE_BASE_URL=f'{stub_url}/api/v1',
+            BENCH_PORT=str(self.port),
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, 'serve.py')],
+            cwd=self.workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        if self.process.stdout.readline().strip() != 'ready':
+            raise RuntimeError('Benchmark server failed to start')
+        self._local = threading.local()
+
+    def session(self):
+        """A logged-in session per worker thread, so connections are reused like a real client."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.post(f'{self.base_url}/login', data={'username': 'bench', 'password': 'bench'})
+            self._local.session = session
+        return session
+
+    def stop(self):
+        """Stop the server and return its peak RSS in MB."""
+        self.process.terminate()
+        self.process.wait()
+        peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return round(peak_kb / (1024.0 * 1024 if platform.system() == 'Darwin' else 1024.0), 1)
+
+
+def make_scenarios(server, samples):
+    def image(i):
+        return samples[i % len(samples)]
+
+    def detect_barcode(i):
+        code, _, _, jpeg = image(i)
+        response = server.session().post(f'{server.base_url}/detect_barcode', data=jpeg,
+                                         headers={'Content-Type': 'image/jpeg'})
+        found = response.ok and response.json().get('barcode', '').lstrip('0') == code.lstrip('0')
+        return response.ok, found
+
+    def analyze_ai(i):
+        _, _, _, jpeg = image(i)
+        response = server.session().post(f'{server.base_url}/analyze_ai', data=jpeg,
+                                         headers={'Content-Type': 'image/jpeg'})
+        return response.ok and 'error' not in response.json(), None
+
+    def add_product(i):
+        code, _, _, jpeg = image(i)
+        response = server.session().post(
+            f'{server.base_url}/add_product',
+            data={'name': f'Bench product {i}', 'brand': 'Stubco', 'barcode': code, 'price': '1.99', 'quantity': '1'},
+            files={'images': ('image.jpg', jpeg, 'image/jpeg')}
+        )
+        return response.ok and response.json().get('success', False), None
+
+    def get_products(i):
+        response = server.session().get(f'{server.base_url}/get_products')
+        return response.ok, None
+
+    def export_csv(i):
+        response = server.session().get(f'{server.base_url}/export_csv')
+        return response.ok and len(response.content) > 0, None
+
+    return {
+        'detect_barcode': detect_barcode,
+        'analyze_ai': analyze_ai,
+        'add_product': add_product,
+        'get_products': get_products,
+        'export_csv': export_csv,
+    }
+
+
+def run_scenario(server, fn, count, concurrency):
+    latencies = []
+    errors = 0
+    hits = []
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ok, found = fn(i)
+        except requests.RequestException:
+            ok, found = False, None
+        return time.perf_counter() - started, ok, found
+
+    started = time.perf_counter()
+    # Log each worker in before it takes requests so the password check is not timed
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=server.session) as executor:
+        for latency, ok, found in executor.map(one, range(count)):
+            latencies.append(latency)
+            errors += 0 if ok else 1
+            if found is not None:
+                hits.append(found)
+    wall = time.perf_counter() - started
+
+    result = {
+        'requests': count,
+        'concurrency': concurrency,
+        'throughput_rps': round(count / wall, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'errors': errors,
+        'rss_mb': rss_mb(server.process.pid),
+    }
+    if hits:
+        result['decode_rate'] = round(sum(hits) / float(len(hits)), 3)
+    return result
+
+
+def compare(results, baseline):
+    print('\nAgainst baseline from', baseline.get('created', 'unknown'))
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    for result in results['results']:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if not before:
+            continue
+        deltas = []
+        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if before[key]:
+                deltas.append(f'{key} {100.0 * (result[key] - before[key]) / before[key]:+.1f}%')
+        print(f"  {result['scenario']:<15} c={result['concurrency']:<3} " + '  '.join(deltas))
+    if baseline.get('peak_rss_mb'):
+        change = 100.0 * (results['peak_rss_mb'] - baseline['peak_rss_mb']) / baseline['peak_rss_mb']
+        print(f'  peak RSS {change:+.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test against a local VLM stub.')
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario and concurrency level')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated concurrency levels')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--images', type=int, default=24, help='distinct synthetic images to cycle through')
+    parser.add_argument('--latency-ms', type=float, default=500, help='stub VLM latency')
+    parser.add_argument('--jitter-ms', type=float, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of stub VLM calls that 503')
+    parser.add_argument('--cache', action='store_true', help='leave the analysis cache on')
+    parser.add_argument('--output', help='write results JSON here (default bench/results/<timestamp>.json)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    print(f'Rendering {args.images} synthetic product images...')
+    samples = sample_set(args.images)
+
+    stub, _ = stub_vlm.start(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                             error_rate=args.error_rate, seed=0)
+    server = Server(f'http://127.0.0.1:{stub.server_address[1]}', args.cache)
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'baseline', 'save_baseline')},
+        'results': [],
+    }
+    try:
+        functions = make_scenarios(server, samples)
+        print(f"{'scenario':<15} {'c':>3} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} {'rss':>7}")
+        for name in scenarios:
+            for concurrency in levels:
+                result = dict(run_scenario(server, functions[name], args.requests, concurrency), scenario=name)
+                results['results'].append(result)
+                line = (f"{name:<15} {concurrency:>3} {result['throughput_rps']:>8} {result['p50_ms']:>8} "
+                        f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['errors']:>5} {result['rss_mb'] or '-':>7}")
+                if 'decode_rate' in result:
+                    line += f"  decoded {result['decode_rate']:.0%}"
+                print(line)
+    finally:
+        results['peak_rss_mb'] = server.stop()
+        stub.shutdown()
+    print(f"peak server RSS {results['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to', output)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Baseline saved to', args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
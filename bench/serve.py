@@ -0,0 +1,25 @@
+"""Start the app against a scratch database for benchmarking.
+
+Run by bench/run.py as a subprocess (so its peak RSS can be measured); the
+environment selects the database, the stub VLM URLs and the port.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+from app import app, db, User
+
+with app.app_context():
+    db.create_all()
+    if not User.query.filter_by(username='bench').first():
+        user = User(username='bench')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+
+server = make_server('127.0.0.1', int(os.environ['BENCH_PORT']), app, threaded=True)
+print('ready', flush=True)
+server.serve_forever()
@@ -0,0 +1,120 @@
+"""Local stand-in for qwen-vl speaking both APIs the app uses.
+
+Serves the OpenAI-compatible ``/compatible-mode/v1/chat/completions`` and
+DashScope's ``/api/v1/services/aigc/multimodal-generation/generation`` with
+canned answers after a configurable delay, failing a configurable share of
+requests with 503s.
+
+    python -m bench.stub_vlm --port 8089 --latency-ms 800 --jitter-ms 200 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = {
+    'product_name': 'Benchmark Soap Bar',
+    'brand_name': 'Stubco',
+    'barcode_number': 'not visible',
+    'object_count': 1,
+}
+
+
+class StubSettings:
+    def __init__(self, latency_ms=500, jitter_ms=0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_outcome(self):
+        """Return ``(delay_seconds, fail)`` for the next request."""
+        with self._lock:
+            self.requests += 1
+            delay = max(self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000.0
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+
+def make_handler(settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; with Nagle on, keep-alive
+        # responses stall ~40 ms on the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            delay, fail = settings.next_outcome()
+            time.sleep(delay)
+            if fail:
+                self._send(503, {'code': 'ServiceUnavailable', 'message': 'stub failure',
+                                 'error': {'message': 'stub failure'}})
+            elif self.path.endswith('/chat/completions'):
+                self._send(200, {
+                    'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'stub',
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': json.dumps(ANSWER)}}],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+                })
+            elif self.path.endswith('/multimodal-generation/generation'):
+                text = json.dumps({'name': ANSWER['product_name'], 'brand': ANSWER['brand_name'], 'barcode': None})
+                self._send(200, {
+                    'request_id': 'stub',
+                    'output': {'choices': [{'finish_reason': 'stop',
+                                            'message': {'role': 'assistant', 'content': [{'text': text}]}}]},
+                    'usage': {},
+                })
+            else:
+                self._send(404, {'message': 'unknown path'})
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 stalls connects when hundreds of calls arrive at once
+    request_queue_size = 1024
+
+
+def start(port=0, **settings):
+    """Run the stub on a background thread; returns ``(server, settings)``."""
+    settings = StubSettings(**settings)
+    server = StubServer(('127.0.0.1', port), make_handler(settings))
+    threading.Thread(target=server.serve_forever, name='stub-vlm', daemon=True).start()
+    return server, settings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server, _ = start(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      error_rate=args.error_rate)
+    print(f'Stub VLM listening on http://127.0.0.1:{server.server_address[1]}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
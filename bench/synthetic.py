@@ -0,0 +1,103 @@
+"""Synthetic product photos with rendered EAN-13 / UPC-A barcodes."""
+import random
+
+import cv2
+import numpy as np
+
+L_CODES = ('0001101', '0011001', '0010011', '0111101', '0100011',
+           '0110001', '0101111', '0111011', '0110111', '0001011')
+G_CODES = ('0100111', '0110011', '0011011', '0100001', '0011101',
+           '0111001', '0000101', '0010001', '0001001', '0010111')
+R_CODES = ('1110010', '1100110', '1101100', '1000010', '1011100',
+           '1001110', '1010000', '1000100', '1001000', '1110100')
+# L/G parity of the left half, selected by the first EAN-13 digit
+PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+          'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+
+def check_digit(digits):
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return str((10 - total % 10) % 10)
+
+
+def random_gtin(rng, symbology='EAN13'):
+    body = ''.join(str(rng.randrange(10)) for _ in range(11 if symbology == 'UPCA' else 12))
+    return body + check_digit(body)
+
+
+def ean13_modules(code):
+    """Bar pattern of a 13-digit code as a '0'/'1' string (1 = bar)."""
+    digits = [int(c) for c in code]
+    bits = '101'
+    for i, digit in enumerate(digits[1:7]):
+        bits += (L_CODES if PARITY[digits[0]][i] == 'L' else G_CODES)[digit]
+    bits += '01010'
+    for digit in digits[7:]:
+        bits += R_CODES[digit]
+    return bits + '101'
+
+
+def barcode_label(code, module=3, height=None):
+    """White label with the bars and quiet zones, as a grayscale array."""
+    if len(code) == 12:
+        # UPC-A is EAN-13 with a leading zero
+        code = '0' + code
+    height = height or module * 40
+    row = np.array([0 if bit == '1' else 255 for bit in ean13_modules(code)], np.uint8)
+    row = np.repeat(row, module)
+    quiet = np.full(11 * module, 255, np.uint8)
+    row = np.concatenate([quiet, row, quiet])
+    label = np.full((height + 8 * module, row.size), 255, np.uint8)
+    label[4 * module:4 * module + height] = row
+    return label
+
+
+def product_photo(code, module=3, angle=0.0, blur=0.0, noise=0.0, size=(960, 1280), seed=0):
+    """BGR photo of a box with a printed name and a barcode label on it."""
+    rng = np.random.default_rng(seed)
+    height, width = size
+    background = rng.integers(90, 200, 3).tolist()
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = background
+
+    box_color = rng.integers(30, 230, 3).tolist()
+    x0, y0 = width // 6, height // 8
+    x1, y1 = width - width // 6, height - height // 8
+    cv2.rectangle(image, (x0, y0), (x1, y1), box_color, -1)
+    cv2.putText(image, f'PRODUCT {code[-4:]}', (x0 + 30, y0 + 80), cv2.FONT_HERSHEY_SIMPLEX, 2.0,
+                (255, 255, 255), 4)
+
+    label = cv2.cvtColor(barcode_label(code, module), cv2.COLOR_GRAY2BGR)
+    label_h, label_w = label.shape[:2]
+    if label_w < x1 - x0 and label_h < y1 - y0:
+        ly = y1 - label_h - 40
+        lx = x0 + (x1 - x0 - label_w) // 2
+        image[ly:ly + label_h, lx:lx + label_w] = label
+
+    if angle:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height), borderValue=background)
+    if blur:
+        image = cv2.GaussianBlur(image, (0, 0), blur)
+    if noise:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image
+
+
+def sample_set(count, seed=0, size=(960, 1280)):
+    """``count`` (code, symbology, params, jpeg_bytes) tuples across sizes, angles and blur."""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        symbology = 'UPCA' if i % 4 == 3 else 'EAN13'
+        code = random_gtin(rng, symbology)
+        params = {
+            'module': rng.choice((2, 3, 4)),
+            'angle': rng.choice((0, 0, 5, -10, 25, -40, 90)),
+            'blur': rng.choice((0, 0, 0.8, 1.5)),
+            'noise': rng.choice((0, 4, 8)),
+        }
+        image = product_photo(code, size=size, seed=seed + i, **params)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        samples.append((code, symbology, params, encoded.tobytes()))
+    return samples
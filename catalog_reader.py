@@ -0,0 +1,184 @@
+import os
+import re
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+IMPORT_FIELDS = ('id', 'name', 'brand', 'barcode', 'price', 'quantity', 'timestamp')
+
+# Header spellings seen in our own exports and in supplier price lists
+COLUMN_ALIASES = {
+    'id': 'id',
+    'product_id': 'id',
+    'name': 'name',
+    'product_name': 'name',
+    'brand': 'brand',
+    'brand_name': 'brand',
+    'barcode': 'barcode',
+    'ean': 'barcode',
+    'gtin': 'barcode',
+    'upc': 'barcode',
+    'price': 'price',
+    'unit_price': 'price',
+    'quantity': 'quantity',
+    'qty': 'quantity',
+    'timestamp': 'timestamp',
+}
+
+
+# Price layouts, tried in order after currency symbols and spaces are dropped.
+# A single comma or point with one to three digits before it (not just 0)
+# and exactly three after ("1,500", "1.500") could mark thousands or
+# decimals, so it is rejected rather than guessed.
+AMBIGUOUS_PRICE = re.compile(r'-?[1-9]\d{0,2}[.,]\d{3}')
+PRICE_FORMATS = (
+    # 1234.56
+    (re.compile(r'-?\d+(\.\d+)?'), lambda text: text),
+    # 1,234.56
+    (re.compile(r'-?[1-9]\d{0,2}(,\d{3})+(\.\d+)?'), lambda text: text.replace(',', '')),
+    # 1.234,56
+    (re.compile(r'-?[1-9]\d{0,2}(\.\d{3})+(,\d+)?'), lambda text: text.replace('.', '').replace(',', '.')),
+    # 12,50
+    (re.compile(r'-?\d+,\d+'), lambda text: text.replace(',', '.')),
+)
+
+
+def parse_price(text):
+    """A price cell as a float, None if it is not a price, or 'ambiguous'."""
+    text = re.sub(r'[^\d.,\-]', '', str(text))
+    if AMBIGUOUS_PRICE.fullmatch(text):
+        return 'ambiguous'
+    for pattern, normalize in PRICE_FORMATS:
+        if pattern.fullmatch(text):
+            return float(normalize(text))
+    return None
+
+
+def canonical_column(header):
+    return COLUMN_ALIASES.get(str(header).strip().lower().replace(' ', '_'))
+
+
+def cell_text(value):
+    """Render an XLSX cell the way it would appear in a CSV export."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Numeric barcodes and quantities come back from Excel as floats
+        return str(int(value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def read_catalog_chunks(source, filename, chunk_size=5000):
+    """Yield DataFrames of raw cell text, ``chunk_size`` rows at a time.
+
+    Columns are renamed to Product fields (unknown ones are dropped) and a
+    ``row`` column holds the 1-based spreadsheet row, header included, so
+    rejected rows can be reported in terms the user can find.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        chunks = _xlsx_chunks(source, chunk_size)
+    elif extension in ('.csv', '.txt'):
+        chunks = pd.read_csv(source, dtype=str, keep_default_na=False, encoding='utf-8-sig',
+                             chunksize=chunk_size)
+    else:
+        raise ValueError('Unsupported file type, expected .csv or .xlsx')
+
+    first_row = 2
+    for chunk in chunks:
+        columns = {}
+        for header in chunk.columns:
+            field = canonical_column(header)
+            if field and field not in columns.values():
+                columns[header] = field
+        frame = chunk[list(columns)].rename(columns=columns)
+        frame.insert(0, 'row', range(first_row, first_row + len(frame)))
+        first_row += len(frame)
+        yield frame
+
+
+def _xlsx_chunks(source, chunk_size):
+    # read_only streams rows instead of building the whole sheet in memory
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [cell_text(value) for value in header]
+        batch = []
+        for values in rows:
+            batch.append([cell_text(value) for value in values[:len(header)]])
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def clean_catalog_chunk(frame, key):
+    """Validate and coerce a raw chunk column-wise.
+
+    Returns ``(clean, rejected)``: ``clean`` has typed columns for the fields
+    present in the file, ``rejected`` has ``row`` and ``error`` columns.
+    Columns that are present must be valid on every row; an empty brand
+    clears it, an empty timestamp means "now" and an empty ID a new product.
+    """
+    frame = frame.copy()
+    errors = pd.Series('', index=frame.index)
+
+    def reject(mask, message):
+        errors[mask & (errors == '')] = message
+
+    for field in ('id', 'name', 'brand', 'barcode'):
+        if field in frame:
+            frame[field] = frame[field].astype(str).str.strip()
+
+    if key not in frame:
+        raise ValueError(f'File has no {key} column')
+    if key == 'id':
+        # Rows without an ID are new products and get one from the sequence
+        frame['id'] = frame['id'].where(frame['id'] != '', None)
+    else:
+        reject(frame[key] == '', f'Missing {key}')
+    if 'name' in frame:
+        reject(frame['name'] == '', 'Missing name')
+    if 'barcode' in frame:
+        # Sheets saved with a numeric barcode column turn codes into floats
+        frame['barcode'] = frame['barcode'].str.replace(r'\.0$', '', regex=True)
+        reject(frame['barcode'] == '', 'Missing barcode')
+        reject(frame['barcode'].str.fullmatch(r'\d+(\.\d+)?[eE][+-]?\d+'),
+               'Barcode in scientific notation, digits were lost')
+    if 'brand' in frame:
+        frame['brand'] = frame['brand'].where(frame['brand'] != '', None)
+    if 'price' in frame:
+        # Tolerate currency symbols, thousands separators and decimal commas
+        parsed = frame['price'].map(parse_price)
+        ambiguous = parsed == 'ambiguous'
+        reject(ambiguous, 'Ambiguous price, the separator could mark thousands or decimals')
+        price = pd.to_numeric(parsed.where(~ambiguous, None), errors='coerce')
+        reject(price.isna() | (price < 0), 'Invalid price')
+        frame['price'] = price
+    if 'quantity' in frame:
+        quantity = pd.to_numeric(frame['quantity'], errors='coerce')
+        reject(quantity.isna() | (quantity < 0) | (quantity % 1 != 0), 'Invalid quantity')
+        frame['quantity'] = quantity.fillna(0).astype('int64')
+    if 'timestamp' in frame:
+        raw = frame['timestamp'].astype(str).str.strip()
+        timestamp = pd.to_datetime(raw.where(raw != '', None), errors='coerce', format='mixed')
+        reject(timestamp.isna() & (raw != ''), 'Invalid timestamp')
+        frame['timestamp'] = timestamp
+
+    valid = errors == ''
+    # Within a file the last row for a key wins
+    superseded = valid & frame[key].notna() & frame[key].duplicated(keep='last')
+    reject(superseded, f'Superseded by a later row with the same {key}')
+    valid &= ~superseded
+
+    rejected = pd.DataFrame({'row': frame.loc[~valid, 'row'], 'error': errors[~valid]})
+    return frame[valid], rejected
@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+RESET = 'reset'
+# Too many products changed at once to list; clients fetch the listing again
+RELOAD = 'reload'
+
+
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class ChangeNotifier:
+    """Wakes /events streams when the catalogue version moves.
+
+    While anyone is watching, a background thread reads the version with
+    ``read_version`` every ``poll_interval`` seconds, which picks up writes
+    from other worker processes; ``notify`` makes it read straight away
+    after a commit in this process.
+    """
+
+    def __init__(self, read_version, poll_interval=1.0):
+        self.read_version = read_version
+        self.poll_interval = poll_interval
+        self.version = None
+        self._watchers = 0
+        self._thread = None
+        self._wake = threading.Event()
+        self._changed = threading.Condition()
+
+    def notify(self):
+        self._wake.set()
+
+    @contextmanager
+    def watching(self):
+        """Keep ``version`` current for as long as the block runs."""
+        with self._changed:
+            self._watchers += 1
+            if self._thread is None:
+                # Started on demand, so a pre-forking master never owns it
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+        try:
+            yield self
+        finally:
+            with self._changed:
+                self._watchers -= 1
+
+    def wait(self, after, timeout):
+        """Block until the version moves past ``after`` or ``timeout`` expires; return it.
+
+        Only meaningful inside ``watching()``.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.version is None or self.version <= after:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return self.version
+
+    def _run(self):
+        while True:
+            with self._changed:
+                if not self._watchers:
+                    self._thread = None
+                    return
+            self._wake.clear()
+            try:
+                version = self.read_version()
+            except Exception:
+                version = None  # read_version logs; try again next round
+            if version is not None:
+                with self._changed:
+                    if version != self.version:
+                        self.version = version
+                        self._changed.notify_all()
+            self._wake.wait(self.poll_interval)
@@ -4,11 +4,172 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+def parse_budgets(value):
+    """Parse 'stage:ms,stage:ms' into a dict of per-stage budgets."""
+    budgets = {}
+    for item in value.split(','):
+        if ':' in item:
+            stage, ms = item.split(':', 1)
+            budgets[stage.strip()] = int(ms)
+    return budgets
+
+def engine_options(uri, pool_size, max_overflow, pool_timeout, pool_recycle):
+    """SQLAlchemy engine options for the database at ``uri``."""
+    if uri.startswith('sqlite'):
+        if uri in ('sqlite://', 'sqlite:///') or ':memory:' in uri:
+            # In-memory databases live in a single connection, which Flask-SQLAlchemy sets up
+            return {}
+        # SQLite connections are cheap and never go stale, so no pre-ping or recycling
+        return {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout}
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        # Replace connections before server or proxy idle timeouts drop them
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'instance', 'site.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connections per process; request threads, the analysis/ingest executors and job
+    # workers all draw from the same pool
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+                                               DB_POOL_TIMEOUT, DB_POOL_RECYCLE)
+    # Set on every SQLite connection, in this order. WAL lets readers carry on while a
+    # write commits; synchronous=NORMAL is safe in WAL mode (a power cut can lose the
+    # last commits but never corrupts the file). cache_size is in KiB per connection,
+    # mmap_size in bytes shared through the OS page cache.
+    SQLITE_PRAGMAS = {
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
     TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
\ No newline at end of file
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # Upper bound for a whole request body; larger uploads get a 413
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+    # Uploaded files up to this size stay in memory instead of a temp file
+    UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', 16 * 1024 * 1024))
+
+    # Perceptual-hash result cache in front of the VLM analysis routes
+    ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', '1') == '1'
+    ANALYSIS_CACHE_PATH = os.environ.get('ANALYSIS_CACHE_PATH') or \
+        os.path.join(basedir, 'instance', 'analysis_cache.db')
+    ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 256))
+    ANALYSIS_CACHE_MAX_DB_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_DB_ENTRIES', 10000))
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 7 * 24 * 3600))
+    ANALYSIS_CACHE_HAMMING_THRESHOLD = int(os.environ.get('ANALYSIS_CACHE_HAMMING_THRESHOLD', 3))
+
+    # Background analysis jobs (/jobs)
+    ANALYSIS_MAX_WORKERS = int(os.environ.get('ANALYSIS_MAX_WORKERS', 4))
+    ANALYSIS_MAX_PENDING_JOBS = int(os.environ.get('ANALYSIS_MAX_PENDING_JOBS', 64))
+    ANALYSIS_JOB_RETENTION = int(os.environ.get('ANALYSIS_JOB_RETENTION', 600))
+
+    # Product change feed (/events)
+    # Seconds between checks for writes made by other worker processes
+    CHANGE_FEED_POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', 1.0))
+    # Writes touching more products than this are sent as a 'reload' instead of row patches
+    CHANGE_FEED_MAX_IDS = int(os.environ.get('CHANGE_FEED_MAX_IDS', 500))
+    # Versions kept for resuming; clients further behind reload the listing
+    CHANGE_FEED_RETENTION = int(os.environ.get('CHANGE_FEED_RETENTION', 10000))
+    CHANGE_FEED_KEEPALIVE = float(os.environ.get('CHANGE_FEED_KEEPALIVE', 15))
+    # Streams are closed after this long; browsers reconnect and resume, re-checking the login
+    CHANGE_FEED_MAX_STREAM_SECONDS = int(os.environ.get('CHANGE_FEED_MAX_STREAM_SECONDS', 600))
+    # Event streams served by Flask (/events, /jobs/<id>/events) hold a worker
+    # thread while open, so they close after this long and the browser
+    # reconnects. This is the fallback; asgi.py serves /events without
+    # holding a thread and is where live updates are meant to run
+    SYNC_STREAM_SECONDS = float(os.environ.get('SYNC_STREAM_SECONDS', 25))
+
+    # Combined /analyze endpoint
+    ANALYZE_STAGE_WORKERS = int(os.environ.get('ANALYZE_STAGE_WORKERS', 4))
+    ANALYZE_BARCODE_HEAD_START = float(os.environ.get('ANALYZE_BARCODE_HEAD_START', 0.15))
+    # /analyze_multi: pyzbar reads every frame, the VLM sees at most ANALYZE_MAX_VLM_IMAGES
+    # of them, either in one request ('single') or one request per frame ('fanout')
+    ANALYZE_MAX_IMAGES = int(os.environ.get('ANALYZE_MAX_IMAGES', 12))
+    ANALYZE_MAX_VLM_IMAGES = int(os.environ.get('ANALYZE_MAX_VLM_IMAGES', 4))
+    ANALYZE_MULTI_MODE = os.environ.get('ANALYZE_MULTI_MODE', 'single')
+
+    # Barcode decoding ladder, cheapest stage first
+    BARCODE_STAGES = tuple(
+        stage.strip() for stage in
+        os.environ.get('BARCODE_STAGES', 'downscaled,enhanced,rotated,roi').split(',')
+        if stage.strip()
+    )
+    BARCODE_STAGE_BUDGETS_MS = parse_budgets(
+        os.environ.get('BARCODE_STAGE_BUDGETS_MS', 'downscaled:150,enhanced:200,rotated:300,roi:400')
+    )
+    BARCODE_MAX_EDGE = int(os.environ.get('BARCODE_MAX_EDGE', 1024))
+
+    # Content-addressed product image store
+    IMAGE_STORE_FOLDER = os.environ.get('IMAGE_STORE_FOLDER') or os.path.join(basedir, 'uploads', 'media')
+    IMAGE_STORE_FORMAT = os.environ.get('IMAGE_STORE_FORMAT', 'WEBP')
+    IMAGE_STORE_QUALITY = int(os.environ.get('IMAGE_STORE_QUALITY', 85))
+    IMAGE_THUMBNAIL_SIZES = tuple(
+        int(size) for size in os.environ.get('IMAGE_THUMBNAIL_SIZES', '160').split(',') if size.strip()
+    )
+
+    # Largest block of product IDs a client may reserve at once (/reserve_ids)
+    MAX_RESERVED_IDS = int(os.environ.get('MAX_RESERVED_IDS', 1000))
+
+    # Bulk ingest (/bulk_add_products)
+    BULK_INGEST_WORKERS = int(os.environ.get('BULK_INGEST_WORKERS', 8))
+    BULK_INGEST_BATCH_SIZE = int(os.environ.get('BULK_INGEST_BATCH_SIZE', 200))
+
+    # Catalogue import (/import_catalog, import_catalog.py)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+    IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get('IMPORT_MAX_REPORTED_ERRORS', 1000))
+
+    # Shared VLM client (vlm_client.py)
+    VLM_MODEL = os.environ.get('VLM_MODEL', 'qwen-vl-max')
+    VLM_BASE_URL = os.environ.get('VLM_BASE_URL', 'https://dashscope-intl.aliyuncs.com/compatible-mode/v1')
+    # Native DashScope endpoint used by VLMClient.multimodal
+    DASHSCOPE_BASE_URL = os.environ.get('DASHSCOPE_BASE_URL', 'https://dashscope-intl.aliyuncs.com/api/v1')
+    VLM_CONNECT_TIMEOUT = float(os.environ.get('VLM_CONNECT_TIMEOUT', 5))
+    VLM_READ_TIMEOUT = float(os.environ.get('VLM_READ_TIMEOUT', 60))
+    # Calls in flight at once; further requests wait up to VLM_QUEUE_TIMEOUT seconds
+    VLM_MAX_CONCURRENCY = int(os.environ.get('VLM_MAX_CONCURRENCY', 8))
+    VLM_QUEUE_TIMEOUT = float(os.environ.get('VLM_QUEUE_TIMEOUT', 10))
+    # In-flight limit for the asyncio calls made by the ASGI app (asgi.py)
+    VLM_ASYNC_MAX_CONCURRENCY = int(os.environ.get('VLM_ASYNC_MAX_CONCURRENCY', 64))
+    VLM_MAX_RETRIES = int(os.environ.get('VLM_MAX_RETRIES', 2))
+    VLM_BACKOFF_BASE = float(os.environ.get('VLM_BACKOFF_BASE', 0.5))
+    VLM_BACKOFF_MAX = float(os.environ.get('VLM_BACKOFF_MAX', 8))
+    # Consecutive failed calls before failing fast, and seconds before a trial call
+    VLM_BREAKER_THRESHOLD = int(os.environ.get('VLM_BREAKER_THRESHOLD', 5))
+    VLM_BREAKER_RESET = float(os.environ.get('VLM_BREAKER_RESET', 30))
+    # 'passthrough', 'record' (append replies to VLM_RECORDING_PATH) or 'replay'
+    # (answer from it offline, optionally sleeping for the recorded latency)
+    VLM_TRANSPORT = os.environ.get('VLM_TRANSPORT', 'passthrough')
+    VLM_RECORDING_PATH = os.environ.get('VLM_RECORDING_PATH') or \
+        os.path.join(basedir, 'instance', 'vlm_recording.jsonl')
+    VLM_REPLAY_LATENCY = os.environ.get('VLM_REPLAY_LATENCY', '0') == '1'
+    VLM_REPLAY_LATENCY_SCALE = float(os.environ.get('VLM_REPLAY_LATENCY_SCALE', 1.0))
+    # On a request missing from the recording: 'error' or 'live' (call the upstream)
+    VLM_REPLAY_ON_MISS = os.environ.get('VLM_REPLAY_ON_MISS', 'error')
+
+    # Frames are shrunk and re-encoded before they are sent to the VLM
+    VLM_IMAGE_MAX_EDGE = int(os.environ.get('VLM_IMAGE_MAX_EDGE', 1280))
+    VLM_IMAGE_FORMAT = os.environ.get('VLM_IMAGE_FORMAT', 'JPEG')
+    VLM_IMAGE_QUALITY = int(os.environ.get('VLM_IMAGE_QUALITY', 85))
+    # Crop to the detected product region first
+    VLM_IMAGE_CROP = os.environ.get('VLM_IMAGE_CROP', '0') == '1'
+
+    # /metrics is open unless a bearer token is configured
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Sample the stacks of requests slower than this many ms (0 disables profiling)
+    PROFILE_SLOW_REQUESTS_MS = int(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'instance', 'profiles')
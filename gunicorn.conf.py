@@ -0,0 +1,55 @@
+"""Production launcher: gunicorn with the app preloaded in the master.
+
+    gunicorn app:app
+
+The master imports the app and the heavy libraries it defers (see
+app.preload_dependencies) once; workers are forked from it, so they start
+in milliseconds and share those pages copy-on-write instead of each
+importing OpenCV, pandas and the VLM SDKs. Settings come from the
+environment like config.py.
+
+Each worker has its own VLM connection pool and VLM_MAX_CONCURRENCY slots,
+its own /metrics counters and its own /jobs queue, so job polling needs a
+single worker or sticky routing.
+
+Live updates (/events) are meant to be served from asgi.py. Here each open
+browser tab holds one of a worker's GUNICORN_THREADS threads for up to
+SYNC_STREAM_SECONDS, then reconnects. Route /events to a uvicorn process
+running asgi:api when many tabs stay open.
+"""
+import gc
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+# Threads wait on the VLM and the database; image work releases the GIL
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Recycling a worker is cheap with preloading; 0 keeps workers for good
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+preload_app = True
+
+
+def when_ready(server):
+    import app
+    started = time.perf_counter()
+    app.preload_dependencies()
+    # Objects that exist now are never collected, so the collector does not
+    # touch (and un-share) their pages in every worker
+    gc.freeze()
+    server.log.info('Preloaded dependencies in %.0f ms', (time.perf_counter() - started) * 1000)
+
+
+def post_fork(server, worker):
+    import app
+    # Neither SQLAlchemy's pool nor the analysis cache's SQLite connection may
+    # be shared with the master
+    with app.app.app_context():
+        app.db.engine.dispose(close=False)
+    if app.analysis_cache is not None:
+        app.analysis_cache.reopen()
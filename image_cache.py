@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a BGR or grayscale image."""
+    import cv2
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+# The 64-bit hash is stored as four indexed 16-bit bands. Two hashes at
+# most three bits apart agree on at least one band, so a similar lookup
+# only reads rows sharing a band instead of the whole namespace.
+BANDS = 4
+BAND_BITS = 64 // BANDS
+SCHEMA_VERSION = 2
+
+
+def bands(phash):
+    return [(phash >> (i * BAND_BITS)) & ((1 << BAND_BITS) - 1) for i in range(BANDS)]
+
+
+class AnalysisCache:
+    """Two-level (in-memory LRU + SQLite) cache of VLM analysis results.
+
+    Entries are keyed on the SHA-256 of the image bytes; a miss on the exact
+    key falls back to the nearest stored perceptual hash within
+    ``hamming_threshold`` bits. The database is opened on first use.
+    """
+
+    def __init__(self, path, max_entries=256, max_db_entries=10000, ttl=7 * 24 * 3600,
+                 hamming_threshold=3):
+        if hamming_threshold >= BANDS:
+            raise ValueError(f'hamming_threshold must be below {BANDS}, got {hamming_threshold}')
+        self.path = path
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self.ttl = ttl
+        self.hamming_threshold = hamming_threshold
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        """The SQLite connection, opened and migrated on first use. Call with the lock held."""
+        if self._conn is not None:
+            return self._conn
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            # Only a cache: entries from an older layout are dropped, not migrated
+            conn.execute('DROP TABLE IF EXISTS analysis_cache')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        band_columns = ''.join(f' band{i} INTEGER NOT NULL,' for i in range(BANDS))
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS analysis_cache ('
+            ' namespace TEXT NOT NULL,'
+            ' digest TEXT NOT NULL,'
+            ' phash INTEGER NOT NULL,'
+            f'{band_columns}'
+            ' result TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' accessed REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, digest))'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_analysis_cache_accessed ON analysis_cache (accessed)'
+        )
+        for i in range(BANDS):
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_analysis_cache_band{i} ON analysis_cache (namespace, band{i})'
+            )
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def reopen(self):
+        """Give this process its own database connection.
+
+        For workers forked after the cache was used: SQLite connections
+        must not be used across fork(), so the inherited one is left to the
+        parent rather than closed, and a new one is opened on next use.
+        """
+        with self._lock:
+            self._conn = None
+
+    def lookup(self, namespace, digest, phash):
+        """Return ``(result, match)`` where match is 'exact' or 'similar', or None."""
+        now = time.time()
+        with self._lock:
+            hit = self._lookup_memory_exact(namespace, digest, now)
+            if hit is None:
+                hit = self._lookup_db_exact(namespace, digest, now)
+            if hit is None:
+                hit = self._lookup_memory_similar(namespace, phash, now)
+            if hit is None:
+                hit = self._lookup_db_similar(namespace, phash, now)
+            if hit is None:
+                return None
+            result, match, hit_digest, hit_phash, created = hit
+            self._remember(namespace, hit_digest, hit_phash, result, created)
+        return dict(result), match
+
+    def store(self, namespace, digest, phash, result):
+        now = time.time()
+        with self._lock:
+            self._remember(namespace, digest, phash, result, now)
+            conn = self._db()
+            band_columns = ''.join(f', band{i}' for i in range(BANDS))
+            conn.execute(
+                f'INSERT OR REPLACE INTO analysis_cache (namespace, digest, phash{band_columns}, result, created, '
+                f'accessed) VALUES (?, ?, ?{", ?" * BANDS}, ?, ?, ?)',
+                (namespace, digest, _to_signed(phash), *bands(phash), json.dumps(result), now, now)
+            )
+            self._evict_db(now)
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._db()
+            conn.execute('DELETE FROM analysis_cache')
+            conn.commit()
+
+    def _remember(self, namespace, digest, phash, result, created):
+        key = (namespace, digest)
+        self._memory[key] = (phash, result, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup_memory_exact(self, namespace, digest, now):
+        key = (namespace, digest)
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if now - entry[2] > self.ttl:
+            del self._memory[key]
+            return None
+        return entry[1], 'exact', digest, entry[0], entry[2]
+
+    def _lookup_memory_similar(self, namespace, phash, now):
+        best = None
+        for (entry_namespace, entry_digest), (entry_phash, result, created) in self._memory.items():
+            if entry_namespace != namespace or now - created > self.ttl:
+                continue
+            distance = hamming(phash, entry_phash)
+            if distance <= self.hamming_threshold and (best is None or distance < best[0]):
+                best = (distance, result, entry_digest, entry_phash, created)
+        if best is None:
+            return None
+        return best[1], 'similar', best[2], best[3], best[4]
+
+    def _lookup_db_exact(self, namespace, digest, now):
+        row = self._db().execute(
+            'SELECT digest, phash, result, created FROM analysis_cache '
+            'WHERE namespace = ? AND digest = ? AND created >= ?',
+            (namespace, digest, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._touch_db(namespace, row, 'exact', now)
+
+    def _lookup_db_similar(self, namespace, phash, now):
+        best = None
+        # One indexed lookup per band; OR would make SQLite scan the namespace
+        band_matches = ' UNION '.join(
+            f'SELECT rowid FROM analysis_cache WHERE namespace = ? AND band{i} = ?' for i in range(BANDS)
+        )
+        band_params = [value for band in bands(phash) for value in (namespace, band)]
+        rows = self._db().execute(
+            'SELECT digest, phash, result, created FROM analysis_cache '
+            f'WHERE rowid IN ({band_matches}) AND created >= ?',
+            (*band_params, now - self.ttl)
+        )
+        for row in rows:
+            distance = hamming(phash, _to_unsigned(row[1]))
+            if distance <= self.hamming_threshold and (best is None or distance < best[0]):
+                best = (distance, row)
+        if best is None:
+            return None
+        return self._touch_db(namespace, best[1], 'similar', now)
+
+    def _touch_db(self, namespace, row, match, now):
+        conn = self._db()
+        conn.execute(
+            'UPDATE analysis_cache SET accessed = ? WHERE namespace = ? AND digest = ?',
+            (now, namespace, row[0])
+        )
+        conn.commit()
+        return json.loads(row[2]), match, row[0], _to_unsigned(row[1]), row[3]
+
+    def _evict_db(self, now):
+        self._conn.execute('DELETE FROM analysis_cache WHERE created < ?', (now - self.ttl,))
+        self._conn.execute(
+            'DELETE FROM analysis_cache WHERE rowid IN ('
+            ' SELECT rowid FROM analysis_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_db_entries,)
+        )
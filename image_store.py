@@ -0,0 +1,148 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+
+
+class ImageStore:
+    """Content-addressed image blobs with ingest-time thumbnails.
+
+    Blobs are named after the SHA-256 of their encoded bytes and referenced
+    from products as ``media/<digest>.<ext>``. The digest of each source
+    upload is recorded as an alias, so uploading the same original (or the
+    stored blob itself) again is a no-op. Which products hold a blob is
+    tracked by the app, not here.
+    """
+
+    def __init__(self, root, url_prefix='media', image_format='WEBP', quality=85,
+                 thumbnail_sizes=(160,)):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.image_format = image_format.upper()
+        self.extension = EXTENSIONS[self.image_format]
+        self.quality = quality
+        self.thumbnail_sizes = tuple(thumbnail_sizes)
+
+    def put(self, image_data):
+        """Store ``image_data`` (any PIL-readable bytes) and return its reference."""
+        source_digest = hashlib.sha256(image_data).hexdigest()
+        digest = self._resolve(source_digest)
+        if digest:
+            return self.reference(digest)
+
+        from PIL import Image, ImageOps
+        image = Image.open(BytesIO(image_data))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        encoded = self._encode(image)
+        digest = hashlib.sha256(encoded).hexdigest()
+
+        blob_path = self.blob_path(digest)
+        if not os.path.exists(blob_path):
+            self._write_atomic(blob_path, encoded)
+            for size in self.thumbnail_sizes:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.LANCZOS)
+                self._write_atomic(self.thumbnail_path(digest, size), self._encode(thumbnail))
+        if source_digest != digest:
+            self._write_atomic(self._alias_path(source_digest), digest.encode('ascii'))
+            # Listed per blob so delete() can find its aliases
+            os.makedirs(os.path.dirname(self._sources_path(digest)), exist_ok=True)
+            with open(self._sources_path(digest), 'a') as f:
+                f.write(source_digest + '\n')
+        return self.reference(digest)
+
+    def exists(self, reference):
+        return os.path.exists(self.blob_path(self.digest_of(reference)))
+
+    def reference(self, digest):
+        return f'{self.url_prefix}/{digest}.{self.extension}'
+
+    def is_reference(self, path):
+        return path.startswith(self.url_prefix + '/')
+
+    def digest_of(self, reference):
+        return os.path.splitext(reference[len(self.url_prefix) + 1:])[0]
+
+    def thumbnail_reference(self, reference, size=None):
+        size = size or self.thumbnail_sizes[0]
+        return f'{self.url_prefix}/thumbs/{size}/{self.digest_of(reference)}.{self.extension}'
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], f'{digest}.{self.extension}')
+
+    def thumbnail_path(self, digest, size):
+        return os.path.join(self.root, 'thumbs', str(size), digest[:2], f'{digest}.{self.extension}')
+
+    def resolve_url_path(self, filename):
+        """Map the part of a /media URL after the prefix to a file on disk, or None."""
+        parts = filename.split('/')
+        name, ext = os.path.splitext(parts[-1])
+        if ext != f'.{self.extension}' or len(name) != 64:
+            return None
+        if len(parts) == 1:
+            return self.blob_path(name)
+        if len(parts) == 3 and parts[0] == 'thumbs' and parts[1].isdigit():
+            return self.thumbnail_path(name, int(parts[1]))
+        return None
+
+    def delete(self, reference):
+        digest = self.digest_of(reference)
+        paths = [self.blob_path(digest)]
+        paths += [self.thumbnail_path(digest, size) for size in self.thumbnail_sizes]
+        sources_path = self._sources_path(digest)
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                paths += [self._alias_path(line.strip()) for line in f if line.strip()]
+            paths.append(sources_path)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self):
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+
+    def _resolve(self, source_digest):
+        if os.path.exists(self.blob_path(source_digest)):
+            return source_digest
+        alias_path = self._alias_path(source_digest)
+        if os.path.exists(alias_path):
+            with open(alias_path) as f:
+                digest = f.read().strip()
+            if os.path.exists(self.blob_path(digest)):
+                return digest
+        return None
+
+    def _alias_path(self, source_digest):
+        return os.path.join(self.root, 'aliases', source_digest[:2], source_digest)
+
+    def _sources_path(self, digest):
+        return os.path.join(self.root, 'aliases', digest[:2], f'{digest}.sources')
+
+    def _encode(self, image):
+        output = BytesIO()
+        options = {'quality': self.quality}
+        if self.image_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif self.image_format == 'WEBP':
+            options['method'] = 4
+        image.save(output, self.image_format, **options)
+        return output.getvalue()
+
+    def _write_atomic(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
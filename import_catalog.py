@@ -0,0 +1,19 @@
+import argparse
+
+from app import app, import_catalog
+
+parser = argparse.ArgumentParser(description='Import or update products from a CSV/XLSX file.')
+parser.add_argument('path', help='.csv or .xlsx file, e.g. a supplier price list or a previous export')
+parser.add_argument('--key', choices=('id', 'barcode'),
+                    help='column matched against existing products (default: id if present, else barcode)')
+parser.add_argument('--chunk-size', type=int, help='rows per transaction')
+args = parser.parse_args()
+
+with app.app_context():
+    with open(args.path, 'rb') as f:
+        summary = import_catalog(f, args.path, key=args.key, chunk_size=args.chunk_size)
+
+print(f"Matched on {summary['key']}: {summary['inserted']} inserted, "
+      f"{summary['updated']} updated, {summary['rejected']} rejected")
+for rejected in summary['rejected_rows']:
+    print(f"  row {rejected['row']}: {rejected['error']}")
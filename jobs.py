@@ -0,0 +1,151 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, owner=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.state = QUEUED
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self.seq = 0
+        self._cancel = threading.Event()
+        self._manager = None
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def set_stage(self, stage):
+        """Mark progress and bail out early if the job was cancelled."""
+        self.checkpoint()
+        self._update(stage=stage)
+
+    def checkpoint(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'stage': self.stage,
+            'created': self.created,
+            'updated': self.updated,
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+    def _update(self, **fields):
+        with self._manager._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.updated = time.time()
+            self.seq += 1
+            self._manager._changed.notify_all()
+
+
+class JobManager:
+    """Bounded thread pool running analysis jobs with pollable per-job state."""
+
+    def __init__(self, max_workers=4, max_pending=64, retention=600):
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+
+    def submit(self, kind, fn, owner=None):
+        """Queue ``fn(job)``; its return value becomes the job result."""
+        self._prune()
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise QueueFull()
+            job = Job(kind, owner=owner)
+            job._manager = self
+            self._jobs[job.id] = job
+            self._futures[job.id] = self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job._cancel.set()
+        future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            # Never started; the worker will not report back for it
+            job._update(state=CANCELLED)
+        return job
+
+    def counts(self):
+        """Number of retained jobs per state."""
+        with self._lock:
+            return Counter(job.state for job in self._jobs.values())
+
+    def wait(self, job, seq, timeout):
+        """Block until ``job.seq`` moves past ``seq`` or ``timeout`` expires."""
+        with self._changed:
+            self._changed.wait_for(lambda: job.seq != seq, timeout=timeout)
+        return job
+
+    def _run(self, job, fn):
+        try:
+            job.checkpoint()
+            job._update(state=RUNNING)
+            result = fn(job)
+            job.checkpoint()
+            job._update(state=DONE, stage=None, result=result)
+        except JobCancelled:
+            job._update(state=CANCELLED)
+        except Exception as e:
+            job._update(state=FAILED, error=str(e))
+        finally:
+            with self._lock:
+                self._futures.pop(job.id, None)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.updated < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
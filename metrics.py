@@ -0,0 +1,151 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request being handled; worker threads join in via Metrics.bind()
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format.
+
+    ``stage()`` times a block into the ``stage_duration_seconds`` histogram
+    and, inside a request started with ``begin_request()``, into that
+    request's list of stages for the Server-Timing header.
+    """
+
+    def __init__(self, namespace='app', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def register_collector(self, collect):
+        """Add a callable returning ``[(name, type, [(labels_dict, value), ...]), ...]``,
+        sampled at render time for values owned by other components."""
+        self._collectors.append(collect)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - started)
+
+    def record_stage(self, name, seconds):
+        self.observe('stage_duration_seconds', seconds, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, seconds))
+
+    def begin_request(self):
+        return _request_stages.set([])
+
+    def request_stages(self):
+        """``(stage, seconds)`` pairs recorded so far in the current request."""
+        return list(_request_stages.get() or [])
+
+    def end_request(self, token):
+        _request_stages.reset(token)
+
+    def bind(self, fn):
+        """Wrap ``fn`` so stages it records on a worker thread count toward the calling request."""
+        stages = _request_stages.get()
+
+        def run(*args, **kwargs):
+            token = _request_stages.set(stages)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _request_stages.reset(token)
+        return run
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+
+        families = {}
+        for (name, labels), value in counters.items():
+            families.setdefault((name, 'counter'), []).append((labels, value))
+        for collect in self._collectors:
+            for name, kind, samples in collect():
+                families.setdefault((name, kind), []).extend(
+                    (tuple(sorted(labels.items())), value) for labels, value in samples
+                )
+
+        lines = []
+        for (name, kind), samples in sorted(families.items()):
+            full_name = f'{self.namespace}_{name}'
+            self._header(lines, name, full_name, kind)
+            for labels, value in sorted(samples):
+                lines.append(f'{full_name}{_label_text(labels)} {_format_value(value)}')
+
+        by_name = {}
+        for (name, labels), value in histograms.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in sorted(by_name.items()):
+            full_name = f'{self.namespace}_{name}'
+            self._header(lines, name, full_name, 'histogram')
+            for labels, (counts, total, count) in sorted(samples):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{full_name}_bucket{_label_text(labels + (("le", repr(bound)),))} {bucket_count}')
+                lines.append(f'{full_name}_bucket{_label_text(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{full_name}_sum{_label_text(labels)} {_format_value(total)}')
+                lines.append(f'{full_name}_count{_label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name, full_name, kind):
+        if name in self._help:
+            lines.append(f'# HELP {full_name} {self._help[name]}')
+        lines.append(f'# TYPE {full_name} {kind}')
+
+
+def server_timing(stages, total_seconds=None):
+    """Server-Timing header value; repeated stages are summed into one entry."""
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in totals.items()]
+    if total_seconds is not None:
+        entries.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(entries)
@@ -0,0 +1,29 @@
+"""Add product_change table
+
+Revision ID: 4c7d9e2b6f13
+Revises: e8c4b1f02a77
+Create Date: 2026-10-17 01:23:12.503817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7d9e2b6f13'
+down_revision = 'e8c4b1f02a77'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_change',
+    sa.Column('version', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('product_ids_json', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('version')
+    )
+
+
+def downgrade():
+    op.drop_table('product_change')
@@ -0,0 +1,28 @@
+"""Add catalog_state table
+
+Revision ID: 7b3f2c91d4e5
+Revises: 1602ccc7ca11
+Create Date: 2026-10-17 00:34:12.218391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3f2c91d4e5'
+down_revision = '1602ccc7ca11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('catalog_state')
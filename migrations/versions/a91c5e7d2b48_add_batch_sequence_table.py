@@ -0,0 +1,30 @@
+"""Add batch_sequence table
+
+Revision ID: a91c5e7d2b48
+Revises: b7d40e9a5c21
+Create Date: 2026-10-17 00:39:07.906512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91c5e7d2b48'
+down_revision = 'b7d40e9a5c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The row itself is seeded on first use from batch_config.json, if present
+    op.create_table('batch_sequence',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('prefix', sa.String(length=20), nullable=False),
+    sa.Column('next_index', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('batch_sequence')
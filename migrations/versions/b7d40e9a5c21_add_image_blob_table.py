@@ -0,0 +1,39 @@
+"""Add image_blob reference counts
+
+Revision ID: b7d40e9a5c21
+Revises: 7b3f2c91d4e5
+Create Date: 2026-10-17 00:36:21.640772
+
+"""
+import json
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d40e9a5c21'
+down_revision = '7b3f2c91d4e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    image_blob = op.create_table('image_blob',
+    sa.Column('reference', sa.String(length=100), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('reference')
+    )
+
+    # Count the blobs existing products already hold; legacy upload paths are not counted
+    counts = Counter()
+    for (images_json,) in op.get_bind().execute(sa.text('SELECT images_json FROM product')):
+        counts.update(path for path in json.loads(images_json or '[]') if path.startswith('media/'))
+    if counts:
+        op.bulk_insert(image_blob, [{'reference': reference, 'refcount': count}
+                                    for reference, count in counts.items()])
+
+
+def downgrade():
+    op.drop_table('image_blob')
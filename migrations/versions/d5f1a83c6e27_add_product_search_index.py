@@ -0,0 +1,65 @@
+"""Add product barcode index and FTS5 search index
+
+Revision ID: d5f1a83c6e27
+Revises: a91c5e7d2b48
+Create Date: 2026-10-17 00:55:41.417930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1a83c6e27'
+down_revision = 'a91c5e7d2b48'
+branch_labels = None
+depends_on = None
+
+# product.rowid is renumbered by VACUUM and table rebuilds, so the index is
+# keyed on product_search_key.id, an INTEGER PRIMARY KEY per product id
+SEARCH_DDL = (
+    "CREATE TABLE IF NOT EXISTS product_search_key ("
+    "id INTEGER PRIMARY KEY, product_id VARCHAR(50) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, brand, barcode, tokenize='trigram')",
+    "INSERT INTO product_search(product_search, rank) VALUES('rank', 'bm25(10.0, 5.0, 2.0)')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_search_key(product_id) VALUES (new.id); "
+    "INSERT INTO product_search(rowid, name, brand, barcode) "
+    "SELECT id, new.name, new.brand, new.barcode FROM product_search_key WHERE product_id = new.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN "
+    "DELETE FROM product_search WHERE rowid = (SELECT id FROM product_search_key WHERE product_id = old.id); "
+    "DELETE FROM product_search_key WHERE product_id = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF id, name, brand, barcode ON product BEGIN "
+    "UPDATE product_search_key SET product_id = new.id WHERE product_id = old.id; "
+    "UPDATE product_search SET name = new.name, brand = new.brand, barcode = new.barcode "
+    "WHERE rowid = (SELECT id FROM product_search_key WHERE product_id = new.id); "
+    "END",
+    # Index the rows that already exist
+    "INSERT INTO product_search_key(product_id) SELECT id FROM product",
+    "INSERT INTO product_search(rowid, name, brand, barcode) "
+    "SELECT k.id, p.name, p.brand, p.barcode FROM product_search_key k JOIN product p ON p.id = k.product_id",
+)
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_product_barcode'), ['barcode'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SEARCH_DDL:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS product_search_au')
+        op.execute('DROP TRIGGER IF EXISTS product_search_ad')
+        op.execute('DROP TRIGGER IF EXISTS product_search_ai')
+        op.execute('DROP TABLE IF EXISTS product_search')
+        op.execute('DROP TABLE IF EXISTS product_search_key')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_product_barcode'))
@@ -0,0 +1,28 @@
+"""Add product (timestamp, id) index
+
+Revision ID: e8c4b1f02a77
+Revises: d5f1a83c6e27
+Create Date: 2026-10-17 01:16:38.108264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b1f02a77'
+down_revision = 'd5f1a83c6e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Index-only batch operations run as plain CREATE INDEX on SQLite, so the
+    # table (and the rowids the FTS5 search index points at) is not rebuilt
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_timestamp_id', ['timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_timestamp_id')
@@ -0,0 +1,78 @@
+import re
+
+SEARCH_TABLE = 'product_search'
+# Trigram tokens are three characters, so shorter terms cannot use the index
+MIN_TERM_LENGTH = 3
+
+SEARCH_KEY_TABLE = 'product_search_key'
+
+# FTS5 index over product name/brand/barcode, kept in sync by triggers.
+# product has a TEXT primary key, and its implicit rowid is renumbered by
+# VACUUM and table rebuilds, so the index is keyed on product_search_key: an
+# INTEGER PRIMARY KEY per product id, which survives both. The FTS table keeps
+# its own copy of the text rather than reading it from product. Rebuilding
+# the product table drops the triggers, so a migration that does so must run
+# SEARCH_DDL again.
+SEARCH_DDL = (
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_KEY_TABLE} ("
+    f"id INTEGER PRIMARY KEY, product_id VARCHAR(50) NOT NULL UNIQUE)",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"name, brand, barcode, tokenize='trigram')",
+    # Name matches outrank brand matches, which outrank barcode substrings
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES('rank', 'bm25(10.0, 5.0, 2.0)')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON product BEGIN "
+    f"INSERT INTO {SEARCH_KEY_TABLE}(product_id) VALUES (new.id); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name, brand, barcode) "
+    f"SELECT id, new.name, new.brand, new.barcode FROM {SEARCH_KEY_TABLE} WHERE product_id = new.id; "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON product BEGIN "
+    f"DELETE FROM {SEARCH_TABLE} WHERE rowid = (SELECT id FROM {SEARCH_KEY_TABLE} WHERE product_id = old.id); "
+    f"DELETE FROM {SEARCH_KEY_TABLE} WHERE product_id = old.id; "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF id, name, brand, barcode ON product BEGIN "
+    f"UPDATE {SEARCH_KEY_TABLE} SET product_id = new.id WHERE product_id = old.id; "
+    f"UPDATE {SEARCH_TABLE} SET name = new.name, brand = new.brand, barcode = new.barcode "
+    f"WHERE rowid = (SELECT id FROM {SEARCH_KEY_TABLE} WHERE product_id = new.id); "
+    f"END",
+)
+
+# Fills the index from scratch, for migrations; the triggers keep it current after that
+SEARCH_FILL = (
+    f"INSERT INTO {SEARCH_KEY_TABLE}(product_id) SELECT id FROM product",
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name, brand, barcode) "
+    f"SELECT k.id, p.name, p.brand, p.barcode FROM {SEARCH_KEY_TABLE} k JOIN product p ON p.id = k.product_id",
+)
+
+BARCODE_PATTERN = re.compile(r'^\d{6,14}$')
+
+
+def search_terms(text):
+    return [term for term in text.split() if term]
+
+
+def looks_like_barcode(text):
+    return bool(BARCODE_PATTERN.match(text.strip()))
+
+
+def quote_term(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def trigrams(term):
+    term = term.casefold()
+    return sorted({term[i:i + 3] for i in range(len(term) - 2)})
+
+
+def match_expression(terms, fuzzy=False):
+    """FTS5 MATCH string for the indexable terms, or None if there are none.
+
+    Plain queries need every term as a substring of some column. Fuzzy
+    queries accept any shared trigram and leave it to the bm25 rank to put
+    the closest spellings first, which tolerates typos and missing spaces.
+    """
+    terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        return None
+    if fuzzy:
+        return ' OR '.join(quote_term(gram) for term in terms for gram in trigrams(term))
+    return ' AND '.join(quote_term(term) for term in terms)
@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+def collapse_stack(frame):
+    """Root-first ``file:function:line`` frames joined with ';' (flamegraph collapsed format)."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler for request threads.
+
+    While a request runs, a background thread samples its stack every
+    ``interval`` seconds. Requests slower than ``threshold_ms`` have their
+    samples written to ``output_dir`` as collapsed stacks, one
+    ``<stack> <count>`` line each, ready for flamegraph.pl or speedscope.
+    Only the request thread is sampled, not executor threads it waits on.
+    """
+
+    def __init__(self, output_dir, threshold_ms=1000, interval=0.005):
+        self.output_dir = output_dir
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._samples[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+
+    def end(self, name, duration_ms):
+        """Stop sampling this thread; return the profile path if the request was slow."""
+        with self._lock:
+            samples = self._samples.pop(threading.get_ident(), None)
+        if not samples or duration_ms < self.threshold_ms:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{name}-{int(duration_ms)}ms.folded"
+        path = os.path.join(self.output_dir, filename)
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._samples.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[collapse_stack(frame)] += 1
@@ -50,37 +50,68 @@ let currentProductId = null;
         captureOptions.style.display = 'block';
     });
 
-    snap.addEventListener('click', function () {
+    // New images are kept as JPEG Blobs and uploaded as multipart files; images
+    // already stored with the product being edited stay as reference strings
+    const JPEG_QUALITY = 0.9;
+    let previewUrls = [];
+
+    async function imageBlob(image) {
+        if (typeof image !== 'string') return image;
+        const response = await fetch(`/${image}`);
+        return response.blob();
+    }
+
+    function canvasToJpeg(sourceCanvas) {
+        return new Promise(resolve => sourceCanvas.toBlob(resolve, 'image/jpeg', JPEG_QUALITY));
+    }
+
+    async function fileToJpeg(file) {
+        if (file.type === 'image/jpeg') return file;
+        const bitmap = await createImageBitmap(file);
+        const scratch = document.createElement('canvas');
+        scratch.width = bitmap.width;
+        scratch.height = bitmap.height;
+        scratch.getContext('2d').drawImage(bitmap, 0, 0);
+        bitmap.close();
+        return canvasToJpeg(scratch);
+    }
+
+    snap.addEventListener('click', async function () {
         const context = canvas.getContext('2d');
         canvas.width = video.videoWidth;
         canvas.height = video.videoHeight;
         context.drawImage(video, 0, 0, canvas.width, canvas.height);
-        const dataUrl = canvas.toDataURL('image/png');
-        capturedImages.push(dataUrl);
+        capturedImages.push(await canvasToJpeg(canvas));
         updateImagePreviews();
         video.play();
     });
 
-    imageUpload.addEventListener('change', function(e) {
-        const files = e.target.files;
-        for (const file of files) {
-            const reader = new FileReader();
-            reader.onload = function(event) {
-                capturedImages.push(event.target.result);
-                updateImagePreviews();
+    imageUpload.addEventListener('change', async function(e) {
+        for (const file of e.target.files) {
+            try {
+                capturedImages.push(await fileToJpeg(file));
+            } catch (error) {
+                console.error('Could not read image:', error);
             }
-            reader.readAsDataURL(file);
         }
+        updateImagePreviews();
     });
 
     function updateImagePreviews() {
         imagePreviews.innerHTML = '';
+        previewUrls.forEach(url => URL.revokeObjectURL(url));
+        previewUrls = [];
         capturedImages.forEach((imageData, index) => {
             const previewWrapper = document.createElement('div');
             previewWrapper.className = 'image-preview position-relative';
 
             const img = document.createElement('img');
-            img.src = imageData;
+            if (typeof imageData === 'string') {
+                img.src = `/${imageData}`;
+            } else {
+                img.src = URL.createObjectURL(imageData);
+                previewUrls.push(img.src);
+            }
             previewWrapper.appendChild(img);
 
             const removeBtn = document.createElement('button');
@@ -107,34 +138,36 @@ let currentProductId = null;
 }
 
     // Analyze button logic
-document.getElementById('analyzeBtn').addEventListener('click', () => {
+document.getElementById('analyzeBtn').addEventListener('click', async () => {
     if (capturedImages.length === 0) return;
-    const lastImage = capturedImages[capturedImages.length - 1];
     const analyzeBtn = document.getElementById('analyzeBtn');
     const originalHtml = analyzeBtn.innerHTML;
     analyzeBtn.innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Analyzing...`;
     analyzeBtn.disabled = true;
 
-    fetch('/analyze_ai', {
+    // Several angles go to /analyze_multi so a barcode or brand on any side is found
+    const formData = new FormData();
+    let url = '/analyze';
+    const blobs = await Promise.all(capturedImages.map(imageBlob));
+    if (blobs.length > 1) {
+        blobs.forEach((blob, i) => formData.append('images', blob, `image${i}.jpg`));
+        url = '/analyze_multi';
+    } else {
+        formData.append('image', blobs[0], 'image.jpg');
+    }
+
+    fetch(url, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image_data: lastImage })
+        body: formData
     })
     .then(response => response.json())
     .then(data => {
+        if (data.error) throw new Error(data.error);
         if (data.name) document.getElementById('productName').value = data.name;
-    if (data.brand) document.getElementById('productBrand').value = data.brand;
-    if (data.object_count) document.getElementById('quantity').value = data.object_count;
-    // Proceed to barcode detection
-    return fetch('/detect_barcode', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image_data: lastImage })
-        });
-    })
-    .then(response => response.json())
-    .then(data => {
+        if (data.brand) document.getElementById('productBrand').value = data.brand;
+        if (data.object_count) document.getElementById('quantity').value = data.object_count;
         if (data.barcode) document.getElementById('barcode').value = data.barcode;
+        if (data.degraded) alert('AI analysis is temporarily unavailable; only the barcode was read.');
     })
     .catch(error => {
         console.error('Error:', error);
@@ -149,25 +182,29 @@ document.getElementById('analyzeBtn').addEventListener('click', () => {
     // Product form submission
     document.getElementById('productForm').addEventListener('submit', function (e) {
         e.preventDefault();
-        const productData = {
-            name: document.getElementById('productName').value,
-            brand: document.getElementById('productBrand').value,
-            barcode: document.getElementById('barcode').value,
-            price: document.getElementById('price').value,
-            quantity: document.getElementById('quantity').value,
-            images: capturedImages
-        };
+        const productData = new FormData();
+        productData.append('name', document.getElementById('productName').value);
+        productData.append('brand', document.getElementById('productBrand').value);
+        productData.append('barcode', document.getElementById('barcode').value);
+        productData.append('price', document.getElementById('price').value);
+        productData.append('quantity', document.getElementById('quantity').value);
+        // Stored images are referenced, so an edit only uploads the new ones
+        capturedImages.forEach((image, i) => {
+            if (typeof image === 'string') {
+                productData.append('keep_images', image);
+            } else {
+                productData.append('images', image, `image_${i}.jpg`);
+            }
+        });
 
         const url = isEditing ? `/update_product/${currentProductId}` : '/add_product';
 fetch(url, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(productData)
+    body: productData
 })
 .then(response => response.json())
 .then(data => {
     if (data.success) {
-        loadProducts();
         loadBatch();
         document.getElementById('productName').value = '';
         document.getElementById('productBrand').value = '';
@@ -210,44 +247,130 @@ fetch(url, {
     // Product list
     const productList = document.getElementById('productList');
 
-    function loadProducts() {
-        fetch('/get_products')
-            .then(response => response.json())
-            .then(data => {
-                productList.innerHTML = '';
-                data.forEach(product => {
-                    const row = document.createElement('tr');
-                    let thumbnailUrl = 'data:image/svg+xml;charset=UTF-8,%3csvg xmlns=\'http://www.w3.org/2000/svg\' width=\'80\' height=\'80\' viewBox=\'0 0 80 80\'%3e%3crect width=\'80\' height=\'80\' fill=\'%23ccc\'/%3e%3c/svg%3e';
-                    if (product.images.length > 0) {
-                        const imagePath = product.images[0].replace(/\\/g, '/');
-                        const pathParts = imagePath.split('/');
-                        const relativePath = pathParts.slice(-2).join('/');
-                        thumbnailUrl = `/${relativePath}`;
-                    }
-                    row.innerHTML = `
-                        <td>${product.id}</td>
-                        <td><img src="${thumbnailUrl}" class="product-thumbnail"></td>
-                        <td>${product.name}</td>
-                        <td>${product.brand}</td>
-                        <td>${product.barcode}</td>
-                        <td>${product.price}</td>
-                        <td>${product.quantity}</td>
-                        <td>${new Date(product.timestamp).toLocaleString()}</td>
-                        <td>
-                        <td>
+    async function fetchAllProducts() {
+        // Walk the keyset-paginated listing; unchanged pages come back as 304
+        // and are served from the browser cache
+        let products = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: 500 });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`/api/products?${params}`);
+            const page = await response.json();
+            products = products.concat(page.items);
+            cursor = page.next_cursor;
+        } while (cursor);
+        return products;
+    }
+
+    function productRow(product) {
+        const row = document.createElement('tr');
+        row.dataset.id = product.id;
+        row.dataset.timestamp = product.timestamp;
+        let thumbnailUrl = 'data:image/svg+xml;charset=UTF-8,%3csvg xmlns=\'http://www.w3.org/2000/svg\' width=\'80\' height=\'80\' viewBox=\'0 0 80 80\'%3e%3crect width=\'80\' height=\'80\' fill=\'%23ccc\'/%3e%3c/svg%3e';
+        if (product.thumbnail) {
+            thumbnailUrl = `/${product.thumbnail.replace(/\\/g, '/')}`;
+        }
+        row.innerHTML = `
+            <td>${product.id}</td>
+            <td><img src="${thumbnailUrl}" class="product-thumbnail"></td>
+            <td>${product.name}</td>
+            <td>${product.brand}</td>
+            <td>${product.barcode}</td>
+            <td>${product.price}</td>
+            <td>${product.quantity}</td>
+            <td>${new Date(product.timestamp).toLocaleString()}</td>
+            <td>
+            <td>
     <button class="btn btn-sm btn-primary me-1" onclick="editProduct('${product.id}')"><i class="bi bi-pencil"></i></button>
     <button class="btn btn-sm btn-danger" onclick="deleteProduct('${product.id}')"><i class="bi bi-trash"></i></button>
 </td>                        </td>
-                    `;
-                    productList.appendChild(row);
-                });
+        `;
+        return row;
+    }
+
+    function loadProducts() {
+        return fetchAllProducts()
+            .then(data => {
+                productList.innerHTML = '';
+                data.forEach(product => productList.appendChild(productRow(product)));
+            });
+    }
+
+    function findProductRow(id) {
+        return Array.from(productList.rows).find(row => row.dataset.id === id);
+    }
+
+    function upsertProductRow(product) {
+        const row = productRow(product);
+        const existing = findProductRow(product.id);
+        if (existing) {
+            existing.replaceWith(row);
+            return;
+        }
+        // Keep the listing's (timestamp, id) order
+        const next = Array.from(productList.rows).find(other =>
+            other.dataset.timestamp > product.timestamp ||
+            (other.dataset.timestamp === product.timestamp && other.dataset.id > product.id));
+        productList.insertBefore(row, next || null);
+    }
+
+    function removeProductRow(id) {
+        const row = findProductRow(id);
+        if (row) row.remove();
+    }
+
+    // Live updates: every write, ours or another operator's, arrives as a change
+    // event and is patched into the table. The listing is only fetched in full on
+    // 'ready' and 'reload'; events arriving meanwhile are applied after it, which
+    // is safe because each one carries the current state of its rows.
+    let pendingChanges = null;
+
+    function applyChange(type, data) {
+        if (type === 'upsert') {
+            data.products.forEach(upsertProductRow);
+        } else if (type === 'delete') {
+            data.ids.forEach(removeProductRow);
+        } else if (type === 'reset') {
+            productList.innerHTML = '';
+        }
+    }
+
+    function resyncProducts() {
+        if (pendingChanges) return;
+        pendingChanges = [];
+        loadProducts()
+            .catch(error => console.error('Error loading products:', error))
+            .finally(() => {
+                const changes = pendingChanges;
+                pendingChanges = null;
+                changes.forEach(([type, data]) => applyChange(type, data));
+            });
+    }
+
+    function watchProducts() {
+        const events = new EventSource('/events');
+        ['upsert', 'delete', 'reset'].forEach(type => {
+            events.addEventListener(type, event => {
+                const data = JSON.parse(event.data);
+                if (pendingChanges) {
+                    pendingChanges.push([type, data]);
+                } else {
+                    applyChange(type, data);
+                }
             });
+        });
+        events.addEventListener('ready', resyncProducts);
+        events.addEventListener('reload', resyncProducts);
+        events.onerror = () => {
+            // The browser reconnects and resumes by itself unless the stream was refused
+            if (events.readyState === EventSource.CLOSED) loadProducts();
+        };
     }
 
     window.deleteProduct = function(id) {
     if (confirm('Are you sure you want to delete this product?')) {
-        fetch(`/delete_product/${id}`, { method: 'DELETE' })
-            .then(() => loadProducts());
+        fetch(`/delete_product/${id}`, { method: 'DELETE' });
     }
 }
 
@@ -267,17 +390,7 @@ window.editProduct = async function(id) {
         document.getElementById('price').value = product.price;
         document.getElementById('quantity').value = product.quantity;
 
-        capturedImages = [];
-        const imagePromises = product.images.map(async (path) => {
-            const res = await fetch(`/${path}`);
-            const blob = await res.blob();
-            return new Promise((resolve) => {
-                const reader = new FileReader();
-                reader.onload = () => resolve(reader.result);
-                reader.readAsDataURL(blob);
-            });
-        });
-        capturedImages = await Promise.all(imagePromises);
+        capturedImages = product.images.slice();
         updateImagePreviews();
     } catch (error) {
         console.error('Error loading product for edit:', error);
@@ -292,13 +405,42 @@ window.editProduct = async function(id) {
         window.location.href = '/export_csv';
     });
 
+    document.getElementById('exportXlsx').addEventListener('click', () => {
+        window.location.href = '/export_xlsx';
+    });
+
+    const importFile = document.getElementById('importFile');
+    document.getElementById('importCatalog').addEventListener('click', () => importFile.click());
+    importFile.addEventListener('change', async () => {
+        if (!importFile.files.length) return;
+        const formData = new FormData();
+        formData.append('file', importFile.files[0]);
+        importFile.value = '';
+        try {
+            const response = await fetch('/import_catalog', { method: 'POST', body: formData });
+            const data = await response.json();
+            if (!data.success) {
+                alert('Import failed: ' + data.error);
+                return;
+            }
+            let message = `Imported: ${data.inserted} added, ${data.updated} updated, ${data.rejected} rejected.`;
+            if (data.rejected_rows.length) {
+                message += '\n\n' + data.rejected_rows.slice(0, 10).map(r => `Row ${r.row}: ${r.error}`).join('\n');
+            }
+            alert(message);
+            loadBatch();
+        } catch (error) {
+            console.error('Import error:', error);
+            alert('An error occurred during import.');
+        }
+    });
+
     document.getElementById('resetDataBtn').addEventListener('click', () => {
         if (confirm('Are you sure you want to reset all data? This cannot be undone.')) {
             fetch('/reset_data', { method: 'POST' })
                 .then(response => response.json())
                 .then(data => {
                     if (data.success) {
-                        loadProducts();
                         loadBatch();
                         alert('Data reset successfully.');
                     } else {
@@ -312,7 +454,7 @@ window.editProduct = async function(id) {
         }
     });
 
-    // Initial load
+    // Initial load; the product table fills once the change feed is open
     loadBatch();
-    loadProducts();
+    watchProducts();
 });
\ No newline at end of file
@@ -0,0 +1,69 @@
+import base64
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py reads these when app is imported, so they are set first
+SCRATCH = tempfile.mkdtemp(prefix='catalog-tests-')
+DATABASE_PATH = os.path.join(SCRATCH, 'site.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE_PATH
+os.environ['ANALYSIS_CACHE_PATH'] = os.path.join(SCRATCH, 'analysis_cache.db')
+os.environ['IMAGE_STORE_FOLDER'] = os.path.join(SCRATCH, 'media')
+
+import app as catalog  # noqa: E402
+
+
+@pytest.fixture
+def app_module(monkeypatch, tmp_path):
+    """The app module on an empty database with one user, admin/admin."""
+    monkeypatch.setattr(catalog, 'BATCH_CONFIG_FILE', str(tmp_path / 'batch_config.json'))
+    catalog.app.config['TESTING'] = True
+    # A new file rather than drop_all, which would leave the FTS5 index behind
+    with catalog.app.app_context():
+        catalog.db.session.remove()
+        catalog.db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
+    with catalog.app.app_context():
+        catalog.db.create_all()
+        user = catalog.User(username='admin')
+        user.set_password('admin')
+        catalog.db.session.add(user)
+        catalog.db.session.commit()
+    if catalog.analysis_cache is not None:
+        catalog.analysis_cache.clear()
+    catalog.image_store.clear()
+    return catalog
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return client
+
+
+@pytest.fixture
+def app_context(app_module):
+    with app_module.app.app_context():
+        yield
+
+
+def png_bytes(seed=0, size=(64, 48)):
+    """A small PNG of random 8x8 blocks; different seeds give different images."""
+    import numpy as np
+    from PIL import Image
+    blocks = np.random.default_rng(seed).integers(0, 256, (size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    output = BytesIO()
+    Image.fromarray(blocks).resize(size, Image.NEAREST).save(output, 'PNG')
+    return output.getvalue()
+
+
+def png_data_url(seed=0):
+    return 'data:image/png;base64,' + base64.b64encode(png_bytes(seed)).decode('ascii')
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import asgi
+from tests.conftest import png_bytes
+from vlm_client import VLMUnavailable
+
+ANSWER = {'name': 'Chocolate Bar', 'brand': 'Milka', 'barcode': '4006381333931'}
+
+
+@pytest.fixture
+def vlm(app_module, monkeypatch):
+    """Stands in for DashScope on the asyncio side; the blocking side must not be used."""
+    calls = []
+
+    async def amultimodal(content, **params):
+        calls.append(content)
+        if isinstance(vlm.reply, Exception):
+            raise vlm.reply
+        return vlm.reply
+
+    def multimodal(content, **params):
+        pytest.fail('the async routes should not block on the VLM')
+
+    vlm.reply = json.dumps(ANSWER)
+    vlm.calls = calls
+    monkeypatch.setattr(asgi.vlm_client, 'amultimodal', amultimodal)
+    monkeypatch.setattr(asgi.vlm_client, 'multimodal', multimodal)
+    # No pyzbar here; the barcode reader is stubbed out
+    monkeypatch.setattr(asgi, 'detect_barcode', lambda image: None)
+    return vlm
+
+
+def run(requests):
+    """Log in, then run ``requests(client)`` against the ASGI app in-process."""
+    async def main():
+        transport = httpx.ASGITransport(app=asgi.api)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await client.post('/login', data={'username': 'admin', 'password': 'admin'})
+            return await requests(client)
+    return asyncio.run(main())
+
+
+def post_image(path, image=None, **options):
+    return lambda client: client.post(path, content=image or png_bytes(1),
+                                      headers={'content-type': 'image/png'}, **options)
+
+
+def test_analyze_full_awaits_the_vlm(vlm):
+    response = run(post_image('/analyze_full'))
+    assert response.status_code == 200
+    result = response.json()
+    assert {key: result[key] for key in ANSWER} == ANSWER
+    assert result['barcode_stage'] is None
+    assert len(vlm.calls) == 1
+
+
+def test_analyze_full_answers_repeats_from_the_cache(vlm):
+    async def twice(client):
+        await post_image('/analyze_full')(client)
+        return await post_image('/analyze_full')(client)
+    assert run(twice).json()['cache'] == 'hit'
+    assert len(vlm.calls) == 1
+
+
+def test_extract_product_name_awaits_the_vlm(vlm):
+    vlm.reply = 'Milka Alpine Milk Chocolate'
+    response = run(post_image('/extract_product_name'))
+    assert response.json() == {'product_name': 'Milka Alpine Milk Chocolate'}
+
+
+def test_extract_product_name_reports_an_unavailable_vlm(vlm):
+    vlm.reply = VLMUnavailable('VLM circuit open')
+    response = run(post_image('/extract_product_name'))
+    assert response.status_code == 503
+
+
+def test_async_routes_require_login(app_module):
+    async def anonymous(client):
+        client.cookies.clear()
+        return await post_image('/analyze_full')(client)
+    response = run(anonymous)
+    assert response.status_code == 302
+    assert response.headers['location'].startswith('/login')
+
+
+@pytest.fixture
+def small_uploads(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 1024)
+
+
+@pytest.mark.parametrize('path', ['/analyze_ai', '/analyze_full', '/extract_product_name', '/detect_barcode'])
+def test_declared_oversized_upload_is_refused(small_uploads, path):
+    response = run(post_image(path, b'\0' * 2048))
+    assert response.status_code == 413
+    assert response.json() == {'error': 'Upload too large'}
+
+
+def test_chunked_oversized_upload_is_refused(small_uploads):
+    async def chunks():
+        for _ in range(4):
+            yield b'\0' * 512
+
+    response = run(lambda client: client.post('/analyze_ai', content=chunks(),
+                                              headers={'content-type': 'image/png'}))
+    assert response.status_code == 413
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def sequence(app_module, app_context):
+    app_module.set_batch_sequence('A', 1)
+    app_module.db.session.commit()
+    return app_module
+
+
+def test_allocated_ids_are_consecutive(sequence):
+    assert sequence.allocate_product_ids(3) == ['A1', 'A2', 'A3']
+    assert sequence.allocate_product_ids() == ['A4']
+
+
+def test_advance_moves_past_explicit_ids(sequence):
+    sequence.advance_batch_sequence(['A7', 'A3'])
+    assert sequence.allocate_product_ids() == ['A8']
+
+
+def test_advance_never_moves_back(sequence):
+    sequence.allocate_product_ids(10)
+    sequence.advance_batch_sequence(['A2'])
+    assert sequence.allocate_product_ids() == ['A11']
+
+
+def test_advance_ignores_other_prefixes(sequence):
+    sequence.advance_batch_sequence(['B40', 'A12x', 'legacy-7'])
+    assert sequence.allocate_product_ids() == ['A1']
+
+
+def test_add_product_moves_the_sequence_past_an_explicit_id(sequence, client):
+    product = {'name': 'Soap', 'barcode': '1', 'price': 1, 'quantity': 1}
+    assert client.post('/add_product', json=dict(product, product_id='A5')).get_json()['product_id'] == 'A5'
+    assert client.post('/add_product', json=product).get_json()['product_id'] == 'A6'
+
+
+def test_add_product_rejects_an_id_in_use(sequence, client):
+    product = {'name': 'Soap', 'barcode': '1', 'price': 1, 'quantity': 1, 'product_id': 'A5'}
+    client.post('/add_product', json=product)
+    response = client.post('/add_product', json=product)
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Product ID already in use'
@@ -0,0 +1,56 @@
+import base64
+import os
+
+import pytest
+
+from tests.conftest import png_data_url
+
+PRODUCT = {'name': 'Soap', 'barcode': '1', 'price': 1, 'quantity': 1}
+
+
+@pytest.fixture
+def bulk(app_module, client):
+    with app_module.app.app_context():
+        app_module.set_batch_sequence('A', 1)
+        app_module.db.session.commit()
+
+    def send(items):
+        response = client.post('/bulk_add_products', json=items)
+        assert response.status_code == 200, response.get_json()
+        return [result.get('product_id') or result['error'] for result in response.get_json()['results']]
+    return send
+
+
+def stored_files(app_module):
+    root = app_module.image_store.root
+    return [name for _, _, names in os.walk(root) for name in names] if os.path.exists(root) else []
+
+
+def test_allocated_ids_skip_explicit_ones(bulk):
+    assert bulk([PRODUCT, dict(PRODUCT, product_id='A2'), PRODUCT, PRODUCT]) == ['A3', 'A2', 'A4', 'A5']
+    assert bulk([PRODUCT]) == ['A6']
+
+
+def test_taken_id_fails_only_its_item(bulk):
+    bulk([dict(PRODUCT, product_id='A7')])
+    assert bulk([PRODUCT, dict(PRODUCT, product_id='A7'), PRODUCT]) == ['A8', 'Product ID already in use', 'A9']
+
+
+@pytest.mark.parametrize('item, error', [
+    (dict(PRODUCT, price='bad'), 'price: not a number'),
+    (dict(PRODUCT, price=[1]), 'price: not a number'),
+    (dict(PRODUCT, quantity='2.5'), 'quantity: not a whole number'),
+    (dict(PRODUCT, quantity=None), 'Missing quantity'),
+    (dict(PRODUCT, timestamp='yesterday'), 'timestamp: not an ISO 8601 date'),
+    (dict(PRODUCT, images='photo.png'), 'images: not a list'),
+    (dict(PRODUCT, images=['no comma']), 'images: image 1 is not a base64 data URL'),
+    (7, 'Expected a JSON object'),
+])
+def test_field_errors_name_the_field(bulk, item, error):
+    assert bulk([item]) == [error]
+
+
+def test_images_stored_before_a_failure_are_released(app_module, bulk):
+    broken = 'data:image/png;base64,' + base64.b64encode(b'not an image').decode('ascii')
+    assert bulk([dict(PRODUCT, images=[png_data_url(1), broken])]) == ['images: image 2 could not be processed']
+    assert stored_files(app_module) == []
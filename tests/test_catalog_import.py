@@ -0,0 +1,80 @@
+from io import BytesIO
+
+import pytest
+
+from catalog_reader import parse_price
+
+
+@pytest.mark.parametrize('text, price', [
+    ('12.50', 12.5),
+    ('12,50', 12.5),
+    ('1,5', 1.5),
+    ('$1,234.56', 1234.56),
+    ('€ 1.234,56', 1234.56),
+    ('1 234,56 €', 1234.56),
+    ('1,234,567', 1234567.0),
+    ('1.234.567', 1234567.0),
+    ('1,500.00', 1500.0),
+    ('1.500,00', 1500.0),
+    ('0,500', 0.5),
+    ('0.500', 0.5),
+    ('1234.500', 1234.5),
+    ('-3', -3.0),
+])
+def test_parse_price(text, price):
+    assert parse_price(text) == pytest.approx(price)
+
+
+@pytest.mark.parametrize('text', ['1,500', '1.500', '12,500', '12.500', '-1.500'])
+def test_one_separator_before_three_digits_is_ambiguous(text):
+    assert parse_price(text) == 'ambiguous'
+
+
+@pytest.mark.parametrize('text', ['', 'abc', '1,2,3', '1.2.3', '--1'])
+def test_not_a_price(text):
+    assert parse_price(text) is None
+
+
+def import_csv(app_module, text, key=None):
+    with app_module.app.app_context():
+        return app_module.import_catalog(BytesIO(text.encode('utf-8')), 'prices.csv', key)
+
+
+def products(app_module):
+    with app_module.app.app_context():
+        return {product.id: (product.name, product.price)
+                for product in app_module.Product.query.order_by(app_module.Product.id)}
+
+
+@pytest.fixture
+def catalog(app_module):
+    with app_module.app.app_context():
+        app_module.set_batch_sequence('A', 1)
+        app_module.db.session.commit()
+    return app_module
+
+
+def test_decimal_comma_prices_are_not_scaled(catalog):
+    summary = import_csv(catalog, 'id,name,barcode,price,quantity\nX1,Soap,111,"1,50",1\nX2,Milk,222,"€ 1.234,56",1\n')
+    assert summary['inserted'] == 2
+    assert products(catalog) == {'X1': ('Soap', 1.5), 'X2': ('Milk', 1234.56)}
+
+
+def test_ambiguous_prices_are_rejected(catalog):
+    summary = import_csv(catalog, 'id,name,barcode,price,quantity\nX1,Soap,111,"1,500",1\nX2,Milk,222,1.500,1\n')
+    assert summary['inserted'] == 0
+    assert [row['row'] for row in summary['rejected_rows']] == [2, 3]
+    assert all(row['error'].startswith('Ambiguous price') for row in summary['rejected_rows'])
+
+
+def test_blank_ids_get_new_ids_after_explicit_ones(catalog):
+    summary = import_csv(catalog, 'id,name,barcode,price,quantity\n,Soap,111,1,1\nA4,Milk,222,2,1\n,Tea,333,3,1\n')
+    assert (summary['inserted'], summary['rejected']) == (3, 0)
+    assert products(catalog) == {'A4': ('Milk', 2.0), 'A5': ('Soap', 1.0), 'A6': ('Tea', 3.0)}
+
+
+def test_rows_matched_on_id_are_updated(catalog):
+    import_csv(catalog, 'id,name,barcode,price,quantity\nX1,Soap,111,1,1\n')
+    summary = import_csv(catalog, 'id,name,price\nX1,Soap bar,"2,25"\n')
+    assert (summary['inserted'], summary['updated']) == (0, 1)
+    assert products(catalog) == {'X1': ('Soap bar', 2.25)}
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from image_cache import BANDS, AnalysisCache, bands
+
+PHASH = 0x0123456789ABCDEF
+ANSWER = {'name': 'Choc', 'brand': 'Stubco', 'barcode': '4006381333931', 'object_count': 3}
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(str(tmp_path / 'cache.db'))
+
+
+def reopened(cache):
+    """A second cache on the same file, with nothing in memory, so lookups go to SQLite."""
+    return AnalysisCache(cache.path, hamming_threshold=cache.hamming_threshold)
+
+
+def test_bands_split_the_hash_into_16_bit_parts():
+    assert bands(PHASH) == [0xCDEF, 0x89AB, 0x4567, 0x0123]
+
+
+def test_exact_hit(cache):
+    cache.store('analyze_ai', 'digest', PHASH, ANSWER)
+    assert reopened(cache).lookup('analyze_ai', 'digest', PHASH) == (ANSWER, 'exact')
+
+
+def test_similar_hit_with_a_bit_flipped_in_each_of_three_bands(cache):
+    cache.store('analyze_ai', 'a', PHASH, ANSWER)
+    assert reopened(cache).lookup('analyze_ai', 'b', flip(PHASH, 0, 20, 40)) == (ANSWER, 'similar')
+
+
+def test_no_hit_beyond_the_threshold(cache):
+    cache.store('analyze_ai', 'a', PHASH, ANSWER)
+    assert reopened(cache).lookup('analyze_ai', 'b', flip(PHASH, 0, 20, 40, 60)) is None
+
+
+def test_nearest_similar_entry_wins(cache):
+    cache.store('analyze_ai', 'far', flip(PHASH, 1, 2), dict(ANSWER, name='far'))
+    cache.store('analyze_ai', 'near', flip(PHASH, 3), dict(ANSWER, name='near'))
+    result, match = reopened(cache).lookup('analyze_ai', 'new', PHASH)
+    assert (result['name'], match) == ('near', 'similar')
+
+
+def test_namespaces_are_separate(cache):
+    cache.store('analyze_ai', 'digest', PHASH, ANSWER)
+    assert reopened(cache).lookup('analyze_full', 'digest', PHASH) is None
+
+
+def test_threshold_must_leave_a_band_intact(tmp_path):
+    with pytest.raises(ValueError):
+        AnalysisCache(str(tmp_path / 'cache.db'), hamming_threshold=BANDS)
+
+
+def test_similar_hit_keeps_object_count_but_not_barcode(app_module):
+    frame = np.random.default_rng(1).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    app_module.cached_analysis('analyze_ai', b'first upload', frame, lambda: dict(ANSWER))
+
+    result = app_module.cached_analysis('analyze_ai', b'second upload', frame,
+                                        lambda: pytest.fail('the VLM should not be called'))
+    assert (result['cache'], result['cache_match']) == ('hit', 'similar')
+    assert result['object_count'] == 3
+    assert 'barcode' not in result
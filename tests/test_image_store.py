@@ -0,0 +1,65 @@
+import os
+
+from tests.conftest import png_bytes, png_data_url
+
+
+def add_product(client, name, images):
+    response = client.post('/add_product', json={
+        'name': name, 'barcode': '1', 'price': 1, 'quantity': 1, 'images': images
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['product_id']
+
+
+def images_of(app_module, product_id):
+    with app_module.app.app_context():
+        return app_module.db.session.get(app_module.Product, product_id).images
+
+
+def refcount(app_module, reference):
+    with app_module.app.app_context():
+        blob = app_module.db.session.get(app_module.ImageBlob, reference)
+        return blob.refcount if blob else None
+
+
+def blob_exists(app_module, reference):
+    return os.path.exists(app_module.image_store.blob_path(app_module.image_store.digest_of(reference)))
+
+
+def test_same_upload_is_stored_once(app_module):
+    store = app_module.image_store
+    assert store.put(png_bytes(1)) == store.put(png_bytes(1))
+
+
+def test_blob_is_kept_until_the_last_product_lets_go(app_module, client):
+    first = add_product(client, 'First', [png_data_url(1)])
+    second = add_product(client, 'Second', [png_data_url(1)])
+    [reference] = images_of(app_module, first)
+    assert images_of(app_module, second) == [reference]
+    assert refcount(app_module, reference) == 2
+
+    client.delete(f'/delete_product/{first}')
+    assert blob_exists(app_module, reference)
+    assert refcount(app_module, reference) == 1
+
+    client.delete(f'/delete_product/{second}')
+    assert not blob_exists(app_module, reference)
+    assert refcount(app_module, reference) is None
+
+
+def test_update_releases_dropped_images(app_module, client):
+    product_id = add_product(client, 'Soap', [png_data_url(1), png_data_url(2)])
+    kept, dropped = images_of(app_module, product_id)
+
+    response = client.post(f'/update_product/{product_id}', json={
+        'name': 'Soap', 'barcode': '1', 'price': 1, 'quantity': 1, 'keep_images': [kept]
+    })
+    assert response.get_json()['success']
+    assert blob_exists(app_module, kept)
+    assert not blob_exists(app_module, dropped)
+
+
+def test_release_removes_blobs_no_product_committed(app_module, app_context):
+    reference = app_module.image_store.put(png_bytes(3))
+    app_module.release_images([reference])
+    assert not blob_exists(app_module, reference)
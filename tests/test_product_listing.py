@@ -0,0 +1,54 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+
+def add_products(app_module, ids, timestamp):
+    for product_id in ids:
+        app_module.db.session.add(app_module.Product(
+            id=product_id, name=f'Product {product_id}', barcode='1', price=1.0, quantity=1,
+            images_json='[]', timestamp=timestamp
+        ))
+    app_module.db.session.commit()
+
+
+def test_cursor_round_trip(app_module):
+    stamp = datetime(2026, 10, 17, 9, 30, 15, 123456)
+    cursor = app_module.encode_cursor(stamp, 'A17')
+    assert '=' not in cursor
+    assert app_module.decode_cursor(cursor) == (stamp, 'A17')
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not a cursor',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", "A1"]').decode(),
+])
+def test_invalid_cursor(app_module, cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        app_module.decode_cursor(cursor)
+
+
+def test_pages_cover_equal_timestamps_once(app_module, app_context, client):
+    ids = [f'A{index}' for index in range(1, 8)]
+    add_products(app_module, ids, datetime(2026, 10, 17, 9, 0))
+
+    seen, cursor = [], None
+    while True:
+        query = {'limit': 3, 'fields': 'id'}
+        if cursor:
+            query['cursor'] = cursor
+        page = client.get('/api/products', query_string=query).get_json()
+        seen += [item['id'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(ids)
+
+
+def test_bad_cursor_is_a_400(client):
+    response = client.get('/api/products', query_string={'cursor': 'nonsense'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def catalog(app_module, app_context):
+    for product_id, name, brand, barcode in (
+        ('A1', 'Chocolate Bar', 'Milka', '4006381333931'),
+        ('A2', 'Oat Milk', 'Oatly', '7394376616228'),
+        ('A3', 'Dark Chocolate', 'Lindt', '3046920022606'),
+    ):
+        app_module.db.session.add(app_module.Product(
+            id=product_id, name=name, brand=brand, barcode=barcode, price=1.0, quantity=1,
+            images_json='[]', timestamp=datetime(2026, 10, 17)
+        ))
+    app_module.db.session.commit()
+    return app_module
+
+
+def search(client, query, **args):
+    response = client.get('/search', query_string=dict(args, q=query, fields='id,name'))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def found(client, query, **args):
+    return sorted(item['id'] for item in search(client, query, **args)['items'])
+
+
+def test_substring_matches(catalog, client):
+    assert found(client, 'chocol') == ['A1', 'A3']
+    assert found(client, 'oatly') == ['A2']
+
+
+def test_barcode_is_looked_up_exactly(catalog, client):
+    result = search(client, '4006381333931')
+    assert result['mode'] == 'barcode'
+    assert [item['id'] for item in result['items']] == ['A1']
+
+
+def test_fuzzy_fallback_tolerates_typos(catalog, client):
+    result = search(client, 'chocolatte')
+    assert result['mode'] == 'fuzzy'
+    assert {item['id'] for item in result['items']} >= {'A1', 'A3'}
+
+
+def test_index_follows_renames_deletes_and_id_changes(catalog, client):
+    db = catalog.db
+    catalog.db.session.get(catalog.Product, 'A2').name = 'Barista Edition'
+    db.session.delete(db.session.get(catalog.Product, 'A3'))
+    db.session.execute(text("UPDATE product SET id = 'B1' WHERE id = 'A1'"))
+    db.session.commit()
+
+    assert found(client, 'barista') == ['A2']
+    assert found(client, 'oat milk', fuzzy='0') == []
+    assert found(client, 'chocolate') == ['B1']
+
+
+def test_index_survives_vacuum(catalog, client):
+    db = catalog.db
+    db.session.delete(db.session.get(catalog.Product, 'A1'))
+    db.session.commit()
+    with db.engine.connect() as connection:
+        connection.execute(text('VACUUM'))
+    assert found(client, 'chocolate') == ['A3']
+    assert found(client, 'milk', fuzzy='0') == ['A2']
+
+
+def test_invalid_offset_is_a_400(catalog, client):
+    response = client.get('/search', query_string={'q': 'milk', 'offset': 'x'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid offset'}
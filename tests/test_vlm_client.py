@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import vlm_client
+from vlm_client import CircuitBreaker, VLMClient, VLMError, VLMUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(vlm_client.time, 'monotonic', clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_released_trial_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+def make_client(**options):
+    options = dict(dict(max_retries=1, backoff_base=0, breaker_threshold=1), **options)
+    return VLMClient('key', 'http://vlm.invalid', **options)
+
+
+def test_transient_failures_are_retried_then_open_the_circuit(clock):
+    client = make_client()
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(VLMUnavailable):
+        client._call(attempt)
+    assert len(calls) == 2
+    with pytest.raises(VLMUnavailable, match='circuit open'):
+        client._call(attempt)
+    assert len(calls) == 2
+
+
+def test_client_errors_are_not_retried_and_leave_the_circuit_closed(clock):
+    client = make_client()
+    error = VLMError('bad request')
+    error.status_code = 400
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise error
+
+    with pytest.raises(VLMError):
+        client._call(attempt)
+    assert len(calls) == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
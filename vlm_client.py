@@ -0,0 +1,357 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from http import HTTPStatus
+
+# Upstream statuses worth another attempt; anything else 4xx is our fault
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+# The SDKs take over a second to import between them, so each is imported
+# when the first call needs it rather than when the app starts
+CLIENT_MODULES = ('openai', 'dashscope', 'httpx', 'requests', 'aiohttp')
+
+
+def connection_errors():
+    """Connection error types of the client libraries imported so far.
+
+    A library that was never imported cannot have raised, so there is no
+    reason to import one just to check.
+    """
+    errors = [asyncio.TimeoutError]
+    if 'openai' in sys.modules:
+        errors.append(sys.modules['openai'].APIConnectionError)
+    if 'requests' in sys.modules:
+        errors.extend((sys.modules['requests'].ConnectionError, sys.modules['requests'].Timeout))
+    if 'aiohttp' in sys.modules:
+        errors.append(sys.modules['aiohttp'].ClientConnectionError)
+    return tuple(errors)
+
+
+class VLMError(Exception):
+    pass
+
+
+class VLMUnavailable(VLMError):
+    """The upstream is down, saturated or shedding load; callers should degrade."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and fails fast
+    for ``reset_timeout`` seconds, then lets a single trial call through."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == self.OPEN:
+                return False
+            if state == self.HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """Give back a half-open trial slot that ended without reaching the upstream."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return self.CLOSED
+        if now - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+
+class VLMClient:
+    """Shared access to qwen-vl through both the OpenAI-compatible and the
+    native DashScope endpoints.
+
+    Connections are pooled and kept alive across requests; every attempt has
+    connect/read timeouts, at most ``max_concurrency`` calls are in flight,
+    transient failures are retried with jittered exponential backoff, and a
+    circuit breaker fails fast while the upstream is unhealthy. Each attempt
+    goes through ``transport`` (see vlm_transport.py), which can record
+    replies or replay them instead of calling the upstream.
+
+    ``achat``/``amultimodal`` are the asyncio versions for the ASGI app. They
+    share the breaker and stats but have their own connection pools and
+    allow ``async_max_concurrency`` calls in flight, since a waiting
+    coroutine costs far less than a waiting thread.
+    """
+
+    def __init__(self, api_key, base_url, model='qwen-vl-max', connect_timeout=5, read_timeout=60,
+                 max_concurrency=8, queue_timeout=10, max_retries=2, backoff_base=0.5, backoff_max=8,
+                 breaker_threshold=5, breaker_reset=30, transport=None, async_max_concurrency=64,
+                 dashscope_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.dashscope_url = dashscope_url
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.transport = transport
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.async_max_concurrency = async_max_concurrency
+        self._async_slots = None
+        self._openai = None
+        self._async_openai = None
+        self._session = None
+        self._aio_session = None
+        self._lock = threading.Lock()
+
+    def chat(self, content, **params):
+        """Send one user message through the OpenAI-compatible endpoint; return the reply text."""
+        def attempt():
+            completion = self._openai_client().chat.completions.create(
+                model=self.model,
+                messages=[{'role': 'user', 'content': content}],
+                **params
+            )
+            return completion.choices[0].message.content
+        return self._call(self._via_transport('chat', content, params, attempt))
+
+    def multimodal(self, content, **params):
+        """Send one user message through DashScope's MultiModalConversation; return the reply text."""
+        def attempt():
+            import dashscope
+            response = dashscope.MultiModalConversation.call(
+                model=self.model,
+                messages=[{'role': 'user', 'content': content}],
+                api_key=self.api_key,
+                base_address=self.dashscope_url,
+                request_timeout=(self.connect_timeout, self.read_timeout),
+                session=self._requests_session(),
+                **params
+            )
+            if response.status_code != HTTPStatus.OK:
+                error = VLMError(f'DashScope API error: {response.code} - {response.message}')
+                error.status_code = response.status_code
+                raise error
+            return response.output.choices[0].message.content[0]['text']
+        return self._call(self._via_transport('multimodal', content, params, attempt))
+
+    async def achat(self, content, **params):
+        async def attempt():
+            completion = await self._async_openai_client().chat.completions.create(
+                model=self.model,
+                messages=[{'role': 'user', 'content': content}],
+                **params
+            )
+            return completion.choices[0].message.content
+        return await self._acall(self._via_transport('chat', content, params, attempt, run_async=True))
+
+    async def amultimodal(self, content, **params):
+        async def attempt():
+            import dashscope
+            response = await dashscope.AioMultiModalConversation.call(
+                model=self.model,
+                messages=[{'role': 'user', 'content': content}],
+                api_key=self.api_key,
+                base_address=self.dashscope_url,
+                # The aiohttp path takes a single total timeout
+                request_timeout=self.connect_timeout + self.read_timeout,
+                session=self._aiohttp_session(),
+                **params
+            )
+            if response.status_code != HTTPStatus.OK:
+                error = VLMError(f'DashScope API error: {response.code} - {response.message}')
+                error.status_code = response.status_code
+                raise error
+            return response.output.choices[0].message.content[0]['text']
+        return await self._acall(self._via_transport('multimodal', content, params, attempt, run_async=True))
+
+    async def aclose(self):
+        if self._async_openai is not None:
+            await self._async_openai.close()
+            self._async_openai = None
+        if self._aio_session is not None:
+            await self._aio_session.close()
+            self._aio_session = None
+
+    def close(self):
+        with self._lock:
+            if self._openai is not None:
+                self._openai.close()
+                self._openai = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _via_transport(self, api, content, params, attempt, run_async=False):
+        if self.transport is None:
+            return attempt
+        request = {'api': api, 'model': self.model, 'content': content, 'params': params}
+        if run_async:
+            return lambda: self.transport.asend(request, attempt)
+        return lambda: self.transport.send(request, attempt)
+
+    def _call(self, attempt):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise VLMUnavailable('VLM circuit open')
+        for retry in range(self.max_retries + 1):
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                # Saturation is not the upstream's fault, so the breaker is left alone
+                self.breaker.release_trial()
+                self._count('rejected')
+                raise VLMUnavailable('VLM concurrency limit reached')
+            try:
+                self._count('calls')
+                result = attempt()
+            except Exception as e:
+                if not self._retryable(e):
+                    # The upstream answered, so it counts as healthy
+                    self.breaker.record_success()
+                    raise e if isinstance(e, VLMError) else VLMError(str(e))
+                last_error = e
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self._slots.release()
+            if retry < self.max_retries:
+                self._count('retries')
+                # Full jitter keeps retries from many workers from arriving together
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry)))
+        self._count('failures')
+        self.breaker.record_failure()
+        raise VLMUnavailable(f'VLM request failed: {last_error}')
+
+    async def _acall(self, attempt):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise VLMUnavailable('VLM circuit open')
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.async_max_concurrency)
+        for retry in range(self.max_retries + 1):
+            try:
+                await asyncio.wait_for(self._async_slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.breaker.release_trial()
+                self._count('rejected')
+                raise VLMUnavailable('VLM concurrency limit reached')
+            try:
+                self._count('calls')
+                result = await attempt()
+            except Exception as e:
+                if not self._retryable(e):
+                    self.breaker.record_success()
+                    raise e if isinstance(e, VLMError) else VLMError(str(e))
+                last_error = e
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self._async_slots.release()
+            if retry < self.max_retries:
+                self._count('retries')
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry)))
+        self._count('failures')
+        self.breaker.record_failure()
+        raise VLMUnavailable(f'VLM request failed: {last_error}')
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _retryable(self, error):
+        if isinstance(error, connection_errors()):
+            return True
+        status = getattr(error, 'status_code', None)
+        return status in RETRYABLE_STATUSES or (status is not None and status >= 500)
+
+    def _openai_client(self):
+        with self._lock:
+            if self._openai is None:
+                # Built lazily so the app can start without an API key
+                import httpx
+                from openai import OpenAI
+                self._openai = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    max_retries=0,
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                    http_client=httpx.Client(limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                        keepalive_expiry=60
+                    ))
+                )
+            return self._openai
+
+    def _async_openai_client(self):
+        # Only touched from the event loop thread, so no lock
+        if self._async_openai is None:
+            import httpx
+            from openai import AsyncOpenAI
+            self._async_openai = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=self.async_max_concurrency,
+                    max_keepalive_connections=self.async_max_concurrency,
+                    keepalive_expiry=60
+                ))
+            )
+        return self._async_openai
+
+    def _aiohttp_session(self):
+        if self._aio_session is None:
+            import aiohttp
+            self._aio_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.async_max_concurrency, keepalive_timeout=60)
+            )
+        return self._aio_session
+
+    def _requests_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                self._session.mount('https://', adapter)
+                self._session.mount('http://', adapter)
+            return self._session
@@ -0,0 +1,84 @@
+import cv2
+
+ENCODINGS = {
+    'JPEG': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'WEBP': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def product_region(image, work_edge=512, margin=0.05, min_fraction=0.2, max_fraction=0.9):
+    """Bounding box (x, y, w, h) of the edge-dense foreground, or None.
+
+    The product is assumed to be the textured part of the frame against a
+    plainer background; boxes that are tiny or nearly the whole frame are
+    not trusted and give None.
+    """
+    height, width = image.shape[:2]
+    scale = min(work_edge / float(max(height, width)), 1.0)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)), iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = 0.01 * small.shape[0] * small.shape[1]
+    boxes = [cv2.boundingRect(contour) for contour in contours if cv2.contourArea(contour) >= min_area]
+    if not boxes:
+        return None
+    x0 = min(x for x, _, _, _ in boxes)
+    y0 = min(y for _, y, _, _ in boxes)
+    x1 = max(x + w for x, _, w, _ in boxes)
+    y1 = max(y + h for _, y, _, h in boxes)
+    fraction = (x1 - x0) * (y1 - y0) / float(small.shape[0] * small.shape[1])
+    if not min_fraction <= fraction <= max_fraction:
+        return None
+    pad_x, pad_y = int((x1 - x0) * margin), int((y1 - y0) * margin)
+    x0 = max(int((x0 - pad_x) / scale), 0)
+    y0 = max(int((y0 - pad_y) / scale), 0)
+    x1 = min(int((x1 + pad_x) / scale), width)
+    y1 = min(int((y1 + pad_y) / scale), height)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class VLMImagePreprocessor:
+    """Shrink and re-encode frames before they are sent to the VLM.
+
+    Images are cropped to the product (when ``crop`` is on), downscaled so
+    the long edge is at most ``max_edge`` and re-encoded as JPEG or WebP.
+    If that comes out no smaller than an original that needed no resizing,
+    the original bytes are sent instead.
+    """
+
+    def __init__(self, max_edge=1280, image_format='JPEG', quality=85, crop=False):
+        self.max_edge = max_edge
+        self.image_format = image_format.upper()
+        self.extension, self.quality_flag = ENCODINGS[self.image_format]
+        self.quality = quality
+        self.crop = crop
+
+    def process(self, image_data, image):
+        """Return ``(bytes, info)`` for the decoded ``image`` of ``image_data``."""
+        height, width = image.shape[:2]
+        info = {'original_bytes': len(image_data), 'original_size': [width, height], 'cropped': False}
+
+        if self.crop:
+            region = product_region(image)
+            if region is not None:
+                x, y, w, h = region
+                image = image[y:y + h, x:x + w]
+                info['cropped'] = True
+
+        height, width = image.shape[:2]
+        scale = self.max_edge / float(max(height, width))
+        if scale < 1:
+            width, height = int(width * scale), int(height * scale)
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode(self.extension, image, [self.quality_flag, self.quality])
+        if not ok:
+            raise ValueError(f'Could not encode image as {self.image_format}')
+        output = encoded.tobytes()
+        if scale >= 1 and not info['cropped'] and len(output) >= len(image_data):
+            output = image_data
+        info['sent_bytes'] = len(output)
+        info['sent_size'] = [width, height]
+        return output, info
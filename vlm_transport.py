@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from vlm_client import VLMError
+
+MODES = ('passthrough', 'record', 'replay')
+
+
+class ReplayMiss(VLMError):
+    """Replay mode was asked for a request that is not in the recording."""
+
+
+def fingerprint(request):
+    """Stable hash of an upstream request: endpoint, model, message content and parameters.
+
+    Images are inlined as data URLs, so the same preprocessed frame always
+    gives the same fingerprint.
+    """
+    canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def describe(content):
+    """The prompt text and image count of a message, kept in the recording for readability."""
+    texts, images = [], 0
+    for part in content if isinstance(content, list) else [content]:
+        if isinstance(part, str):
+            texts.append(part)
+        elif part.get('type') == 'image_url' or 'image' in part:
+            images += 1
+        elif 'text' in part:
+            texts.append(part['text'])
+    return ' '.join(texts)[:200], images
+
+
+class PassthroughTransport:
+    """Every attempt goes to the upstream."""
+
+    def send(self, request, live):
+        return live()
+
+    async def asend(self, request, live):
+        return await live()
+
+
+class RecordingTransport:
+    """Goes to the upstream and appends each successful reply to a JSONL file.
+
+    Only attempts that returned are recorded; failed attempts are retried
+    by the client as usual and leave no trace.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def send(self, request, live):
+        started = time.perf_counter()
+        reply = live()
+        self._record(request, reply, started)
+        return reply
+
+    async def asend(self, request, live):
+        started = time.perf_counter()
+        reply = await live()
+        self._record(request, reply, started)
+        return reply
+
+    def _record(self, request, reply, started):
+        prompt, images = describe(request['content'])
+        entry = {
+            'fingerprint': fingerprint(request),
+            'api': request['api'],
+            'model': request['model'],
+            'prompt': prompt,
+            'images': images,
+            'reply': reply,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class ReplayTransport:
+    """Answers from a recording made by RecordingTransport, without network access.
+
+    Requests recorded more than once get their replies in recorded order,
+    wrapping around. With ``simulate_latency`` each reply waits for its
+    recorded latency times ``latency_scale``. A request missing from the
+    recording raises ReplayMiss, or goes upstream when ``on_miss`` is 'live'.
+    """
+
+    def __init__(self, path, simulate_latency=False, latency_scale=1.0, on_miss='error'):
+        self.path = path
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['fingerprint'], deque()).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def send(self, request, live):
+        entry = self._next(request)
+        if entry is None:
+            return live()
+        if self.simulate_latency:
+            time.sleep(entry['latency_ms'] * self.latency_scale / 1000.0)
+        return entry['reply']
+
+    async def asend(self, request, live):
+        entry = self._next(request)
+        if entry is None:
+            return await live()
+        if self.simulate_latency:
+            await asyncio.sleep(entry['latency_ms'] * self.latency_scale / 1000.0)
+        return entry['reply']
+
+    def _next(self, request):
+        """The next recorded entry for ``request``; None means go upstream."""
+        key = fingerprint(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                entry = entries[0]
+                entries.rotate(-1)
+                self.stats['hits'] += 1
+            else:
+                entry = None
+                self.stats['misses'] += 1
+        if entry is None and self.on_miss != 'live':
+            raise ReplayMiss(f'No recorded {request["api"]} response for request {key[:12]}')
+        return entry
+
+
+def make_transport(mode, path, simulate_latency=False, latency_scale=1.0, on_miss='error'):
+    if mode == 'passthrough':
+        return PassthroughTransport()
+    if mode == 'record':
+        return RecordingTransport(path)
+    if mode == 'replay':
+        return ReplayTransport(path, simulate_latency, latency_scale, on_miss)
+    raise ValueError(f'Unknown VLM transport {mode!r}; expected one of {", ".join(MODES)}')